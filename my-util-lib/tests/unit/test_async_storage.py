@@ -0,0 +1,165 @@
+import io
+import asyncio
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from utilities.asyncCloudflareStorage import SyncStorage
+from utilities.storagebase import BatchResult
+
+
+class FakeAsyncStorage:
+    """Async storage that records how many calls overlap."""
+
+    def __init__(self):
+        self.bucket = "bucket"
+        self.objects = {}
+        self.in_flight = 0
+        self.peak = 0
+        self.pages_fetched = 0
+
+    async def get(self, key):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        if key not in self.objects:
+            return False
+        return {'Body': io.BytesIO(self.objects[key])}
+
+    async def put(self, key, body=None, contenttype=None, **kwargs):
+        self.objects[key] = body.encode('utf-8') if isinstance(body, str) else body
+        return True
+
+    async def get_many(self, keys):
+        values = await asyncio.gather(*[self.get(key) for key in keys])
+        return [BatchResult(key, value, None) for key, value in zip(keys, values)]
+
+    async def put_many(self, items, contenttype=None, **kwargs):
+        values = await asyncio.gather(*[self.put(key, body, contenttype, **kwargs) for key, body in items])
+        return [BatchResult(key, value, None) for (key, _), value in zip(items, values)]
+
+    async def iter_pages(self, prefix, page_size=1000):
+        keys = [key for key in sorted(self.objects) if key.startswith(prefix)]
+        for start in range(0, len(keys), page_size):
+            self.pages_fetched += 1
+            yield [{'Key': key} for key in keys[start:start + page_size]]
+
+
+@pytest.fixture
+def facade():
+    storage = SyncStorage(FakeAsyncStorage())
+    yield storage
+    storage.close()
+
+
+def test_sync_calls_run_on_the_loop(facade):
+    """
+    Tests that blocking calls return the coroutine's result.
+    """
+    assert facade.put('users/1/a.lss', '{"a": 1}') is True
+    assert facade.get('users/1/a.lss')['Body'].read() == b'{"a": 1}'
+    assert facade.get('missing') is False
+    assert facade.bucket == "bucket"
+
+def test_get_many_fans_out_concurrently(facade):
+    """
+    Tests that get_many keeps every request in flight at once and preserves input order.
+    """
+    keys = [f"users/1/projects/{i}/metadata.json" for i in range(20)]
+    facade.put_many([(key, str(i)) for i, key in enumerate(keys)])
+
+    responses = facade.get_many(keys)
+
+    assert [result.key for result in responses] == keys
+    assert [result.value['Body'].read() for result in responses] == [str(i).encode() for i in range(20)]
+    assert facade.async_storage.peak == 20
+
+def test_list_files_strips_extension(facade):
+    """
+    Tests that list_files behaves like the blocking backend.
+    """
+    facade.put('users/1/scripts/One.lss', '[]')
+    facade.put('users/1/scripts/notes.txt', '')
+
+    assert facade.list_files('users/1/scripts/', '.lss') == ['One']
+    assert facade.list_files('users/1/scripts/') == ['users/1/scripts/One.lss', 'users/1/scripts/notes.txt']
+
+def test_iter_objects_fetches_pages_as_they_are_consumed(facade):
+    """
+    Tests that a listing is streamed page by page instead of collected whole.
+    """
+    for i in range(5):
+        facade.put(f'users/1/scripts/{i}.lss', '{}')
+
+    objects = facade.iter_objects('users/1/scripts/', page_size=2)
+
+    assert next(objects)['Key'] == 'users/1/scripts/0.lss'
+    assert facade.async_storage.pages_fetched == 1
+    assert [item['Key'] for item in objects] == [f'users/1/scripts/{i}.lss' for i in range(1, 5)]
+    assert facade.async_storage.pages_fetched == 3
+
+
+# --- aiobotocore backend ---
+
+def make_async_cloudflare(client):
+    pytest.importorskip("aiobotocore")
+    from utilities.asyncCloudflareStorage import AsyncCloudflare
+    storage = AsyncCloudflare("account", "key-id", "secret", "bucket", max_concurrency=2)
+    storage._client = client
+    storage._semaphore = asyncio.Semaphore(2)
+    return storage
+
+def test_async_get_reads_body_inside_loop():
+    """
+    Tests that get returns a sync-readable body.
+    """
+    body = MagicMock()
+    body.__aenter__ = AsyncMock(return_value=MagicMock(read=AsyncMock(return_value=b'{}')))
+    body.__aexit__ = AsyncMock(return_value=False)
+    client = MagicMock()
+    client.get_object = AsyncMock(return_value={'Body': body, 'ETag': '"1"'})
+    storage = make_async_cloudflare(client)
+
+    response = asyncio.run(storage.get('key'))
+
+    assert response['Body'].read() == b'{}'
+    assert response['ETag'] == '"1"'
+    client.get_object.assert_awaited_once_with(Key='key', Bucket='bucket')
+
+def test_async_delete_many_reports_failures():
+    """
+    Tests that delete_many batches keys and reports per-key failures.
+    """
+    client = MagicMock()
+    client.delete_objects = AsyncMock(return_value={'Errors': [{'Key': 'b', 'Code': 'AccessDenied', 'Message': 'no'}]})
+    storage = make_async_cloudflare(client)
+
+    assert asyncio.run(storage.delete_many(['a', 'b'])) == {'b': 'AccessDenied: no'}
+
+def test_multipart_parts_in_flight_are_bounded(monkeypatch):
+    """
+    Tests that a streamed upload keeps at most multipart_concurrency parts in memory.
+    """
+    import utilities.asyncCloudflareStorage as module
+    monkeypatch.setattr(module, 'MULTIPART_THRESHOLD', 4)
+    monkeypatch.setattr(module, 'MULTIPART_CHUNKSIZE', 4)
+    state = {'in_flight': 0, 'peak': 0}
+
+    async def upload_part(**params):
+        state['in_flight'] += 1
+        state['peak'] = max(state['peak'], state['in_flight'])
+        await asyncio.sleep(0.01)
+        state['in_flight'] -= 1
+        return {'ETag': str(params['PartNumber'])}
+    client = MagicMock()
+    client.create_multipart_upload = AsyncMock(return_value={'UploadId': 'u'})
+    client.upload_part = upload_part
+    client.complete_multipart_upload = AsyncMock(return_value={})
+    storage = make_async_cloudflare(client)
+    storage._semaphore = asyncio.Semaphore(64)
+    storage.multipart_concurrency = 2
+
+    assert asyncio.run(storage.put('key', io.BytesIO(b'x' * 40))) is True
+
+    assert state['peak'] == 2
+    parts = client.complete_multipart_upload.await_args.kwargs['MultipartUpload']['Parts']
+    assert [part['PartNumber'] for part in parts] == list(range(1, 11))
@@ -0,0 +1,265 @@
+import pytest
+from unittest.mock import MagicMock
+from utilities import cloudflareStorage
+from utilities.cloudflareStorage import Cloudflare, get_client, clear_clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    """Makes sure every test starts without cached clients."""
+    clear_clients()
+    yield
+    clear_clients()
+
+
+def make_storage(**client_options):
+    return Cloudflare("account", "key-id", "secret", "bucket", **client_options)
+
+
+# --- Client Registry ---
+
+def test_storages_share_one_client():
+    """
+    Tests that two Cloudflare objects with the same credentials reuse the same boto3 client.
+    """
+    first = make_storage()
+    second = make_storage()
+
+    assert first.client is second.client
+    assert first.client is get_client("account", "key-id", "secret")
+
+def test_client_uses_configured_pool():
+    """
+    Tests that connection settings are applied to the botocore config.
+    """
+    storage = make_storage(max_pool_connections=7, connect_timeout=2, read_timeout=9, tcp_keepalive=True)
+    config = storage.client.meta.config
+
+    assert config.max_pool_connections == 7
+    assert config.connect_timeout == 2
+    assert config.read_timeout == 9
+    assert config.tcp_keepalive is True
+    assert config.signature_version == "s3v4"
+
+def test_different_settings_get_different_clients():
+    """
+    Tests that clients with different pool settings are not shared.
+    """
+    assert make_storage(max_pool_connections=5).client is not make_storage(max_pool_connections=6).client
+    assert make_storage().client.meta.config.max_pool_connections == cloudflareStorage.MAX_POOL_CONNECTIONS
+
+# --- Listing ---
+
+def test_iter_objects_follows_every_page():
+    """
+    Tests that iter_objects yields objects from every page of the listing.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.get_paginator.return_value.paginate.return_value = iter([
+        {'Contents': [{'Key': 'users/1/a.lss'}, {'Key': 'users/1/b.lss'}]},
+        {'Contents': [{'Key': 'users/1/c.lss'}]},
+        {},
+    ])
+
+    keys = [item['Key'] for item in storage.iter_objects('users/1/')]
+
+    assert keys == ['users/1/a.lss', 'users/1/b.lss', 'users/1/c.lss']
+    storage.client.get_paginator.assert_called_once_with('list_objects_v2')
+
+def test_list_files_strips_prefix_and_extension():
+    """
+    Tests that list_files returns bare names across pages when an extension is given.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.get_paginator.return_value.paginate.return_value = iter([
+        {'Contents': [{'Key': 'users/1/scripts/One.lss'}, {'Key': 'users/1/scripts/notes.txt'}]},
+        {'Contents': [{'Key': 'users/1/scripts/Two.lss'}]},
+    ])
+
+    assert storage.list_files('users/1/scripts/', '.lss') == ['One', 'Two']
+
+# --- Bulk Delete ---
+
+def test_delete_many_splits_into_batches():
+    """
+    Tests that delete_many sends at most 1000 keys per DeleteObjects request.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.delete_objects.return_value = {}
+    keys = [f"users/1/file{i}" for i in range(2500)]
+
+    failed = storage.delete_many(keys)
+
+    assert failed == {}
+    sizes = sorted(len(call.kwargs['Delete']['Objects']) for call in storage.client.delete_objects.call_args_list)
+    assert sizes == [500, 1000, 1000]
+
+def test_delete_many_reports_failures_per_key():
+    """
+    Tests that per-key errors and failed batches are both reported.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.delete_objects.return_value = {
+        'Errors': [{'Key': 'b', 'Code': 'AccessDenied', 'Message': 'denied'}]
+    }
+
+    assert storage.delete_many(['a', 'b']) == {'b': 'AccessDenied: denied'}
+
+    storage.client.delete_objects.side_effect = Exception("connection reset")
+    assert storage.delete_many(['a', 'b']) == {'a': 'connection reset', 'b': 'connection reset'}
+
+def test_delete_many_without_keys():
+    """
+    Tests that delete_many makes no request for an empty key list.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+
+    assert storage.delete_many([]) == {}
+    storage.client.delete_objects.assert_not_called()
+
+# --- Streaming Reads ---
+
+def test_get_stream_yields_chunks_and_closes_body():
+    """
+    Tests that get_stream iterates the body in chunks and releases it afterwards.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    body = MagicMock()
+    body.iter_chunks.return_value = iter([b'{"a":', b' 1}'])
+    storage.client.get_object.return_value = {'Body': body}
+
+    chunks = list(storage.get_stream('users/1/scripts/A.lss', chunk_size=5))
+
+    assert chunks == [b'{"a":', b' 1}']
+    body.iter_chunks.assert_called_once_with(5)
+    body.close.assert_called_once()
+
+def test_get_range_sends_range_header():
+    """
+    Tests that get_range requests only the asked-for bytes.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.get_object.return_value = {'Body': MagicMock(read=lambda: b'abc')}
+
+    assert storage.get_range('key', 10, 12) == b'abc'
+    storage.client.get_object.assert_called_with(Key='key', Bucket='bucket', Range='bytes=10-12')
+
+    storage.get_range('key', 100)
+    storage.client.get_object.assert_called_with(Key='key', Bucket='bucket', Range='bytes=100-')
+
+def test_stat_uses_head_object():
+    """
+    Tests that stat returns object headers without downloading the body.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.head_object.return_value = {
+        'ContentLength': 42, 'ContentType': 'application/json', 'ETag': '"abc"', 'Metadata': {}
+    }
+
+    info = storage.stat('key')
+
+    assert info['ContentLength'] == 42
+    assert info['ETag'] == '"abc"'
+    storage.client.get_object.assert_not_called()
+
+def test_stat_missing_object():
+    """
+    Tests that stat returns None for a key that does not exist.
+    """
+    from botocore.exceptions import ClientError
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.head_object.side_effect = ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+
+    assert storage.stat('missing') is None
+
+# --- Uploads ---
+
+def test_put_small_body_uses_single_put():
+    """
+    Tests that small string bodies are sent with a single put_object call.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+
+    assert storage.put('key', '{"a": 1}', contenttype='application/json') is True
+    storage.client.put_object.assert_called_once_with(
+        Key='key', Bucket='bucket', Body=b'{"a": 1}', ContentType='application/json'
+    )
+    storage.client.upload_fileobj.assert_not_called()
+
+def test_put_large_body_uses_transfer_manager():
+    """
+    Tests that bodies above the multipart threshold are handed to upload_fileobj.
+    """
+    storage = make_storage(multipart_threshold=5 * 1024 * 1024)
+    storage.client = MagicMock()
+    body = b"x" * (5 * 1024 * 1024)
+
+    assert storage.update('key', body, contenttype='application/json') is True
+    storage.client.put_object.assert_not_called()
+    args, kwargs = storage.client.upload_fileobj.call_args
+    assert args[0].read() == body
+    assert args[1:] == ('bucket', 'key')
+    assert kwargs['ExtraArgs'] == {'ContentType': 'application/json'}
+    assert kwargs['Config'] is storage.transfer_config
+
+def test_put_iterator_body_is_streamed():
+    """
+    Tests that an iterator body is exposed to the transfer manager as a file object.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    uploaded = []
+    storage.client.upload_fileobj.side_effect = lambda fileobj, *a, **k: uploaded.append(fileobj.read())
+
+    assert storage.put('key', iter(['[', '"a"', b', "b"', ']'])) is True
+    assert uploaded == [b'["a", "b"]']
+
+def test_put_failure_returns_false():
+    """
+    Tests that storage errors are reported as a False return and still counted.
+    """
+    from utilities.meteredstorage import errors
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.put_object.side_effect = ConnectionError("R2 is down")
+    before = errors.value(operation='put', error='ConnectionError')
+
+    assert storage.put('key', 'body') is False
+    assert errors.value(operation='put', error='ConnectionError') == before + 1
+
+def test_get_if_changed_not_modified():
+    """
+    Tests that a 304 answer to a conditional GET is returned as None.
+    """
+    from botocore.exceptions import ClientError
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.get_object.side_effect = ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+
+    assert storage.get_if_changed('key', '"abc"') is None
+    storage.client.get_object.assert_called_once_with(Key='key', Bucket='bucket', IfNoneMatch='"abc"')
+
+def test_presign_signs_the_s3_operation():
+    """
+    Tests that presigned URLs are generated for the matching S3 operation.
+    """
+    storage = make_storage()
+    storage.client = MagicMock()
+    storage.client.generate_presigned_url.return_value = "https://signed"
+
+    assert storage.presign('users/u1/scripts/A.lss', 'PUT', 60, contenttype='application/json') == "https://signed"
+    storage.client.generate_presigned_url.assert_called_once_with(
+        'put_object',
+        Params={'Bucket': 'bucket', 'Key': 'users/u1/scripts/A.lss', 'ContentType': 'application/json'},
+        ExpiresIn=60,
+    )
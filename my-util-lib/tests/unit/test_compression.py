@@ -0,0 +1,79 @@
+import io
+import gzip
+import json
+import pytest
+from unittest.mock import MagicMock
+from utilities.compression import CompressedStorage, CODEC_METADATA_KEY
+
+screenplay = json.dumps([{"class": "action", "content": "A test is run."}] * 200)
+
+
+def test_large_bodies_are_compressed_and_marked():
+    """
+    Tests that bodies above min_size are gzipped and tagged in object metadata.
+    """
+    inner = MagicMock()
+    storage = CompressedStorage(inner)
+
+    storage.put('a.lss', screenplay, contenttype='application/json')
+
+    key, body, contenttype = inner.put.call_args.args
+    assert gzip.decompress(body) == screenplay.encode('utf-8')
+    assert len(body) < len(screenplay)
+    assert contenttype == 'application/json'
+    assert inner.put.call_args.kwargs['Metadata'] == {CODEC_METADATA_KEY: 'gzip'}
+
+def test_small_bodies_are_stored_as_is():
+    """
+    Tests that bodies under min_size are not compressed.
+    """
+    inner = MagicMock()
+    storage = CompressedStorage(inner)
+
+    storage.update('metadata.json', '{"title": "A"}')
+
+    inner.update.assert_called_once_with('metadata.json', b'{"title": "A"}', None)
+
+def test_compressed_bodies_are_decompressed_on_read():
+    """
+    Tests that get and get_stream return the original bytes of a compressed object.
+    """
+    inner = MagicMock()
+    stored = gzip.compress(screenplay.encode('utf-8'))
+    inner.get.side_effect = lambda key: {
+        'Body': io.BytesIO(stored), 'ContentLength': len(stored), 'Metadata': {CODEC_METADATA_KEY: 'gzip'}
+    }
+    storage = CompressedStorage(inner)
+
+    assert json.load(storage.get('a.lss')['Body']) == json.loads(screenplay)
+    assert b"".join(storage.get_stream('a.lss', chunk_size=100)) == screenplay.encode('utf-8')
+
+def test_uncompressed_objects_still_readable():
+    """
+    Tests that objects stored before compression was enabled pass through untouched.
+    """
+    inner = MagicMock()
+    response = {'Body': io.BytesIO(b'{"a": 1}'), 'Metadata': {}}
+    inner.get.return_value = response
+    storage = CompressedStorage(inner)
+
+    assert storage.get('old.lss') is response
+
+def test_unknown_codec_rejected():
+    """
+    Tests that an unsupported codec name fails fast.
+    """
+    with pytest.raises(ValueError, match="Unknown compression codec"):
+        CompressedStorage(MagicMock(), codec='lz4')
+
+def test_presigned_download_declares_the_encoding():
+    """
+    Tests that a download URL for a compressed object makes clients decode it.
+    """
+    inner = MagicMock()
+    inner.stat.return_value = {'Metadata': {CODEC_METADATA_KEY: 'gzip'}}
+    storage = CompressedStorage(inner)
+
+    storage.presign('script.lss', 'GET', 60)
+
+    inner.presign.assert_called_once_with('script.lss', 'GET', 60, None, ResponseContentEncoding='gzip')
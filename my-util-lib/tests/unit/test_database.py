@@ -0,0 +1,146 @@
+import threading
+import time
+from flask import Flask
+from sqlalchemy import select, text
+from utilities.database import Database, get_engine
+
+
+def test_databases_share_one_engine():
+    """
+    Tests that two Database objects on the same URL share a connection pool.
+    """
+    first = Database('sqlite:///:memory:')
+    second = Database('sqlite:///:memory:')
+
+    assert first.engine is second.engine
+    assert get_engine('sqlite:///:memory:', pool_recycle=60) is not first.engine
+
+def test_sessions_are_scoped_to_the_request():
+    """
+    Tests that every app context gets its own session and that it is closed on teardown.
+    """
+    db = Database('sqlite:///:memory:')
+    app = Flask(__name__)
+    db.app(app)
+
+    with app.app_context():
+        first = db._session
+        assert db._session is first
+    with app.app_context():
+        second = db._session
+
+    assert first is not second
+    assert not db._Session.registry.has()
+
+def test_failed_requests_are_rolled_back():
+    """
+    Tests that the session of a request that raised is rolled back before it is closed.
+    """
+    db = Database('sqlite:///:memory:')
+    app = Flask(__name__)
+    db.app(app)
+    rolled_back = []
+
+    try:
+        with app.app_context():
+            session = db._session
+            session.rollback = lambda: rolled_back.append(True)
+            raise RuntimeError("request failed")
+    except RuntimeError:
+        pass
+
+    assert rolled_back == [True]
+
+def test_threads_get_their_own_session():
+    """
+    Tests that code running outside a request still never shares a session across threads.
+    """
+    db = Database('sqlite:///:memory:')
+    sessions = []
+    thread = threading.Thread(target=lambda: sessions.append(db._session))
+    thread.start()
+    thread.join()
+
+    assert sessions[0] is not db._session
+
+def make_databases(tmp_path, replicas=1):
+    #a primary and replicas holding different rows, so a read tells which one served it
+    urls = [f"sqlite:///{tmp_path}/primary.db"] + [f"sqlite:///{tmp_path}/replica{i}.db" for i in range(replicas)]
+    for url in urls:
+        with get_engine(url).begin() as connection:
+            connection.execute(text("CREATE TABLE source (name VARCHAR(20))"))
+            connection.execute(text("INSERT INTO source VALUES (:name)"), {'name': url.rsplit('/', 1)[-1]})
+    return urls[0], urls[1:]
+
+def served_by(db):
+    return db._session.execute(select(text("name")).select_from(text("source"))).scalar()
+
+def test_sessions_go_to_replicas_in_turn(tmp_path):
+    """
+    Tests that sessions are spread round-robin over the replicas and keep theirs for every read.
+    """
+    primary, replicas = make_databases(tmp_path, replicas=2)
+    db = Database(primary, replica_urls=replicas)
+
+    first = [served_by(db) for _ in range(3)]
+    db._Session.remove()
+    second = [served_by(db) for _ in range(3)]
+
+    assert len(set(first)) == len(set(second)) == 1
+    assert sorted([first[0], second[0]]) == ['replica0.db', 'replica1.db']
+
+def test_reads_never_wait_on_health_checks(tmp_path, monkeypatch):
+    """
+    Tests that neither building the replica set nor serving reads waits on a health check.
+    """
+    primary, replicas = make_databases(tmp_path)
+    release = threading.Event()
+    checks = []
+
+    def hanging_check(self, engine):
+        checks.append(engine)
+        release.wait(5)
+    monkeypatch.setattr('utilities.database.ReplicaSet.check', hanging_check)
+    db = Database(primary, replica_urls=replicas, replica_check_interval=3600)
+    assert checks == []
+
+    for _ in range(3):
+        assert served_by(db) == 'replica0.db'
+        db._Session.remove()
+    release.set()
+
+    # the first check runs in the background once the set is used
+    deadline = time.monotonic() + 5
+    while not checks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert checks == [get_engine(replicas[0])]
+
+def test_writes_pin_the_session_to_the_primary(tmp_path):
+    """
+    Tests that once a session wrote, its reads are served by the primary.
+    """
+    primary, replicas = make_databases(tmp_path)
+    db = Database(primary, replica_urls=replicas)
+
+    assert served_by(db) == 'replica0.db'
+    db._session.execute(text("INSERT INTO source VALUES ('written')"))
+    assert served_by(db) == 'primary.db'
+    db.rollback()
+    db._Session.remove()
+    assert served_by(db) == 'replica0.db'
+
+def test_unhealthy_replicas_are_skipped(tmp_path):
+    """
+    Tests that a replica failing its health check is skipped and reads fall back to the primary.
+    """
+    primary, replicas = make_databases(tmp_path)
+    unreachable = f"sqlite:///{tmp_path}/missing/replica.db"
+    db = Database(primary, replica_urls=[unreachable] + replicas, replica_check_interval=0)
+    db.replicas.check_all()
+
+    assert [served_by(db) for _ in range(2)] == ['replica0.db', 'replica0.db']
+    assert db.replicas.healthy() == [get_engine(replicas[0])]
+
+    down = Database(primary, replica_urls=[unreachable], replica_check_interval=0)
+    down.replicas.check_all()
+    assert served_by(down) == 'primary.db'
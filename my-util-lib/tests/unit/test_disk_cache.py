@@ -0,0 +1,138 @@
+import io
+from unittest.mock import MagicMock
+from utilities.diskcache import DiskCache
+
+
+def make_inner(objects):
+    """Returns a mocked storage serving {key: (etag, body)} from memory."""
+    inner = MagicMock()
+    inner.bucket = "bucket"
+
+    def stat(key):
+        if key not in objects:
+            return None
+        etag, body = objects[key]
+        return {'ETag': etag, 'ContentLength': len(body), 'ContentType': 'application/json', 'Metadata': {}}
+
+    def get(key):
+        if key not in objects:
+            return False
+        etag, body = objects[key]
+        return {'ETag': etag, 'ContentLength': len(body), 'ContentType': 'application/json', 'Body': io.BytesIO(body)}
+
+    def get_if_changed(key, etag):
+        if key in objects and objects[key][0] == etag:
+            return None
+        return get(key)
+
+    inner.stat.side_effect = stat
+    inner.get.side_effect = get
+    inner.get_if_changed.side_effect = get_if_changed
+    return inner
+
+
+def test_repeat_reads_are_served_from_disk(tmp_path):
+    """
+    Tests that a body read within the TTL is served from disk without any request to storage.
+    """
+    inner = make_inner({'a.lss': ('"v1"', b'{"a": 1}')})
+    cache = DiskCache(inner, str(tmp_path))
+
+    assert cache.get('a.lss')['Body'].read() == b'{"a": 1}'
+    response = cache.get('a.lss')
+    assert response['Body'].read() == b'{"a": 1}'
+    assert response['ContentType'] == 'application/json'
+    assert inner.get.call_count == 1
+    inner.stat.assert_not_called()
+    inner.get_if_changed.assert_not_called()
+
+def test_expired_entries_are_revalidated(tmp_path):
+    """
+    Tests that once the TTL expired an unchanged body costs a conditional GET and no download.
+    """
+    inner = make_inner({'a.lss': ('"v1"', b'body')})
+    cache = DiskCache(inner, str(tmp_path), ttl=0)
+    cache.get('a.lss')
+
+    assert cache.get('a.lss')['Body'].read() == b'body'
+    inner.get_if_changed.assert_called_once_with('a.lss', '"v1"')
+    assert inner.get.call_count == 1
+    inner.stat.assert_not_called()
+
+def test_changed_etag_is_refetched(tmp_path):
+    """
+    Tests that a new ETag in storage bypasses the old cached body.
+    """
+    objects = {'a.lss': ('"v1"', b'old')}
+    inner = make_inner(objects)
+    cache = DiskCache(inner, str(tmp_path), ttl=0)
+    cache.get('a.lss')
+
+    objects['a.lss'] = ('"v2"', b'new')
+
+    assert cache.get('a.lss')['Body'].read() == b'new'
+    inner.get_if_changed.assert_called_once_with('a.lss', '"v1"')
+    assert len(cache._by_key) == 1
+
+def test_own_writes_invalidate(tmp_path):
+    """
+    Tests that put and delete drop the cached body for the key.
+    """
+    inner = make_inner({'a.lss': ('"v1"', b'body')})
+    cache = DiskCache(inner, str(tmp_path))
+    cache.get('a.lss')
+
+    cache.put('a.lss', 'new body')
+    inner.put.assert_called_once_with('a.lss', 'new body', None)
+    cache.get('a.lss')
+    assert inner.get.call_count == 2
+
+    cache.delete('a.lss')
+    assert cache._total_bytes == 0
+
+def test_lru_eviction_by_total_bytes(tmp_path):
+    """
+    Tests that the least recently used bodies are evicted once the byte budget is exceeded.
+    """
+    inner = make_inner({
+        'a': ('"1"', b'a' * 40),
+        'b': ('"1"', b'b' * 40),
+        'c': ('"1"', b'c' * 40),
+    })
+    cache = DiskCache(inner, str(tmp_path), max_bytes=100)
+
+    cache.get('a')
+    cache.get('b')
+    cache.get('a')  # 'a' is now more recent than 'b'
+    cache.get('c')
+
+    assert cache._total_bytes == 80
+    inner.get.reset_mock()
+    cache.get('a')
+    cache.get('c')
+    inner.get.assert_not_called()
+    cache.get('b')
+    inner.get.assert_called_once_with('b')
+
+def test_index_is_rebuilt_from_disk(tmp_path):
+    """
+    Tests that a new process reuses bodies cached by a previous one.
+    """
+    inner = make_inner({'a.lss': ('"v1"', b'body')})
+    DiskCache(inner, str(tmp_path)).get('a.lss')
+
+    second = DiskCache(inner, str(tmp_path))
+
+    assert second._total_bytes == 4
+    assert second.get('a.lss')['Body'].read() == b'body'
+    assert inner.get.call_count == 1
+    inner.get_if_changed.assert_called_once_with('a.lss', '"v1"')
+
+def test_missing_object_falls_through(tmp_path):
+    """
+    Tests that a missing key returns the wrapped storage's result.
+    """
+    inner = make_inner({})
+    cache = DiskCache(inner, str(tmp_path))
+
+    assert cache.get('missing') is False
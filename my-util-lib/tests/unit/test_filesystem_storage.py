@@ -0,0 +1,95 @@
+import io
+import mmap
+import os
+import pytest
+from utilities.filesystemStorage import FileSystem
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileSystem(str(tmp_path), fsync='never', mmap_threshold=1024)
+
+
+def test_put_and_get_round_trip(storage):
+    """
+    Tests that a stored body comes back with its headers.
+    """
+    assert storage.put('users/u1/scripts/A.lss', '{"a": 1}', contenttype='application/json',
+                       Metadata={'content-codec': 'gzip'}) is True
+
+    response = storage.get('users/u1/scripts/A.lss')
+
+    assert response['Body'].read() == b'{"a": 1}'
+    assert response['ContentType'] == 'application/json'
+    assert response['ContentLength'] == 8
+    assert response['Metadata'] == {'content-codec': 'gzip'}
+    assert response['ETag'].startswith('"')
+
+def test_objects_use_the_bucket_key_layout(storage, tmp_path):
+    """
+    Tests that keys map to the same directory layout they have in the bucket.
+    """
+    storage.put('users/u1/projects/p1/metadata.json', b'{}')
+
+    assert os.path.isfile(tmp_path / 'objects' / 'users' / 'u1' / 'projects' / 'p1' / 'metadata.json')
+    assert not [name for name in os.listdir(tmp_path / 'objects' / 'users' / 'u1' / 'projects' / 'p1') if name.startswith('.tmp')]
+
+def test_large_objects_are_memory_mapped(storage):
+    """
+    Tests that bodies above the threshold are served through mmap, also for range reads.
+    """
+    data = bytes(range(256)) * 16
+    storage.put('big.bin', io.BytesIO(data))
+
+    response = storage.get('big.bin')
+
+    assert isinstance(response['Body'], mmap.mmap)
+    assert response['Body'].read() == data
+    assert storage.get_range('big.bin', 10, 19) == data[10:20]
+    assert b"".join(storage.get_stream('big.bin', chunk_size=1000)) == data
+
+def test_get_if_changed_compares_etags(storage):
+    """
+    Tests that an unchanged object is reported as None.
+    """
+    storage.put('a.json', b'v1')
+    etag = storage.stat('a.json')['ETag']
+
+    assert storage.get_if_changed('a.json', etag) is None
+    storage.put('a.json', b'v2')
+    assert storage.get_if_changed('a.json', etag)['Body'].read() == b'v2'
+
+def test_missing_objects(storage):
+    """
+    Tests that missing keys follow the Storage error contract.
+    """
+    assert storage.get('missing') is False
+    assert storage.stat('missing') is None
+    assert storage.delete('missing') is True
+    assert storage.put('../escape', b'x') is False
+
+def test_prefix_listing(storage):
+    """
+    Tests that listings only return keys under the prefix, in key order.
+    """
+    for key in ['users/u1/scripts/B.lss', 'users/u1/scripts/A.lss', 'users/u1/projects/p1/metadata.json',
+                'users/u2/scripts/C.lss']:
+        storage.put(key, b'x')
+
+    assert [item['Key'] for item in storage.iter_objects('users/u1/')] == [
+        'users/u1/projects/p1/metadata.json', 'users/u1/scripts/A.lss', 'users/u1/scripts/B.lss',
+    ]
+    assert storage.list_files('users/u1/scripts/', '.lss') == ['A', 'B']
+    assert storage.list_files('users/u3/') == []
+
+def test_delete_many_prunes_empty_directories(storage, tmp_path):
+    """
+    Tests that deleting the last object of a prefix removes its directories.
+    """
+    keys = ['users/u1/projects/p1/metadata.json', 'users/u1/projects/p1/poster.png']
+    for key in keys:
+        storage.put(key, b'x')
+
+    assert storage.delete_many(keys) == {}
+    assert not os.path.exists(tmp_path / 'objects' / 'users')
+    assert storage.list_objects('users/') == []
@@ -0,0 +1,75 @@
+import io
+import threading
+from unittest.mock import MagicMock
+from utilities.hedging import HedgedStorage
+
+
+def response(body):
+    return {'ETag': '"v1"', 'Body': io.BytesIO(body)}
+
+
+def test_fast_reads_are_not_hedged():
+    """
+    Tests that a read answering within the delay sends a single request.
+    """
+    inner = MagicMock()
+    inner.get.side_effect = lambda key: response(b'data')
+    storage = HedgedStorage(inner, initial_delay=5)
+
+    assert storage.get('script.lss')['Body'].read() == b'data'
+    inner.get.assert_called_once_with('script.lss')
+
+def test_stalled_read_is_hedged():
+    """
+    Tests that a stalled first request is overtaken by the hedged one.
+    """
+    release = threading.Event()
+    calls = []
+
+    def get(key):
+        calls.append(key)
+        if len(calls) == 1:
+            release.wait(5)
+            return response(b'slow')
+        return response(b'fast')
+
+    inner = MagicMock()
+    inner.get.side_effect = get
+    storage = HedgedStorage(inner, initial_delay=0.01)
+
+    assert storage.get('script.lss')['Body'].read() == b'fast'
+    assert len(calls) == 2
+    release.set()
+
+def test_hedge_falls_back_when_one_request_fails():
+    """
+    Tests that a failed request does not win against one still running.
+    """
+    release = threading.Event()
+    calls = []
+
+    def get(key):
+        calls.append(key)
+        if len(calls) == 1:
+            release.wait(0.2)
+            return response(b'first')
+        return False
+
+    inner = MagicMock()
+    inner.get.side_effect = get
+    storage = HedgedStorage(inner, initial_delay=0.01)
+
+    assert storage.get('script.lss')['Body'].read() == b'first'
+
+def test_hedge_fraction_is_capped():
+    """
+    Tests that no read is hedged once the hedge budget is spent.
+    """
+    inner = MagicMock()
+    inner.get.side_effect = lambda key: (threading.Event().wait(0.02), response(b'data'))[1]
+    storage = HedgedStorage(inner, max_fraction=0, initial_delay=0.001, burst=0)
+
+    for _ in range(3):
+        storage.get('script.lss')
+
+    assert inner.get.call_count == 3
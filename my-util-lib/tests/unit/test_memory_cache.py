@@ -0,0 +1,102 @@
+import io
+from unittest.mock import MagicMock
+from utilities.memorycache import MemoryCache
+
+
+def make_inner(body=b'{"title": "A"}', etag='"v1"'):
+    """Returns a mocked storage holding a single object."""
+    inner = MagicMock()
+    inner.get.side_effect = lambda key: {'ETag': etag, 'ContentLength': len(body), 'Body': io.BytesIO(body)}
+    inner.get_if_changed.return_value = None
+    return inner
+
+
+def test_fresh_entries_are_hits():
+    """
+    Tests that reads inside the TTL do not touch the wrapped storage.
+    """
+    inner = make_inner()
+    cache = MemoryCache(inner, ttl=60)
+
+    assert cache.get('metadata.json')['Body'].read() == b'{"title": "A"}'
+    assert cache.get('metadata.json')['Body'].read() == b'{"title": "A"}'
+
+    inner.get.assert_called_once_with('metadata.json')
+    inner.get_if_changed.assert_not_called()
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_expired_entries_are_revalidated_by_etag():
+    """
+    Tests that an expired entry costs a conditional GET and is reused when unchanged.
+    """
+    inner = make_inner()
+    cache = MemoryCache(inner, ttl=0)
+
+    cache.get('metadata.json')
+    assert cache.get('metadata.json')['Body'].read() == b'{"title": "A"}'
+
+    inner.get_if_changed.assert_called_once_with('metadata.json', '"v1"')
+    assert inner.get.call_count == 1
+    assert cache.stats()['revalidations'] == 1
+
+def test_changed_object_replaces_entry():
+    """
+    Tests that a revalidation returning a new body replaces the cached one.
+    """
+    inner = make_inner()
+    inner.get_if_changed.return_value = {'ETag': '"v2"', 'ContentLength': 3, 'Body': io.BytesIO(b'new')}
+    cache = MemoryCache(inner, ttl=0)
+
+    cache.get('metadata.json')
+    assert cache.get('metadata.json')['Body'].read() == b'new'
+    inner.get_if_changed.return_value = None
+    cache.get('metadata.json')
+    inner.get_if_changed.assert_called_with('metadata.json', '"v2"')
+
+def test_large_objects_are_not_cached():
+    """
+    Tests that bodies above max_object_bytes are passed through untouched.
+    """
+    inner = make_inner(body=b'x' * 100)
+    cache = MemoryCache(inner, ttl=60, max_object_bytes=10)
+
+    cache.get('big.lss')
+    cache.get('big.lss')
+
+    assert inner.get.call_count == 2
+    assert cache.stats()['entries'] == 0
+
+def test_writes_invalidate_and_lru_is_bounded():
+    """
+    Tests that writes drop the cached entry and the cache keeps at most max_entries.
+    """
+    inner = make_inner()
+    cache = MemoryCache(inner, ttl=60, max_entries=2)
+
+    cache.get('a')
+    cache.put('a', '{}')
+    cache.get('a')
+    assert inner.get.call_count == 2
+
+    cache.get('b')
+    cache.get('c')
+    assert cache.stats()['entries'] == 2
+    cache.get('a')
+    assert inner.get.call_count == 5
+
+def test_lru_is_bounded_by_total_bytes():
+    """
+    Tests that least recently used entries are evicted once the cache holds more than max_bytes.
+    """
+    inner = make_inner(body=b'x' * 40)
+    cache = MemoryCache(inner, ttl=60, max_bytes=100)
+
+    for key in ('a', 'b', 'c'):
+        cache.get(key)
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] == 80
+    inner.get.reset_mock()
+    cache.get('a')
+    inner.get.assert_called_once_with('a')
@@ -0,0 +1,84 @@
+import io
+import pytest
+from unittest.mock import MagicMock
+from flask import Flask
+from utilities.metrics import MetricsRegistry, metrics_bp, registry
+from utilities.meteredstorage import MeteredStorage, key_family, operation_seconds, bytes_in, bytes_out, errors, in_flight
+
+
+def test_registry_renders_prometheus_text():
+    """
+    Tests that counters and histograms are rendered with cumulative buckets.
+    """
+    metrics = MetricsRegistry()
+    counter = metrics.counter('requests_total', 'Requests.', ('route',))
+    histogram = metrics.histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+    counter.inc(route='/a')
+    histogram.observe(0.05, route='/a')
+    histogram.observe(0.5, route='/a')
+
+    text = metrics.render()
+
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/a"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{route="/a"} 2' in text
+
+def test_key_family_collapses_ids():
+    """
+    Tests that user, project and script ids are not used as label values.
+    """
+    assert key_family('users/u1/scripts/My Script.lss') == 'users/*/scripts/*.lss'
+    assert key_family('users/u1/projects/p1/metadata.json') == 'users/*/projects/*/*.json'
+    assert key_family('users/u1/projects/') == 'users/*/projects/'
+
+def test_metered_storage_records_latency_and_bytes():
+    """
+    Tests that reads and writes are timed and their bytes counted.
+    """
+    inner = MagicMock()
+    inner.put.return_value = True
+    inner.get.return_value = {'Body': io.BytesIO(b'12345')}
+    storage = MeteredStorage(inner)
+    labels = {'operation': 'get', 'prefix': 'users/*/scripts/*.lss'}
+    put_labels = {'operation': 'put', 'prefix': 'users/*/scripts/*.lss'}
+    reads, read_bytes, written = operation_seconds.count(**labels), bytes_in.value(**labels), bytes_out.value(**put_labels)
+
+    assert storage.put('users/u1/scripts/a.lss', 'abc') is True
+    assert storage.get('users/u1/scripts/a.lss')['Body'].read() == b'12345'
+
+    assert operation_seconds.count(**labels) == reads + 1
+    assert bytes_in.value(**labels) == read_bytes + 5
+    assert bytes_out.value(**put_labels) == written + 3
+    assert in_flight.value(operation='get') == 0
+
+def test_metered_storage_counts_raised_errors():
+    """
+    Tests that exceptions are counted by class and still reach the caller.
+    """
+    inner = MagicMock()
+    inner.stat.side_effect = TimeoutError('slow')
+    storage = MeteredStorage(inner)
+    before = errors.value(operation='stat', error='TimeoutError')
+
+    with pytest.raises(TimeoutError):
+        storage.stat('users/u1/scripts/a.lss')
+
+    assert errors.value(operation='stat', error='TimeoutError') == before + 1
+    assert in_flight.value(operation='stat') == 0
+
+def test_metrics_endpoint_serves_the_registry():
+    """
+    Tests that the blueprint exposes the process registry.
+    """
+    registry.counter('test_endpoint_total', 'Endpoint test.').inc()
+    app = Flask(__name__)
+    app.register_blueprint(metrics_bp)
+
+    response = app.test_client().get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert 'test_endpoint_total 1' in response.get_data(as_text=True)
@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, text
+from utilities.migrations import Migration, MigrationRunner, add_column, create_index, sequential_scans
+
+
+def make_runner(engine):
+    return MigrationRunner(engine, [
+        Migration(2, 'index notes by owner', [create_index('ix_notes_owner', 'notes', ['owner'])], concurrent=True),
+        Migration(1, 'create notes', ["CREATE TABLE notes (id INTEGER PRIMARY KEY, owner VARCHAR(50), body TEXT)"]),
+    ], table='test_schema_migrations')
+
+def test_migrations_are_applied_once_in_order():
+    """
+    Tests that pending migrations run in version order and are recorded so they never run twice.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    runner = make_runner(engine)
+
+    assert [migration.version for migration in runner.pending()] == [1, 2]
+    assert [migration.version for migration in runner.upgrade()] == [1, 2]
+    assert runner.upgrade() == []
+    assert runner.applied() == {1, 2}
+
+def test_duplicate_versions_are_rejected():
+    """
+    Tests that two migrations sharing a version are refused.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    try:
+        MigrationRunner(engine, [Migration(1, 'a', []), Migration(1, 'b', [])])
+        assert False, "expected a ValueError"
+    except ValueError:
+        pass
+
+def test_sequential_scans_flags_unindexed_lookups():
+    """
+    Tests that a lookup is reported as a full scan until the index exists.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, owner VARCHAR(50), body TEXT)"))
+    query = "SELECT * FROM notes WHERE owner = 'someone'"
+
+    assert sequential_scans(engine, query) == ['notes']
+    with engine.begin() as connection:
+        create_index('ix_notes_owner', 'notes', ['owner'])(connection)
+    assert sequential_scans(engine, query) == []
+
+def test_add_column_skips_existing_columns():
+    """
+    Tests that adding a column is a no-op on tables that already have it.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY)"))
+        add_column('notes', 'body', 'TEXT')(connection)
+        add_column('notes', 'body', 'TEXT')(connection)
+        columns = [row[1] for row in connection.execute(text("PRAGMA table_info(notes)"))]
+
+    assert columns == ['id', 'body']
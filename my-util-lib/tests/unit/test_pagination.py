@@ -0,0 +1,80 @@
+import pytest
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, DateTime, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.dialects.postgresql import UUID
+from utilities.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, page_size, paginate, requested_page_size,
+)
+
+Base = declarative_base()
+
+
+class Note(Base):
+    __tablename__ = 'notes'
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    title = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+
+def test_page_size_is_clamped():
+    """
+    Tests that page sizes fall back to the default, are capped and reject garbage.
+    """
+    assert page_size(None) == DEFAULT_PAGE_SIZE
+    assert page_size("10") == 10
+    assert page_size(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        page_size("ten")
+    with pytest.raises(ValueError):
+        page_size(0)
+
+def test_unpaginated_requests_get_everything():
+    """
+    Tests that only clients sending a page size or a cursor get a page.
+    """
+    assert requested_page_size(None, None) is None
+    assert requested_page_size('', '') is None
+    assert requested_page_size(None, "cursor") == DEFAULT_PAGE_SIZE
+    assert requested_page_size("10") == 10
+
+def test_cursor_round_trip():
+    """
+    Tests that a cursor decodes to the sort key it was made from and that garbage is rejected.
+    """
+    created_at, row_id = datetime(2025, 1, 2, 3, 4, 5, 6), uuid.uuid4()
+
+    assert decode_cursor(encode_cursor(created_at, row_id)) == (created_at, row_id)
+    with pytest.raises(ValueError, match="Invalid page cursor"):
+        decode_cursor("not-a-cursor")
+
+def test_pages_cover_every_row_once():
+    """
+    Tests that walking the pages returns every row exactly once, newest first, even when timestamps tie.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    tied = datetime(2025, 1, 1)
+    for i in range(7):
+        created_at = tied if i < 4 else datetime(2025, 1, i)
+        session.add(Note(id=uuid.uuid4(), title=f"note {i}", created_at=created_at))
+    session.commit()
+
+    query = session.query(Note.id, Note.title, Note.created_at)
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = paginate(query, Note.created_at, Note.id, 3, cursor)
+        seen.extend(rows)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    rows, cursor = paginate(query, Note.created_at, Note.id, None)
+    assert cursor is None
+    assert [(row.created_at, row.id) for row in rows] == [(row.created_at, row.id) for row in seen]
+    assert sorted(row.title for row in seen) == [f"note {i}" for i in range(7)]
+    keys = [(row.created_at, row.id) for row in seen]
+    assert keys == sorted(keys, reverse=True)
@@ -0,0 +1,65 @@
+from flask import Flask
+from sqlalchemy import text
+from utilities.database import Database
+from utilities import querystats
+from utilities.querystats import normalize, repeated_queries, request_queries
+
+
+def make_app(tmp_path, name, queries):
+    #an app whose only route runs the same lookup a given number of times
+    db = Database(f"sqlite:///{tmp_path}/{name}.db")
+    app = Flask(name)
+    db.app(app)
+
+    @app.route('/lookups')
+    def lookups():
+        for i in range(queries):
+            db._session.execute(text("SELECT :id"), {'id': i})
+        return "ok"
+    return app
+
+def test_statements_are_normalized():
+    """
+    Tests that literals, placeholders and IN lists are collapsed so repeats look alike.
+    """
+    assert normalize("SELECT * FROM scripts WHERE title = 'A'  AND n = 3") == "SELECT * FROM scripts WHERE title = ? AND n = ?"
+    assert normalize("SELECT * FROM t WHERE id IN (%(id_1)s, %(id_2)s)") == normalize("SELECT * FROM t WHERE id IN (:id)")
+    assert normalize("SELECT metadata::jsonb FROM t1") == "SELECT metadata::jsonb FROM t1"
+
+def test_query_headers_in_debug_mode(tmp_path):
+    """
+    Tests that debug responses carry the request's query count and repeated statements.
+    """
+    app = make_app(tmp_path, 'debug_app', 6)
+    app.debug = True
+
+    response = app.test_client().get('/lookups')
+
+    assert response.headers['X-DB-Query-Count'] == '6'
+    assert response.headers['X-DB-Repeated-Queries'] == '1'
+    assert float(response.headers['X-DB-Query-Time-Ms']) >= 0
+
+def test_repeated_statements_are_counted(tmp_path):
+    """
+    Tests that a request repeating a statement is recorded in the metrics, without headers outside debug mode.
+    """
+    app = make_app(tmp_path, 'metrics_app', 5)
+    before = repeated_queries.value(endpoint='lookups', statement='SELECT ?')
+    requests_before = request_queries.count(endpoint='lookups')
+
+    response = app.test_client().get('/lookups')
+
+    assert 'X-DB-Query-Count' not in response.headers
+    assert repeated_queries.value(endpoint='lookups', statement='SELECT ?') == before + 1
+    assert request_queries.count(endpoint='lookups') == requests_before + 1
+
+def test_slow_statements_are_counted(tmp_path, monkeypatch):
+    """
+    Tests that statements above the slow query threshold are counted.
+    """
+    monkeypatch.setattr(querystats, 'SLOW_QUERY_SECONDS', 0)
+    before = querystats.slow_queries.value(statement='SELECT ?')
+
+    make_app(tmp_path, 'slow_app', 1).test_client().get('/lookups')
+
+    assert querystats.slow_queries.value(statement='SELECT ?') == before + 1
@@ -0,0 +1,155 @@
+import pytest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError
+from utilities.cloudflareStorage import Cloudflare, clear_clients
+from utilities.resilience import (
+    Resilience, CircuitBreaker, RetryBudget, CircuitOpenError, is_transient, breaker_state, CLOSED, OPEN, HALF_OPEN,
+)
+
+
+def make_resilience(**breaker_options):
+    breaker = CircuitBreaker('test', **dict({'min_calls': 4, 'failure_rate': 0.5, 'reset_timeout': 60}, **breaker_options))
+    return Resilience('test', attempts=3, base_delay=0, max_delay=0, breaker=breaker)
+
+
+def client_error(code, status):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'GetObject')
+
+
+# --- Retries ---
+
+def test_transient_errors_are_retried():
+    """
+    Tests that an idempotent call is retried until it succeeds.
+    """
+    resilience = make_resilience()
+    call = MagicMock(side_effect=[EndpointConnectionError(endpoint_url='r2'), 'ok'])
+
+    assert resilience.call('get_object', call) == 'ok'
+    assert call.call_count == 2
+
+def test_non_idempotent_calls_are_not_retried():
+    """
+    Tests that a call whose body cannot be replayed fails on the first error.
+    """
+    resilience = make_resilience()
+    call = MagicMock(side_effect=ConnectionError('reset'))
+
+    with pytest.raises(ConnectionError):
+        resilience.call('upload_fileobj', call, idempotent=False)
+    assert call.call_count == 1
+
+def test_client_errors_are_not_retried():
+    """
+    Tests that a 404 is raised at once and does not count against the backend.
+    """
+    resilience = make_resilience()
+    call = MagicMock(side_effect=client_error('NoSuchKey', 404))
+
+    with pytest.raises(ClientError):
+        resilience.call('get_object', call)
+    assert call.call_count == 1
+    assert not is_transient(client_error('NoSuchKey', 404))
+    assert is_transient(client_error('SlowDown', 503))
+
+def test_retry_budget_limits_retries():
+    """
+    Tests that retries stop once the budget is spent.
+    """
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+    resilience = Resilience('budget', attempts=5, base_delay=0, max_delay=0, budget=budget,
+                            breaker=CircuitBreaker('budget', min_calls=100))
+    call = MagicMock(side_effect=TimeoutError('slow'))
+
+    with pytest.raises(TimeoutError):
+        resilience.call('get_object', call)
+    assert call.call_count == 2
+
+
+# --- Circuit Breaker ---
+
+def test_breaker_opens_and_short_circuits():
+    """
+    Tests that a sustained failure rate opens the breaker and later calls fail fast.
+    """
+    resilience = Resilience('outage', attempts=1, breaker=CircuitBreaker('outage', min_calls=4, reset_timeout=60))
+    failing = MagicMock(side_effect=TimeoutError('slow'))
+    for _ in range(4):
+        with pytest.raises(TimeoutError):
+            resilience.call('get_object', failing)
+
+    call = MagicMock()
+    with pytest.raises(CircuitOpenError):
+        resilience.call('get_object', call)
+    call.assert_not_called()
+    assert resilience.breaker.state == OPEN
+    assert breaker_state.value(breaker='outage') == 2
+
+def test_half_open_probe_closes_the_breaker():
+    """
+    Tests that one successful probe after the reset timeout closes the breaker.
+    """
+    breaker = CircuitBreaker('probe', min_calls=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    probe = breaker.before_call()
+    assert probe is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success(probe)
+    assert breaker.state == CLOSED
+    assert breaker_state.value(breaker='probe') == 0
+
+def test_open_breaker_waits_for_the_probe():
+    """
+    Tests that a stray success or a 404 arriving while the breaker is open does not close it, only the probe does.
+    """
+    resilience = make_resilience(min_calls=1, reset_timeout=60)
+    breaker = resilience.breaker
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    # a call started before the breaker opened succeeds late
+    breaker.record_success()
+    assert breaker.state == OPEN
+    # another one ends with a 404, which counts as an answer from the backend
+    breaker._opened_at -= 60
+    with pytest.raises(ClientError):
+        resilience.call('get_object', MagicMock(side_effect=client_error('NoSuchKey', 404)))
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    breaker._opened_at -= 60
+    probe = breaker.before_call()
+    # a non-probe outcome arriving while half open is ignored as well
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure(probe)
+    assert breaker.state == OPEN
+
+
+# --- Cloudflare Integration ---
+
+def test_cloudflare_requests_go_through_the_policy():
+    """
+    Tests that Cloudflare retries a flaky GET and reports an open breaker as a failed call.
+    """
+    clear_clients()
+    resilience = make_resilience(min_calls=100)
+    storage = Cloudflare("account", "key-id", "secret", "bucket", resilience=resilience)
+    storage.client = MagicMock()
+    storage.client.get_object.side_effect = [client_error('InternalError', 500), {'Body': 'data'}]
+
+    assert storage.get('key') == {'Body': 'data'}
+    assert storage.client.get_object.call_count == 2
+
+    open_breaker = CircuitBreaker('open', min_calls=1, reset_timeout=60)
+    open_breaker.record_failure()
+    storage.resilience = Resilience('open', breaker=open_breaker)
+    assert storage.get('key') is False
+    assert storage.client.get_object.call_count == 2
+    clear_clients()
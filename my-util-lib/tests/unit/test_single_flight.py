@@ -0,0 +1,140 @@
+import io
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from utilities.singleflight import SingleFlight, SingleFlightStorage
+
+
+def run_concurrently(count, target):
+    """Starts count threads running target and returns their results in a list."""
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    """
+    Tests that callers arriving while a call is in flight wait for it instead of repeating it.
+    """
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return 'document'
+
+    threads, results = run_concurrently(5, lambda: flight.do('key', fetch))
+    #gives every thread time to join the in-flight call
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['document'] * 5
+    assert len(calls) == 1
+
+def test_errors_reach_every_waiter():
+    """
+    Tests that a failed call raises the same error in the leader and the waiters.
+    """
+    flight = SingleFlight('test')
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        raise ConnectionError('R2 is down')
+
+    threads, results = run_concurrently(3, lambda: flight.do('key', fetch))
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+def test_waiters_time_out():
+    """
+    Tests that a waiter gives up after its timeout while the leader keeps running.
+    """
+    flight = SingleFlight('test')
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return 'late'
+
+    leader = threading.Thread(target=flight.do, args=('key', fetch))
+    leader.start()
+    started.wait(5)
+
+    with pytest.raises(TimeoutError):
+        flight.do('key', fetch, timeout=0.01)
+    release.set()
+    leader.join()
+
+def test_storage_callers_get_their_own_body():
+    """
+    Tests that coalesced reads hand every caller an independent file object.
+    """
+    inner = MagicMock()
+    release = threading.Event()
+
+    def get(key):
+        release.wait(5)
+        return {'ETag': '"v1"', 'Body': io.BytesIO(b'{"title": "A"}')}
+    inner.get.side_effect = get
+    inner.stat.return_value = {'ContentLength': 14}
+    storage = SingleFlightStorage(inner)
+
+    threads, results = run_concurrently(3, lambda: storage.get('script.lss')['Body'].read())
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [b'{"title": "A"}'] * 3
+    inner.get.assert_called_once_with('script.lss')
+
+def test_writes_start_a_fresh_read():
+    """
+    Tests that a read after a write is never served from an older in-flight fetch.
+    """
+    inner = MagicMock()
+    inner.get.side_effect = lambda key: {'Body': io.BytesIO(b'new')}
+    inner.stat.return_value = {'ContentLength': 3}
+    storage = SingleFlightStorage(inner)
+    stale = storage._flight._calls[('get', 'script.lss')] = MagicMock()
+
+    storage.put('script.lss', 'new')
+
+    assert storage.get('script.lss')['Body'].read() == b'new'
+    stale.done.wait.assert_not_called()
+
+def test_large_objects_and_streams_are_not_shared():
+    """
+    Tests that objects above the size limit and streamed reads go straight to the wrapped storage.
+    """
+    inner = MagicMock()
+    inner.stat.return_value = {'ContentLength': 2048}
+    inner.get.side_effect = lambda key: {'Body': io.BytesIO(b'x' * 2048)}
+    inner.get_stream.return_value = iter([b'x' * 2048])
+    storage = SingleFlightStorage(inner, max_shared_bytes=1024)
+
+    response = storage.get('export.pdf')
+    assert storage.get_stream('export.pdf') is inner.get_stream.return_value
+    storage.get_range('export.pdf', 0, 9)
+
+    assert response['Body'].read() == b'x' * 2048
+    assert storage._flight._calls == {}
+    inner.get_range.assert_called_once_with('export.pdf', 0, 9)
@@ -0,0 +1,78 @@
+import io
+from hashlib import sha256
+from unittest.mock import MagicMock
+from utilities.skipunchanged import SkipUnchangedStorage, HASH_METADATA_KEY
+
+
+def make_inner(stored_body=None):
+    """Returns a mocked storage whose HEAD reports the hash of stored_body."""
+    inner = MagicMock()
+    inner.put.return_value = True
+    metadata = {} if stored_body is None else {HASH_METADATA_KEY: sha256(stored_body).hexdigest()}
+    inner.stat.return_value = None if stored_body is None else {'Metadata': metadata}
+    return inner
+
+
+def test_first_write_records_the_hash():
+    """
+    Tests that a new body is uploaded with its hash in the object metadata.
+    """
+    inner = make_inner()
+    storage = SkipUnchangedStorage(inner)
+
+    assert storage.put('script.lss', '{"a": 1}', contenttype='application/json') is True
+
+    inner.put.assert_called_once_with(
+        'script.lss', b'{"a": 1}', 'application/json',
+        Metadata={HASH_METADATA_KEY: sha256(b'{"a": 1}').hexdigest()},
+    )
+
+def test_identical_body_is_not_uploaded():
+    """
+    Tests that a body matching the stored hash is skipped and reported as written.
+    """
+    inner = make_inner(b'{"a": 1}')
+    storage = SkipUnchangedStorage(inner)
+
+    assert storage.put('script.lss', '{"a": 1}') is True
+    inner.put.assert_not_called()
+
+def test_changed_body_skips_the_head_request():
+    """
+    Tests that a body differing from the remembered hash is uploaded without asking storage first.
+    """
+    inner = make_inner()
+    storage = SkipUnchangedStorage(inner)
+    storage.put('script.lss', 'v1')
+    inner.stat.reset_mock()
+
+    assert storage.put('script.lss', 'v2') is True
+
+    inner.stat.assert_not_called()
+    assert inner.put.call_count == 2
+
+def test_write_by_another_process_is_not_skipped():
+    """
+    Tests that a remembered hash is confirmed against storage before a write is skipped.
+    """
+    inner = make_inner()
+    storage = SkipUnchangedStorage(inner)
+    storage.put('script.lss', 'v1')
+    #another worker overwrote the object with different content
+    inner.stat.return_value = {'Metadata': {HASH_METADATA_KEY: sha256(b'other').hexdigest()}}
+
+    storage.put('script.lss', 'v1')
+
+    assert inner.put.call_count == 2
+
+def test_streamed_bodies_are_passed_through():
+    """
+    Tests that file-like bodies are uploaded untouched.
+    """
+    inner = make_inner(b'data')
+    storage = SkipUnchangedStorage(inner)
+    body = io.BytesIO(b'data')
+
+    storage.put('video.bin', body)
+
+    inner.put.assert_called_once_with('video.bin', body, None)
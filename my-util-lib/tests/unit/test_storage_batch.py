@@ -0,0 +1,158 @@
+import threading
+import time
+from utilities.storagebase import StorageWrapper, BatchResult
+from utilities.storagebase import Storage
+from utilities.compression import CompressedStorage, CODEC_METADATA_KEY
+from utilities.skipunchanged import SkipUnchangedStorage
+from utilities.memorycache import MemoryCache
+from utilities.singleflight import SingleFlightStorage
+from utilities.meteredstorage import MeteredStorage
+from unittest.mock import MagicMock
+import io
+
+
+class SlowStorage(StorageWrapper):
+    """Wrapper whose get sleeps, failing for keys starting with 'bad'."""
+
+    def __init__(self):
+        super().__init__(MagicMock())
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def get(self, key):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.02)
+        with self.lock:
+            self.in_flight -= 1
+        if key.startswith('bad'):
+            raise Exception(f"cannot read {key}")
+        return key.upper()
+
+
+class BatchBackend(Storage):
+    """In-memory storage with native batches that records every batch it serves."""
+
+    def __init__(self):
+        self.objects = {}
+        self.batches = []
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        self.objects[key] = (body, {'Metadata': kwargs.get('Metadata') or {}})
+        return True
+
+    def get(self, key):
+        if key not in self.objects:
+            return False
+        body, headers = self.objects[key]
+        return dict(headers, Body=io.BytesIO(body), ETag=str(hash(body)), ContentLength=len(body))
+
+    def stat(self, key):
+        response = self.get(key)
+        return response and {name: value for name, value in response.items() if name != 'Body'}
+
+    def get_many(self, keys):
+        self.batches.append(('get_many', list(keys)))
+        return [BatchResult(key, self.get(key), None) for key in keys]
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        items = list(items)
+        self.batches.append(('put_many', [item[0] for item in items]))
+        return [BatchResult(item[0], self.put(item[0], item[1], contenttype, **dict(kwargs, **(item[2] if len(item) > 2 else {}))), None)
+                for item in items]
+
+    get_stream = get_range = update = delete = delete_many = list_files = iter_objects = None
+
+
+def test_get_many_runs_concurrently_in_order():
+    """
+    Tests that get_many overlaps calls and returns results in input order.
+    """
+    storage = SlowStorage()
+    keys = [f"key{i}" for i in range(8)]
+
+    results = storage.get_many(keys)
+
+    assert [result.key for result in results] == keys
+    assert [result.value for result in results] == [key.upper() for key in keys]
+    assert storage.peak > 1
+
+def test_get_many_reports_errors_per_key():
+    """
+    Tests that one failing key does not hide the results of the others.
+    """
+    storage = SlowStorage()
+
+    results = storage.get_many(['a', 'bad', 'c'])
+
+    assert results[0] == BatchResult('a', 'A', None)
+    assert results[1].value is None
+    assert str(results[1].error) == "cannot read bad"
+    assert results[2] == BatchResult('c', 'C', None)
+
+def test_put_many_goes_through_put():
+    """
+    Tests that put_many calls the wrapper's put for each item.
+    """
+    class UpperStorage(StorageWrapper):
+        def put(self, key, body=None, contenttype=None, **kwargs):
+            return self.storage.put(key, body.upper(), contenttype, **kwargs)
+
+    storage = UpperStorage(MagicMock())
+    storage.storage.put.return_value = True
+
+    results = storage.put_many([('a', 'x'), ('b', 'y', {'Metadata': {'n': '1'}})], contenttype='application/json')
+
+    assert [result.value for result in results] == [True, True]
+    storage.storage.put.assert_any_call('a', 'X', 'application/json')
+    storage.storage.put.assert_any_call('b', 'Y', 'application/json', Metadata={'n': '1'})
+    storage.storage.put_many.assert_not_called()
+
+def test_plain_wrapper_forwards_native_batches():
+    """
+    Tests that a wrapper leaving get and put alone hands batches to the wrapped storage.
+    """
+    storage = StorageWrapper(MagicMock())
+
+    storage.get_many(['a', 'b'])
+    storage.put_many([('a', '1')], 'text/plain')
+
+    storage.storage.get_many.assert_called_once_with(['a', 'b'])
+    storage.storage.put_many.assert_called_once_with([('a', '1')], 'text/plain')
+    storage.storage.get.assert_not_called()
+    storage.storage.put.assert_not_called()
+
+def test_batches_reach_the_backend_through_the_default_stack():
+    """
+    Tests that the stack built by the factory keeps one batch per call, compressing each body on its own.
+    """
+    backend = BatchBackend()
+    storage = MeteredStorage(SingleFlightStorage(SkipUnchangedStorage(
+        CompressedStorage(MemoryCache(backend), min_size=10)
+    )))
+    body = 'x' * 2000
+
+    storage.put_many([('a', body), ('b', 'short')])
+    results = storage.get_many(['a', 'b'])
+
+    assert backend.batches == [('put_many', ['a', 'b']), ('get_many', ['a', 'b'])]
+    assert backend.objects['a'][1]['Metadata'][CODEC_METADATA_KEY] == 'gzip'
+    assert CODEC_METADATA_KEY not in backend.objects['b'][1]['Metadata']
+    assert [result.value['Body'].read() for result in results] == [body.encode(), b'short']
+
+def test_unchanged_items_are_left_out_of_the_batch():
+    """
+    Tests that put_many only sends the bodies that differ from the stored ones.
+    """
+    backend = BatchBackend()
+    storage = SkipUnchangedStorage(backend)
+    storage.put_many([('a', '1'), ('b', '2')])
+
+    results = storage.put_many([('a', '1'), ('b', '3')])
+
+    assert [result.value for result in results] == [True, True]
+    assert backend.batches[-1] == ('put_many', ['b'])
+    assert backend.objects['b'][0] == b'3'
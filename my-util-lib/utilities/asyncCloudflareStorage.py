@@ -0,0 +1,401 @@
+from .storagebase import Storage, BatchResult, batch_items
+from .meteredstorage import record_error
+from .cloudflareStorage import (
+    MAX_POOL_CONNECTIONS, CONNECT_TIMEOUT, READ_TIMEOUT,
+    DELETE_BATCH_SIZE, STREAM_CHUNK_SIZE, MULTIPART_THRESHOLD, MULTIPART_CHUNKSIZE, MULTIPART_CONCURRENCY,
+    PRESIGN_EXPIRES, PRESIGN_OPERATIONS,
+    _IterableReader,
+)
+from contextlib import AsyncExitStack
+import threading
+import asyncio
+import io
+import os
+
+try:
+    from aiobotocore.session import get_session
+    from aiobotocore.config import AioConfig
+except ImportError:
+    get_session = None
+
+#upper bound on storage requests in flight at once, per event loop
+MAX_CONCURRENCY = int(os.getenv("CLOUDFLARE_ASYNC_MAX_CONCURRENCY", 64))
+#how long a sync caller waits on the event loop before giving up
+FACADE_TIMEOUT = float(os.getenv("CLOUDFLARE_ASYNC_TIMEOUT", 120))
+
+
+class AsyncCloudflare:
+    """asyncio implementation of the Storage operations on top of aiobotocore"""
+
+    def __init__(self, CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME,
+                 max_concurrency=MAX_CONCURRENCY, max_pool_connections=None, connect_timeout=None, read_timeout=None,
+                 multipart_concurrency=None, resilience=None):
+        if get_session is None:
+            raise ImportError("AsyncCloudflare requires the 'aiobotocore' package.")
+        self.bucket = CLOUDFLARE_BUCKET_NAME
+        self.max_concurrency = max_concurrency
+        #parts of one upload in flight at once, each holds MULTIPART_CHUNKSIZE bytes in memory
+        self.multipart_concurrency = multipart_concurrency or MULTIPART_CONCURRENCY
+        #optional utilities.resilience.Resilience applied to every request sent to R2
+        self.resilience = resilience
+        self.__client_args = {
+            'endpoint_url': f"https://{CLOUDFLARE_ACCOUNT_ID}.r2.cloudflarestorage.com",
+            'aws_access_key_id': CLOUDFLARE_ACCESS_KEY_ID,
+            'aws_secret_access_key': CLOUDFLARE_SECRET_ACCESS_KEY,
+            'config': AioConfig(
+                signature_version="s3v4",
+                max_pool_connections=max_pool_connections or max(MAX_POOL_CONNECTIONS, max_concurrency),
+                connect_timeout=connect_timeout or CONNECT_TIMEOUT,
+                read_timeout=read_timeout or READ_TIMEOUT,
+                retries=None if resilience is None else {'mode': 'standard', 'max_attempts': 1},
+            ),
+        }
+        self._client = None
+        self._exit_stack = None
+        self._client_lock = None
+        self._semaphore = None
+
+    async def client(self):
+        #the client and its connection pool belong to the loop that first uses them
+        if self._client is None:
+            if self._client_lock is None:
+                self._client_lock = asyncio.Lock()
+            async with self._client_lock:
+                if self._client is None:
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    self._exit_stack = AsyncExitStack()
+                    self._client = await self._exit_stack.enter_async_context(
+                        get_session().create_client("s3", **self.__client_args)
+                    )
+        return self._client
+
+    async def close(self):
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._client = None
+        self._exit_stack = None
+
+    async def _call(self, operation, **params):
+        client = await self.client()
+
+        async def send():
+            async with self._semaphore:
+                return await getattr(client, operation)(**params)
+        if self.resilience is None:
+            return await send()
+        #starting a multipart upload twice would leave an orphaned upload behind
+        idempotent = operation != 'create_multipart_upload'
+        return await self.resilience.call_async(operation, send, idempotent)
+
+    async def _read(self, response):
+        #bodies are read inside the loop so they can be handed to sync code as bytes
+        async with response['Body'] as stream:
+            data = await stream.read()
+        return dict(response, Body=io.BytesIO(data))
+
+    async def put(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if body is not None and not isinstance(body, (bytes, bytearray)):
+                await self.__multipart(key, body, contenttype, kwargs)
+                return True
+            params = {'Key': key, 'Bucket': self.bucket}
+            if body is not None:
+                params['Body'] = body
+            if contenttype is not None:
+                params['ContentType'] = contenttype
+            params.update(kwargs)
+            await self._call('put_object', **params)
+            return True
+        except Exception as e:
+            print(f"Error uploading file: {e}")
+            record_error("put", e)
+            return False
+
+    async def __multipart(self, key, body, contenttype, kwargs):
+        #streams a file-like or iterator body, keeping at most multipart_concurrency parts in memory
+        loop = asyncio.get_running_loop()
+        reader = body if hasattr(body, 'read') else io.BufferedReader(_IterableReader(body))
+        first = await loop.run_in_executor(None, reader.read, MULTIPART_THRESHOLD)
+        if len(first) < MULTIPART_THRESHOLD:
+            params = dict(kwargs, Key=key, Bucket=self.bucket, Body=first)
+            if contenttype is not None:
+                params['ContentType'] = contenttype
+            await self._call('put_object', **params)
+            return
+
+        params = dict(kwargs, Key=key, Bucket=self.bucket)
+        if contenttype is not None:
+            params['ContentType'] = contenttype
+        upload_id = (await self._call('create_multipart_upload', **params))['UploadId']
+        try:
+            parts = []
+            in_flight = set()
+            data = first
+            number = 1
+            while data:
+                part = asyncio.ensure_future(self._call(
+                    'upload_part', Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data
+                ))
+                parts.append((number, part))
+                in_flight.add(part)
+                if len(in_flight) >= self.multipart_concurrency:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    #surfaces a failed part before reading any more of the body
+                    for finished in done:
+                        finished.result()
+                number += 1
+                data = await loop.run_in_executor(None, reader.read, MULTIPART_CHUNKSIZE)
+            completed = [{'PartNumber': n, 'ETag': (await part)['ETag']} for n, part in parts]
+            await self._call(
+                'complete_multipart_upload', Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': completed},
+            )
+        except BaseException:
+            for _, part in parts:
+                part.cancel()
+            await self._call('abort_multipart_upload', Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    async def update(self, key, body=None, contenttype=None, **kwargs):
+        return await self.put(key, body, contenttype, **kwargs)
+
+    async def get(self, key):
+        try:
+            return await self._read(await self._call('get_object', Key=key, Bucket=self.bucket))
+        except Exception as e:
+            print(f"Error getting file: {e}")
+            record_error("get", e)
+            return False
+
+    async def get_if_changed(self, key, etag):
+        try:
+            response = await self._call('get_object', Key=key, Bucket=self.bucket, IfNoneMatch=etag)
+            return await self._read(response)
+        except Exception as e:
+            if _error_code(e) in ('304', 'NotModified'):
+                return None
+            print(f"Error getting file: {e}")
+            record_error("get_if_changed", e)
+            return False
+
+    async def presign(self, key, method='GET', expires=PRESIGN_EXPIRES, contenttype=None, **params):
+        try:
+            params = dict(params, Bucket=self.bucket, Key=key)
+            if contenttype is not None:
+                params['ContentType'] = contenttype
+            client = await self.client()
+            return await client.generate_presigned_url(PRESIGN_OPERATIONS[method.upper()], Params=params, ExpiresIn=expires)
+        except Exception as e:
+            print(f"Error presigning file: {e}")
+            record_error("presign", e)
+            return None
+
+    async def get_range(self, key, start, end=None):
+        try:
+            byte_range = f"bytes={start}-{'' if end is None else end}"
+            response = await self._call('get_object', Key=key, Bucket=self.bucket, Range=byte_range)
+            return (await self._read(response))['Body'].read()
+        except Exception as e:
+            print(f"Error reading file range: {e}")
+            record_error("get_range", e)
+            return False
+
+    async def stat(self, key):
+        try:
+            response = await self._call('head_object', Key=key, Bucket=self.bucket)
+        except Exception as e:
+            if _error_code(e) not in ('404', 'NoSuchKey', 'NotFound'):
+                print(f"Error reading file headers: {e}")
+                record_error("stat", e)
+            return None
+        return {
+            'ContentLength': response.get('ContentLength'),
+            'ContentType': response.get('ContentType'),
+            'ETag': response.get('ETag'),
+            'LastModified': response.get('LastModified'),
+            'Metadata': response.get('Metadata', {}),
+        }
+
+    async def delete(self, key):
+        try:
+            await self._call('delete_object', Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            print(f"Error deleting file: {e}")
+            record_error("delete", e)
+            return False
+
+    async def delete_many(self, keys):
+        keys = list(keys)
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        failures = {}
+        for batch_failures in await asyncio.gather(*[self.__delete_batch(batch) for batch in batches]):
+            failures.update(batch_failures)
+        return failures
+
+    async def __delete_batch(self, keys):
+        try:
+            delete_dict = {'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+            response = await self._call('delete_objects', Bucket=self.bucket, Delete=delete_dict)
+            return {
+                error['Key']: f"{error.get('Code')}: {error.get('Message')}"
+                for error in response.get('Errors', [])
+            }
+        except Exception as e:
+            print(f"Error deleting multiple files: {e}")
+            record_error("delete_many", e)
+            return {key: str(e) for key in keys}
+
+    async def iter_pages(self, prefix, page_size=1000):
+        #yields the object summaries of one listing page at a time
+        #errors are raised to the caller so a partial listing is never mistaken for a full one
+        client = await self.client()
+        paginator = client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix, PaginationConfig={'PageSize': page_size}).__aiter__()
+
+        async def fetch():
+            async with self._semaphore:
+                try:
+                    return await pages.__anext__()
+                except StopAsyncIteration:
+                    return None
+        while True:
+            #a paginator cannot resume after a failed page, so pages are guarded but never retried
+            if self.resilience is None:
+                page = await fetch()
+            else:
+                page = await self.resilience.call_async('list_objects_v2', fetch, False)
+            if page is None:
+                break
+            yield page.get('Contents', [])
+
+    async def iter_objects(self, prefix, page_size=1000):
+        async for page in self.iter_pages(prefix, page_size):
+            for item in page:
+                yield item
+
+    async def list_objects(self, prefix):
+        return [item async for item in self.iter_objects(prefix)]
+
+    async def get_many(self, keys):
+        #every get runs concurrently, bounded by the client's semaphore
+        keys = list(keys)
+        values = await asyncio.gather(*[self.get(key) for key in keys], return_exceptions=True)
+        return _batch_results(keys, values)
+
+    async def put_many(self, items, contenttype=None, **kwargs):
+        items = list(batch_items(items, kwargs))
+        values = await asyncio.gather(
+            *[self.put(key, body, contenttype, **options) for key, body, options in items], return_exceptions=True
+        )
+        return _batch_results([key for key, _, _ in items], values)
+
+
+class SyncStorage(Storage):
+    """Blocking Storage facade over an async storage, running its coroutines on a private event loop"""
+
+    def __init__(self, async_storage, timeout=FACADE_TIMEOUT):
+        self.async_storage = async_storage
+        self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="storage-loop", daemon=True)
+        self._thread.start()
+
+    @property
+    def bucket(self):
+        return getattr(self.async_storage, 'bucket', None)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(self.timeout)
+
+    def close(self):
+        if hasattr(self.async_storage, 'close'):
+            self._run(self.async_storage.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        return self._run(self.async_storage.put(key, body, contenttype, **kwargs))
+
+    def get(self, key):
+        return self._run(self.async_storage.get(key))
+
+    def get_if_changed(self, key, etag):
+        return self._run(self.async_storage.get_if_changed(key, etag))
+
+    def presign(self, key, method='GET', expires=PRESIGN_EXPIRES, contenttype=None, **params):
+        return self._run(self.async_storage.presign(key, method, expires, contenttype, **params))
+
+    def get_stream(self, key, chunk_size=STREAM_CHUNK_SIZE):
+        response = self.get(key)
+        if not response:
+            return response
+        return iter(lambda: response['Body'].read(chunk_size), b"")
+
+    def get_range(self, key, start, end=None):
+        return self._run(self.async_storage.get_range(key, start, end))
+
+    def stat(self, key):
+        return self._run(self.async_storage.stat(key))
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        return self._run(self.async_storage.update(key, body, contenttype, **kwargs))
+
+    def delete(self, key):
+        return self._run(self.async_storage.delete(key))
+
+    def delete_many(self, keys):
+        return self._run(self.async_storage.delete_many(keys))
+
+    def iter_objects(self, prefix, page_size=1000):
+        #pages are fetched on the loop one at a time, as the caller gets through the previous one
+        pages = self.async_storage.iter_pages(prefix, page_size)
+        try:
+            while True:
+                page = self._run(_next_page(pages))
+                if page is None:
+                    break
+                yield from page
+        finally:
+            self._run(pages.aclose())
+
+    def list_files(self, prefix, file_extension=None):
+        try:
+            keys = [item['Key'] for item in self.iter_objects(prefix)]
+        except Exception as e:
+            print(f"Error listing files: {e}")
+            record_error("list_files", e)
+            return []
+        if not file_extension:
+            return keys
+        return [
+            key.replace(prefix, "").replace(file_extension, "").replace("/", "")
+            for key in keys if key.endswith(file_extension)
+        ]
+
+    def get_many(self, keys):
+        #fans every get out on the loop at once instead of using the thread pool
+        return self._run(self.async_storage.get_many(list(keys)))
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        return self._run(self.async_storage.put_many(list(items), contenttype, **kwargs))
+
+
+async def _next_page(pages):
+    try:
+        return await pages.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+def _batch_results(keys, values):
+    return [
+        BatchResult(key, None, value) if isinstance(value, Exception) else BatchResult(key, value, None)
+        for key, value in zip(keys, values)
+    ]
+
+
+def _error_code(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code')
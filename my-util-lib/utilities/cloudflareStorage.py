@@ -1,22 +1,157 @@
-from boto3 import client
+from boto3.session import Session
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from .storagebase import Storage
+from .meteredstorage import record_error
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import io
+import os
+
+#connection settings shared by every client, overridable from the environment
+MAX_POOL_CONNECTIONS = int(os.getenv("CLOUDFLARE_MAX_POOL_CONNECTIONS", 50))
+CONNECT_TIMEOUT = float(os.getenv("CLOUDFLARE_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("CLOUDFLARE_READ_TIMEOUT", 60))
+TCP_KEEPALIVE = os.getenv("CLOUDFLARE_TCP_KEEPALIVE", "true").lower() in ("1", "true", "yes")
+
+#DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+DELETE_WORKERS = int(os.getenv("CLOUDFLARE_DELETE_WORKERS", 4))
+
+#size of the chunks yielded by get_stream
+STREAM_CHUNK_SIZE = 64 * 1024
+
+#bodies larger than the threshold are sent as a parallel multipart upload
+MULTIPART_THRESHOLD = int(os.getenv("CLOUDFLARE_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+MULTIPART_CHUNKSIZE = int(os.getenv("CLOUDFLARE_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+MULTIPART_CONCURRENCY = int(os.getenv("CLOUDFLARE_MULTIPART_CONCURRENCY", 4))
+
+#lifetime of presigned URLs in seconds, and the S3 operation each HTTP method maps to
+PRESIGN_EXPIRES = int(os.getenv("CLOUDFLARE_PRESIGN_EXPIRES", 300))
+PRESIGN_OPERATIONS = {'GET': 'get_object', 'PUT': 'put_object'}
+
+#process-wide registry of boto3 clients, one per set of credentials and connection settings
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(account_id, access_key_id, secret_access_key, max_pool_connections=None,
+               connect_timeout=None, read_timeout=None, tcp_keepalive=None, max_attempts=None):
+    """Return the shared boto3 client for these credentials, creating it on first use"""
+    options = (
+        MAX_POOL_CONNECTIONS if max_pool_connections is None else max_pool_connections,
+        CONNECT_TIMEOUT if connect_timeout is None else connect_timeout,
+        READ_TIMEOUT if read_timeout is None else read_timeout,
+        TCP_KEEPALIVE if tcp_keepalive is None else tcp_keepalive,
+        max_attempts,
+    )
+    #the pid is part of the key so a forked worker never reuses its parent's sockets
+    registry_key = (os.getpid(), account_id, access_key_id, secret_access_key) + options
+    s3 = _clients.get(registry_key)
+    if s3 is not None:
+        return s3
+
+    with _clients_lock:
+        s3 = _clients.get(registry_key)
+        if s3 is None:
+            pool_size, connect, read, keepalive, attempts = options
+            config = Config(
+                signature_version="s3v4",
+                max_pool_connections=pool_size,
+                connect_timeout=connect,
+                read_timeout=read,
+                tcp_keepalive=keepalive,
+                #left to botocore unless a resilience policy does the retrying
+                retries=None if attempts is None else {'mode': 'standard', 'max_attempts': attempts},
+            )
+            #boto3's default session is not thread-safe, so every client gets its own
+            s3 = Session().client(
+                "s3",
+                endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
+                aws_access_key_id=access_key_id,
+                aws_secret_access_key=secret_access_key,
+                config=config,
+            )
+            _clients[registry_key] = s3
+        return s3
+
+
+def clear_clients():
+    #drops every cached client, the next get_client call builds a fresh one
+    with _clients_lock:
+        _clients.clear()
+
+
+def _iter_body(body, chunk_size):
+    #yields a streaming body chunk by chunk and always releases the connection
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+
+class _IterableReader(io.RawIOBase):
+    #read-only file object over an iterator of str/bytes chunks, buffering at most one chunk
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                return 0
+            self._pending = chunk.encode('utf-8') if isinstance(chunk, str) else bytes(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
 
 class Cloudflare(Storage):
 
     #initializes a cloudflare object that connects to the service
-    def __init__(self, CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME):
+    def __init__(self, CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME,
+                 multipart_threshold=None, multipart_chunksize=None, multipart_concurrency=None, resilience=None,
+                 **client_options):
         """Return an authenticated boto3 client connected to Cloudflare R2"""
-        account_id = CLOUDFLARE_ACCOUNT_ID
-        self.client = client(
-            "s3",
-            endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
-            aws_access_key_id=CLOUDFLARE_ACCESS_KEY_ID,
-            aws_secret_access_key=CLOUDFLARE_SECRET_ACCESS_KEY,
+        #every Cloudflare object with the same credentials shares one warm connection pool
+        self.client = get_client(
+            CLOUDFLARE_ACCOUNT_ID,
+            CLOUDFLARE_ACCESS_KEY_ID,
+            CLOUDFLARE_SECRET_ACCESS_KEY,
+            **client_options
         )
         self.bucket = CLOUDFLARE_BUCKET_NAME
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold or MULTIPART_THRESHOLD,
+            multipart_chunksize=multipart_chunksize or MULTIPART_CHUNKSIZE,
+            max_concurrency=multipart_concurrency or MULTIPART_CONCURRENCY,
+        )
+        #optional utilities.resilience.Resilience applied to every request sent to R2
+        self.resilience = resilience
 
-    def put(self, key, body=None, contenttype=None, **kwargs):
-        try:
+    def __guard(self, operation, call, idempotent=True):
+        if self.resilience is None:
+            return call()
+        return self.resilience.call(operation, call, idempotent)
+
+    def __request(self, operation, idempotent=True, **params):
+        #every request to R2 goes through here so the resilience policy sees all of them
+        return self.__guard(operation, lambda: getattr(self.client, operation)(**params), idempotent)
+
+    def __upload(self, key, body, contenttype, kwargs):
+        #small in-memory bodies go out as a single PUT, everything else is streamed
+        #through the transfer manager, which switches to multipart above the threshold
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if body is None or (isinstance(body, (bytes, bytearray)) and len(body) < self.transfer_config.multipart_threshold):
             params = {'Key': key, 'Bucket': self.bucket}
             #accepting optional parameters
             if body is not None:
@@ -24,74 +159,188 @@ class Cloudflare(Storage):
             if contenttype is not None:
                 params['ContentType'] = contenttype
             params.update(kwargs)
-            self.client.put_object(**params)
+            self.__request('put_object', **params)
+            return
+
+        #only in-memory bodies can be replayed, so only they are retried
+        replayable = isinstance(body, (bytes, bytearray))
+        if replayable:
+            fileobj = io.BytesIO(body)
+        elif hasattr(body, 'read'):
+            fileobj = body
+        else:
+            fileobj = _IterableReader(body)
+        extra_args = dict(kwargs)
+        if contenttype is not None:
+            extra_args['ContentType'] = contenttype
+
+        def upload():
+            if replayable:
+                fileobj.seek(0)
+            self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args, Config=self.transfer_config)
+        self.__guard('upload_fileobj', upload, replayable)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        #body may be a str, bytes, a file-like object or an iterator of chunks
+        try:
+            self.__upload(key, body, contenttype, kwargs)
             return True
         except Exception as e:
             print(f"Error uploading file: {e}")
+            record_error("put", e)
             return False
 
     def get(self, key):
         try:
-            response = self.client.get_object(Key=key, Bucket=self.bucket)
+            response = self.__request('get_object', Key=key, Bucket=self.bucket)
             return response
         except Exception as e:
             print(f"Error getting file: {e}")
+            record_error("get", e)
             return False
-    
-    def update(self, key, body=None, contenttype=None, **kwargs):
+
+    def get_if_changed(self, key, etag):
+        #conditional GET, an unchanged object costs a 304 and no body transfer
         try:
-            params = {'Key': key, 'Bucket': self.bucket}
-            #accepting optional parameters
-            if body is not None:
-                params['Body'] = body
+            return self.__request('get_object', Key=key, Bucket=self.bucket, IfNoneMatch=etag)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                return None
+            print(f"Error getting file: {e}")
+            record_error("get_if_changed", e)
+            return False
+        except Exception as e:
+            print(f"Error getting file: {e}")
+            record_error("get_if_changed", e)
+            return False
+
+    def presign(self, key, method='GET', expires=PRESIGN_EXPIRES, contenttype=None, **params):
+        #signed locally, no request is sent to R2
+        try:
+            operation = PRESIGN_OPERATIONS[method.upper()]
+            params = dict(params, Bucket=self.bucket, Key=key)
             if contenttype is not None:
                 params['ContentType'] = contenttype
-            params.update(kwargs)
-            self.client.put_object(**params)
+            return self.client.generate_presigned_url(operation, Params=params, ExpiresIn=expires)
+        except Exception as e:
+            print(f"Error presigning file: {e}")
+            record_error("presign", e)
+            return None
+
+    def get_stream(self, key, chunk_size=STREAM_CHUNK_SIZE):
+        #returns an iterator over the object body so it never has to be held in memory at once
+        try:
+            response = self.__request('get_object', Key=key, Bucket=self.bucket)
+        except Exception as e:
+            print(f"Error streaming file: {e}")
+            record_error("get_stream", e)
+            return False
+        return _iter_body(response['Body'], chunk_size)
+
+    def get_range(self, key, start, end=None):
+        #returns the bytes between start and end (inclusive), or up to the end of the object
+        try:
+            byte_range = f"bytes={start}-{'' if end is None else end}"
+            response = self.__request('get_object', Key=key, Bucket=self.bucket, Range=byte_range)
+            return response['Body'].read()
+        except Exception as e:
+            print(f"Error reading file range: {e}")
+            record_error("get_range", e)
+            return False
+
+    def stat(self, key):
+        #HEAD-only lookup of an object's size and headers, returns None if it does not exist
+        try:
+            response = self.__request('head_object', Key=key, Bucket=self.bucket)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                print(f"Error reading file headers: {e}")
+                record_error("stat", e)
+            return None
+        except Exception as e:
+            print(f"Error reading file headers: {e}")
+            record_error("stat", e)
+            return None
+        return {
+            'ContentLength': response.get('ContentLength'),
+            'ContentType': response.get('ContentType'),
+            'ETag': response.get('ETag'),
+            'LastModified': response.get('LastModified'),
+            'Metadata': response.get('Metadata', {}),
+        }
+    
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            self.__upload(key, body, contenttype, kwargs)
             return True
         except Exception as e:
             print(f"Error updating file: {e}")
+            record_error("update", e)
             return False
 
     def delete(self, key):
         try:
-            self.client.delete_object(Bucket=self.bucket, Key=key)
+            self.__request('delete_object', Bucket=self.bucket, Key=key)
             return True
         except Exception as e:
             print(f"Error deleting file: {e}")
+            record_error("delete", e)
             return False
 
     def delete_many(self, keys):
+        #deletes keys in 1000-key batches sent concurrently
+        #returns a dict of {key: error} for every key that could not be deleted
+        keys = list(keys)
         if not keys:
-            return True
+            return {}
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        failures = {}
+        with ThreadPoolExecutor(max_workers=min(DELETE_WORKERS, len(batches))) as executor:
+            for batch_failures in executor.map(self.__delete_batch, batches):
+                failures.update(batch_failures)
+        return failures
+
+    def __delete_batch(self, keys):
         try:
-            delete_dict = {'Objects': [{'Key': key} for key in keys]}
-            self.client.delete_objects(Bucket=self.bucket, Delete=delete_dict)
-            return True
+            delete_dict = {'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+            response = self.__request('delete_objects', Bucket=self.bucket, Delete=delete_dict)
+            return {
+                error['Key']: f"{error.get('Code')}: {error.get('Message')}"
+                for error in response.get('Errors', [])
+            }
         except Exception as e:
             print(f"Error deleting multiple files: {e}")
-            return False
-    
+            record_error("delete_many", e)
+            return {key: str(e) for key in keys}
+
+    def iter_objects(self, prefix, page_size=1000):
+        #lazily follows continuation tokens, yielding one object summary at a time
+        #errors are raised to the caller so a partial listing is never mistaken for a full one
+        paginator = self.client.get_paginator('list_objects_v2')
+        pages = iter(paginator.paginate(Bucket=self.bucket, Prefix=prefix, PaginationConfig={'PageSize': page_size}))
+        while True:
+            #a paginator cannot resume after a failed page, so pages are guarded but never retried
+            page = self.__guard('list_objects_v2', lambda: next(pages, None), idempotent=False)
+            if page is None:
+                break
+            for item in page.get('Contents', []):
+                yield item
+
     def list_files(self, prefix, file_extension=None):
         try:
-            response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-            if 'Contents' in response:
-                if file_extension:
-                    files = []
-                    for file in response['Contents']:
-                        key = file['Key']
-                        if key.endswith(file_extension):
-                            key = key.replace(prefix, "")
-                            key = key.replace(file_extension, "")
-                            key = key.replace("/", "")
-                            files.append(key)
-                    return files
-
-                else: 
-                    return [item['Key'] for item in response['Contents']]
+            if file_extension:
+                files = []
+                for file in self.iter_objects(prefix):
+                    key = file['Key']
+                    if key.endswith(file_extension):
+                        key = key.replace(prefix, "")
+                        key = key.replace(file_extension, "")
+                        key = key.replace("/", "")
+                        files.append(key)
+                return files
             else:
-                return []
+                return [item['Key'] for item in self.iter_objects(prefix)]
         except Exception as e:
             print(f"Error listing files: {e}")
+            record_error("list_files", e)
             return []
-        
\ No newline at end of file
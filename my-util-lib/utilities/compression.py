@@ -0,0 +1,139 @@
+from .storagebase import StorageWrapper, BatchResult, batch_items
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#user metadata key recording how a stored body was compressed
+CODEC_METADATA_KEY = 'content-codec'
+#bodies smaller than this are stored as-is, compressing them saves nothing
+DEFAULT_MIN_SIZE = 1024
+CODECS = ('gzip', 'zstd')
+
+
+class CompressedStorage(StorageWrapper):
+    """Compresses str/bytes bodies on write and transparently decompresses them on read"""
+
+    def __init__(self, storage, codec='gzip', level=None, min_size=DEFAULT_MIN_SIZE):
+        super().__init__(storage)
+        if codec not in CODECS:
+            raise ValueError(f"Unknown compression codec '{codec}'.")
+        if codec == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package.")
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+
+    def __compress(self, data):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level or 3).compress(data)
+        return gzip.compress(data, compresslevel=self.level or 6)
+
+    def __encode(self, body, kwargs):
+        #file-like and iterator bodies are streamed through untouched
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not isinstance(body, (bytes, bytearray)) or len(body) < self.min_size:
+            return body, kwargs
+        compressed = self.__compress(body)
+        if len(compressed) >= len(body):
+            return body, kwargs
+        metadata = dict(kwargs.get('Metadata') or {})
+        metadata[CODEC_METADATA_KEY] = self.codec
+        return compressed, dict(kwargs, Metadata=metadata)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        body, kwargs = self.__encode(body, kwargs)
+        return self.storage.put(key, body, contenttype, **kwargs)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        body, kwargs = self.__encode(body, kwargs)
+        return self.storage.update(key, body, contenttype, **kwargs)
+
+    def get(self, key):
+        return _decode(self.storage.get(key))
+
+    def get_if_changed(self, key, etag):
+        return _decode(self.storage.get_if_changed(key, etag))
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        #every body is compressed on its own, the wrapped storage writes them as one batch
+        encoded = []
+        for key, body, options in batch_items(items, kwargs):
+            body, options = self.__encode(body, options)
+            encoded.append((key, body, options))
+        return self.storage.put_many(encoded, contenttype)
+
+    def get_many(self, keys):
+        return [_decode_result(result) for result in self.storage.get_many(keys)]
+
+    def presign(self, key, method='GET', expires=300, contenttype=None, **params):
+        #a compressed object is served with a Content-Encoding header so clients decode it on the fly
+        if method.upper() == 'GET' and 'ResponseContentEncoding' not in params:
+            info = self.storage.stat(key)
+            if info and _codec(info):
+                params['ResponseContentEncoding'] = _codec(info)
+        return self.storage.presign(key, method, expires, contenttype, **params)
+
+    def get_stream(self, key, chunk_size=64 * 1024):
+        #objects stored without a codec stream straight from the wrapped storage, compressed ones are decoded whole
+        info = self.storage.stat(key)
+        if not info or not _codec(info):
+            return self.storage.get_stream(key, chunk_size)
+        response = self.get(key)
+        if not response:
+            return response
+        return _iter_reader(response['Body'], chunk_size)
+
+    def get_range(self, key, start, end=None):
+        #byte offsets refer to the uncompressed body, so compressed objects are read whole
+        info = self.storage.stat(key)
+        if not info or not _codec(info):
+            return self.storage.get_range(key, start, end)
+        response = self.get(key)
+        if not response:
+            return response
+        data = response['Body'].read()
+        return data[start:] if end is None else data[start:end + 1]
+
+
+def _codec(response):
+    return (response.get('Metadata') or {}).get(CODEC_METADATA_KEY)
+
+
+def _decode(response):
+    #objects written before compression was enabled carry no codec and pass through
+    if not response:
+        return response
+    codec = _codec(response)
+    if not codec:
+        return response
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Reading zstd-compressed objects requires the 'zstandard' package.")
+        body = zstandard.ZstdDecompressor().stream_reader(response['Body'])
+    else:
+        body = gzip.GzipFile(fileobj=response['Body'], mode='rb')
+    decoded = {name: value for name, value in response.items() if name != 'ContentLength'}
+    decoded['Body'] = body
+    return decoded
+
+
+def _decode_result(result):
+    if result.error is not None:
+        return result
+    try:
+        return result._replace(value=_decode(result.value))
+    except Exception as e:
+        return BatchResult(result.key, None, e)
+
+
+def _iter_reader(body, chunk_size):
+    with body:
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
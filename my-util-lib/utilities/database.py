@@ -1,24 +1,248 @@
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from flask import g, has_app_context
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
+from sqlalchemy.sql import Select
 from sqlalchemy.exc import SQLAlchemyError
+from .querystats import instrument, instrument_app
 from abc import ABC, abstractmethod
+import threading
+import time
+import os
+
+#connection pool settings, overridable from the environment or per Database
+POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+#connections older than this many seconds are replaced, -1 keeps them forever
+POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+#LIFO reuses the warmest connections and lets idle ones time out on the server
+POOL_USE_LIFO = os.getenv("DATABASE_POOL_USE_LIFO", "true").lower() in ("1", "true", "yes")
+POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+#comma separated read replica URLs, reads are spread over them when set
+REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+#seconds between health checks of a replica, a replica that failed is skipped until its next check
+REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 30))
+
+#process-wide registry of engines, so every Database on the same URL shares one pool
+_engines = {}
+_engines_lock = threading.Lock()
+#same for replica sets, so their health is tracked once per process
+_replica_sets = {}
+
+
+def get_engine(database_url, pool_size=None, max_overflow=None, pool_timeout=None, pool_recycle=None,
+               pool_use_lifo=None, pool_pre_ping=None):
+    """Return the shared engine for a database URL, creating it on first use"""
+    options = {
+        'pool_pre_ping': POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping,
+        'pool_recycle': POOL_RECYCLE if pool_recycle is None else pool_recycle,
+    }
+    #sqlite does not use a queue pool, the sizing options do not apply to it
+    if make_url(database_url).get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': POOL_SIZE if pool_size is None else pool_size,
+            'max_overflow': MAX_OVERFLOW if max_overflow is None else max_overflow,
+            'pool_timeout': POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+            'pool_use_lifo': POOL_USE_LIFO if pool_use_lifo is None else pool_use_lifo,
+        })
+    #the pid is part of the key so a forked worker never reuses its parent's connections
+    registry_key = (os.getpid(), database_url) + tuple(sorted(options.items()))
+    with _engines_lock:
+        engine = _engines.get(registry_key)
+        if engine is None:
+            engine = create_engine(database_url, **options)
+            #every statement is timed and counted against the request that ran it
+            instrument(engine)
+            _engines[registry_key] = engine
+        return engine
+
+
+class ReplicaSet:
+    """Round-robin over the read replicas that passed their last health check
+
+    Replicas start out healthy and are checked by a background thread, first when
+    the set is used and then every check_interval seconds, so neither building the
+    set nor picking a replica waits on a health check.
+    """
+
+    def __init__(self, engines, check_interval=REPLICA_CHECK_INTERVAL):
+        self.engines = list(engines)
+        #0 turns the periodic checks off, replicas are then only checked once in the background
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health = {engine: True for engine in self.engines}
+        self._checker_pid = None
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self.__on_error)
+
+    def __on_error(self, context):
+        #a lost connection takes the replica out of rotation until its next check
+        if context.is_disconnect and context.engine in self._health:
+            self.__set_health(context.engine, False)
+
+    def __set_health(self, engine, healthy):
+        with self._lock:
+            self._health[engine] = healthy
+
+    def check(self, engine):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            healthy = True
+        except Exception as e:
+            print(f"Read replica {engine.url.render_as_string(hide_password=True)} is unhealthy: {e}")
+            healthy = False
+        self.__set_health(engine, healthy)
+        return healthy
+
+    def check_all(self):
+        for engine in self.engines:
+            self.check(engine)
+
+    def __run(self):
+        #the first check runs straight away, sets are built at import and an unreachable replica must not hold that up
+        while True:
+            self.check_all()
+            if self.check_interval <= 0:
+                return
+            time.sleep(self.check_interval)
+
+    def __ensure_checker(self):
+        #started on first use, and again in a forked worker since threads do not survive a fork
+        if self._checker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+        threading.Thread(target=self.__run, name="replica-health", daemon=True).start()
+
+    def healthy(self):
+        with self._lock:
+            return [engine for engine in self.engines if self._health[engine]]
+
+    def pick(self):
+        """Next healthy replica by the last known health, None when every replica is down"""
+        self.__ensure_checker()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next % len(self.engines)]
+                self._next += 1
+                if self._health[engine]:
+                    return engine
+        return None
+
+
+def get_replica_set(replica_urls, check_interval=None, **pool_options):
+    """Return the shared ReplicaSet for a list of replica URLs"""
+    check_interval = REPLICA_CHECK_INTERVAL if check_interval is None else check_interval
+    engines = [get_engine(url, **pool_options) for url in replica_urls]
+    registry_key = (check_interval,) + tuple(engines)
+    with _engines_lock:
+        replicas = _replica_sets.get(registry_key)
+        if replicas is None:
+            replicas = ReplicaSet(engines, check_interval)
+            _replica_sets[registry_key] = replicas
+        return replicas
+
+
+#session.info key set once a session has written, its later reads stay on the primary
+PINNED = 'pinned_to_primary'
+#session.info key holding the replica a session reads from, picked on its first read, None when all were down
+REPLICA = 'replica'
+
+
+def _is_read(clause):
+    #plain SELECTs only, anything else (writes, locking reads, raw SQL) needs the primary
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """Session sending reads to a replica and writes, and everything after them, to the primary
+
+    A session sticks to the replica of its first read until it is closed, so one request
+    holds at most one replica connection besides the primary.
+    """
+
+    def __init__(self, replicas=None, **kwargs):
+        super().__init__(**kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.replicas is None or self.info.get(PINNED):
+            return primary
+        if self._flushing or not _is_read(clause):
+            self.info[PINNED] = True
+            return primary
+        if REPLICA not in self.info:
+            self.info[REPLICA] = self.replicas.pick()
+        return self.info[REPLICA] or primary
+
+    def close(self):
+        #a closed session picks a replica again on its next read
+        self.info.pop(REPLICA, None)
+        super().close()
+
+
+def _scope():
+    #one session per Flask app context (one per request), or per thread outside of one
+    if has_app_context():
+        return id(g._get_current_object())
+    return threading.get_ident()
+
 
 class Database:
-    def __init__(self, database_url):
-        self.__db = SQLAlchemy()
-        self.__engine = create_engine(database_url, pool_pre_ping=True)
-        self._Session = sessionmaker(bind=self.__engine)
-        self._session = self._Session()
-    
-    #initializing flask app with db
+    def __init__(self, database_url, replica_urls=None, replica_check_interval=None, **pool_options):
+        self.__engine = get_engine(database_url, **pool_options)
+        replica_urls = REPLICA_URLS if replica_urls is None else replica_urls
+        #without replicas every session is bound to the primary only
+        self.__replicas = None
+        if replica_urls:
+            self.__replicas = get_replica_set(replica_urls, replica_check_interval, **pool_options)
+        self._Session = scoped_session(
+            sessionmaker(bind=self.__engine, class_=RoutingSession, replicas=self.__replicas), scopefunc=_scope
+        )
+        self.__session = None
+
+    @property
+    def _session(self):
+        #the session of the current request
+        if self.__session is not None:
+            return self.__session
+        return self._Session()
+
+    @_session.setter
+    def _session(self, session):
+        #pins every caller to one session, used by tests and scripts that manage their own
+        self.__session = session
+
+    #ties sessions to the flask app context, they are rolled back if the request failed and always closed
     def app(self, flask_app):
-        self.__db.init_app(flask_app)
-    
+        flask_app.teardown_appcontext(self.teardown)
+        instrument_app(flask_app)
+
+    def teardown(self, exception=None):
+        if exception is not None and self._Session.registry.has():
+            self._Session().rollback()
+        self._Session.remove()
+
     @property
     def engine(self):
         return self.__engine
 
+    @property
+    def replicas(self):
+        return self.__replicas
+
+    #sends the rest of the current request to the primary, for reads that must see the latest writes
+    def pin_primary(self):
+        self._session.info[PINNED] = True
+
+    def commit(self):
+        self._session.commit()
+
     def rollback(self):
         self._session.rollback()
-
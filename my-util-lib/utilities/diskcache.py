@@ -0,0 +1,276 @@
+from .storagebase import StorageWrapper
+from collections import OrderedDict
+from hashlib import sha256
+import threading
+import time
+import json
+import tempfile
+import shutil
+import os
+
+#default upper bound on the bytes kept on disk
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+#seconds a cached body is served without asking storage, after that it is revalidated by ETag
+DEFAULT_TTL = 30
+#bodies are copied to disk in chunks of this size, never buffered whole
+COPY_CHUNK_SIZE = 1024 * 1024
+#headers saved next to each cached body, enough to serve it without asking storage
+CACHED_HEADERS = ('ETag', 'ContentType', 'ContentLength', 'ContentEncoding', 'Metadata')
+HEADERS_SUFFIX = '.headers'
+
+
+class DiskCache(StorageWrapper):
+    """Read-through cache of object bodies on local disk, keyed by bucket/key/ETag"""
+
+    def __init__(self, storage, directory, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        super().__init__(storage)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        #with a ttl of 0 every read is a conditional GET, which is never stale
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        #path -> size, least recently used first
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        #key directory -> cached body paths, so dropping a key never walks the whole index
+        self._by_key = {}
+        #key directory -> (path, headers, monotonic time the path was last confirmed current)
+        self._current = {}
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+
+    def __load(self):
+        #rebuilds the LRU index from whatever a previous process left on disk
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if name.startswith('.tmp'):
+                        os.remove(path)
+                        continue
+                    if name.endswith(HEADERS_SUFFIX):
+                        continue
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((info.st_mtime, path, info.st_size))
+        with self._lock:
+            for _, path, size in sorted(found):
+                self.__index(path, size)
+            self.__evict()
+
+    def __key_dir(self, key):
+        digest = sha256(f"{self.bucket}/{key}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def __entry_path(self, key, etag):
+        return os.path.join(self.__key_dir(key), sha256(etag.encode('utf-8')).hexdigest())
+
+    def __index(self, path, size):
+        #caller holds the lock
+        self._total_bytes -= self._entries.pop(path, 0)
+        self._entries[path] = size
+        self._total_bytes += size
+        self._by_key.setdefault(os.path.dirname(path), set()).add(path)
+
+    def __forget(self, path):
+        #caller holds the lock
+        self._total_bytes -= self._entries.pop(path, 0)
+        key_dir = os.path.dirname(path)
+        paths = self._by_key.get(key_dir)
+        if paths is not None:
+            paths.discard(path)
+            if not paths:
+                del self._by_key[key_dir]
+        current = self._current.get(key_dir)
+        if current is not None and current[0] == path:
+            del self._current[key_dir]
+
+    def __evict(self):
+        #caller holds the lock
+        while self._total_bytes > self.max_bytes and self._entries:
+            path = next(iter(self._entries))
+            self.__forget(path)
+            for stale in (path, path + HEADERS_SUFFIX):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def __touch(self, path):
+        try:
+            #mtime carries the recency over to the next process that loads the index
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+            else:
+                #written by another process sharing the directory
+                self.__index(path, size)
+                self.__evict()
+
+    def __write_file(self, path, write):
+        #writes to a temp file next to the final location and renames it into place
+        handle, temp_path = tempfile.mkstemp(prefix='.tmp', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                write(temp_file)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def __store(self, path, body, headers):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #the headers go first, a body is never on disk without them
+        self.__write_file(path + HEADERS_SUFFIX, lambda file: file.write(json.dumps(headers).encode('utf-8')))
+        self.__write_file(path, lambda file: shutil.copyfileobj(body, file, COPY_CHUNK_SIZE))
+        size = os.path.getsize(path)
+        with self._lock:
+            self.__index(path, size)
+            self._current[os.path.dirname(path)] = (path, headers, time.monotonic())
+            self.__evict()
+
+    def __read_headers(self, path):
+        try:
+            with open(path + HEADERS_SUFFIX, 'rb') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def __latest(self, key_dir):
+        #the most recently used version a previous process cached for this key
+        with self._lock:
+            paths = list(self._by_key.get(key_dir, ()))
+        newest = None
+        for path in paths:
+            try:
+                mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if newest is None or mtime > newest[0]:
+                newest = (mtime, path)
+        return newest[1] if newest else None
+
+    def __serve(self, path, headers, confirmed):
+        #opens a cached body, None when it was evicted or invalidated underneath us
+        try:
+            body = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        self.__touch(path)
+        with self._lock:
+            if path in self._entries:
+                current = self._current.get(os.path.dirname(path))
+                checked_at = time.monotonic() if confirmed or current is None else current[2]
+                self._current[os.path.dirname(path)] = (path, headers, checked_at)
+        return dict(headers, Body=body)
+
+    def invalidate(self, key):
+        #for objects changed behind the storage's back, such as direct uploads
+        self.__drop(key)
+        self.storage.invalidate(key)
+
+    def __drop(self, key):
+        #drops every cached version of a key
+        key_dir = self.__key_dir(key)
+        with self._lock:
+            for path in list(self._by_key.get(key_dir, ())):
+                self.__forget(path)
+            self._current.pop(key_dir, None)
+        shutil.rmtree(key_dir, ignore_errors=True)
+
+    def get(self, key):
+        key_dir = self.__key_dir(key)
+        with self._lock:
+            current = self._current.get(key_dir)
+
+        #a body confirmed current within the ttl is served without any request
+        if current is not None:
+            path, headers, checked_at = current
+            if time.monotonic() - checked_at < self.ttl:
+                response = self.__serve(path, headers, confirmed=False)
+                if response is not None:
+                    return response
+        else:
+            path = self.__latest(key_dir)
+            headers = self.__read_headers(path) if path else None
+
+        #otherwise a conditional GET, the body only crosses the network when it changed
+        if path is not None and headers and headers.get('ETag'):
+            response = self.storage.get_if_changed(key, headers['ETag'])
+            if response is None:
+                cached = self.__serve(path, headers, confirmed=True)
+                if cached is not None:
+                    return cached
+                response = self.storage.get(key)
+        else:
+            response = self.storage.get(key)
+        return self.__fill(key, response)
+
+    def __fill(self, key, response):
+        if not response or not response.get('ETag'):
+            return response
+        size = response.get('ContentLength')
+        if size is not None and size > self.max_bytes:
+            return response
+
+        path = self.__entry_path(key, response['ETag'])
+        headers = {name: response[name] for name in CACHED_HEADERS if response.get(name) is not None}
+        try:
+            self.__store(path, response['Body'], headers)
+            return dict(response, Body=open(path, 'rb'))
+        except OSError as e:
+            #the entry was invalidated or evicted underneath us, serve this read uncached
+            print(f"Error caching file: {e}")
+            return self.storage.get(key)
+        finally:
+            response['Body'].close()
+
+    def get_stream(self, key, chunk_size=COPY_CHUNK_SIZE):
+        response = self.get(key)
+        if not response:
+            return response
+        return _iter_file(response['Body'], chunk_size)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.put(key, body, contenttype, **kwargs)
+        finally:
+            self.__drop(key)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.update(key, body, contenttype, **kwargs)
+        finally:
+            self.__drop(key)
+
+    def delete(self, key):
+        try:
+            return self.storage.delete(key)
+        finally:
+            self.__drop(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        try:
+            return self.storage.delete_many(keys)
+        finally:
+            for key in keys:
+                self.__drop(key)
+
+
+def _iter_file(body, chunk_size):
+    with body:
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,327 @@
+from .storagebase import Storage
+from .meteredstorage import record_error
+from datetime import datetime, timezone
+from hashlib import md5
+import threading
+import tempfile
+import json
+import mmap
+import os
+
+#objects at least this large are read through a memory map instead of buffered file reads
+MMAP_THRESHOLD = int(os.getenv("FILESYSTEM_MMAP_THRESHOLD", 1024 * 1024))
+#'always' syncs the file and its directory, 'file' only the file, 'never' leaves it to the OS
+FSYNC_POLICY = os.getenv("FILESYSTEM_FSYNC", "always").lower()
+FSYNC_POLICIES = ('always', 'file', 'never')
+
+#size of the chunks bodies are written and streamed in
+CHUNK_SIZE = 1024 * 1024
+
+OBJECTS_DIR = 'objects'
+METADATA_DIR = 'metadata'
+
+
+class FileSystem(Storage):
+    """Storage backend keeping objects as plain files under a root directory, using the same key layout as R2
+
+    Object bodies live under <root>/objects/<key> and their headers under <root>/metadata/<key>.json.
+    """
+
+    def __init__(self, root, fsync=FSYNC_POLICY, mmap_threshold=MMAP_THRESHOLD):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'.")
+        self.root = os.path.abspath(root)
+        self.bucket = self.root
+        self.fsync = fsync
+        self.mmap_threshold = mmap_threshold
+        self._objects = os.path.join(self.root, OBJECTS_DIR)
+        self._metadata = os.path.join(self.root, METADATA_DIR)
+        #writes to one key are serialized so a body and its headers always come from the same write
+        self._locks = [threading.Lock() for _ in range(64)]
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._metadata, exist_ok=True)
+
+    #paths
+    def __path(self, base, key, suffix=""):
+        parts = key.split('/')
+        if not key or any(part in ('', '.', '..') for part in parts):
+            raise ValueError(f"Invalid storage key '{key}'.")
+        return os.path.join(base, *parts) + suffix
+
+    def __object_path(self, key):
+        return self.__path(self._objects, key)
+
+    def __metadata_path(self, key):
+        return self.__path(self._metadata, key, ".json")
+
+    def __lock(self, key):
+        return self._locks[hash(key) % len(self._locks)]
+
+    #writing
+    def __sync_dir(self, directory):
+        if self.fsync != 'always':
+            return
+        handle = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(handle)
+        finally:
+            os.close(handle)
+
+    def __write_file(self, path, chunks):
+        #writes to a temp file next to the target and renames it into place, readers never see a partial file
+        directory = os.path.dirname(path)
+        for attempt in range(3):
+            os.makedirs(directory, exist_ok=True)
+            try:
+                handle, temp_path = tempfile.mkstemp(prefix='.tmp', dir=directory)
+                break
+            except FileNotFoundError:
+                #a delete pruned the directory between the two calls
+                if attempt == 2:
+                    raise
+        digest, size = md5(), 0
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                for chunk in chunks:
+                    temp_file.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                if self.fsync != 'never':
+                    temp_file.flush()
+                    os.fsync(temp_file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.__sync_dir(directory)
+        return f'"{digest.hexdigest()}"', size
+
+    def __upload(self, key, body, contenttype, kwargs):
+        object_path = self.__object_path(key)
+        metadata_path = self.__metadata_path(key)
+        with self.__lock(key):
+            etag, size = self.__write_file(object_path, _chunks(body))
+            headers = {
+                'ContentType': contenttype or 'binary/octet-stream',
+                'ETag': etag,
+                'Metadata': dict(kwargs.get('Metadata') or {}),
+            }
+            self.__write_file(metadata_path, [json.dumps(headers).encode('utf-8')])
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        #body may be a str, bytes, a file-like object or an iterator of chunks
+        try:
+            self.__upload(key, body, contenttype, kwargs)
+            return True
+        except Exception as e:
+            print(f"Error uploading file: {e}")
+            record_error("put", e)
+            return False
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            self.__upload(key, body, contenttype, kwargs)
+            return True
+        except Exception as e:
+            print(f"Error updating file: {e}")
+            record_error("update", e)
+            return False
+
+    #reading
+    def __headers(self, key, info):
+        try:
+            with open(self.__metadata_path(key), 'rb') as metadata_file:
+                headers = json.load(metadata_file)
+        except (FileNotFoundError, ValueError):
+            #written by hand or by an interrupted write, the body is still served
+            headers = {'ContentType': 'binary/octet-stream', 'ETag': None, 'Metadata': {}}
+        return {
+            'ContentLength': info.st_size,
+            'ContentType': headers.get('ContentType'),
+            'ETag': headers.get('ETag'),
+            'LastModified': datetime.fromtimestamp(info.st_mtime, timezone.utc),
+            'Metadata': headers.get('Metadata', {}),
+        }
+
+    def __open(self, key):
+        #large bodies are memory-mapped so reads are served straight from the page cache
+        path = self.__object_path(key)
+        with self.__lock(key):
+            body = open(path, 'rb')
+            info = os.fstat(body.fileno())
+            headers = self.__headers(key, info)
+        if 0 < info.st_size and info.st_size >= self.mmap_threshold:
+            with body:
+                body = mmap.mmap(body.fileno(), 0, access=mmap.ACCESS_READ)
+        return dict(headers, Body=body)
+
+    def get(self, key):
+        try:
+            return self.__open(key)
+        except Exception as e:
+            print(f"Error getting file: {e}")
+            record_error("get", e)
+            return False
+
+    def get_if_changed(self, key, etag):
+        info = self.stat(key)
+        if info is not None and info.get('ETag') is not None and info['ETag'] == etag:
+            return None
+        return self.get(key)
+
+    def get_stream(self, key, chunk_size=CHUNK_SIZE):
+        try:
+            response = self.__open(key)
+        except Exception as e:
+            print(f"Error streaming file: {e}")
+            record_error("get_stream", e)
+            return False
+        return _iter_body(response['Body'], chunk_size)
+
+    def get_range(self, key, start, end=None):
+        #returns the bytes between start and end (inclusive), or up to the end of the object
+        try:
+            with open(self.__object_path(key), 'rb') as body:
+                size = os.fstat(body.fileno()).st_size
+                stop = size if end is None else min(end + 1, size)
+                if start >= stop:
+                    return b""
+                if size >= self.mmap_threshold:
+                    with mmap.mmap(body.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        return mapped[start:stop]
+                body.seek(start)
+                return body.read(stop - start)
+        except Exception as e:
+            print(f"Error reading file range: {e}")
+            record_error("get_range", e)
+            return False
+
+    def stat(self, key):
+        #returns None if the object does not exist
+        try:
+            info = os.stat(self.__object_path(key))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading file headers: {e}")
+            record_error("stat", e)
+            return None
+        return self.__headers(key, info)
+
+    #deleting
+    def __remove(self, key):
+        with self.__lock(key):
+            for path, base in ((self.__object_path(key), self._objects), (self.__metadata_path(key), self._metadata)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                _prune_dirs(os.path.dirname(path), base)
+
+    def delete(self, key):
+        #deleting a missing key succeeds, as it does on R2
+        try:
+            self.__remove(key)
+            return True
+        except Exception as e:
+            print(f"Error deleting file: {e}")
+            record_error("delete", e)
+            return False
+
+    def delete_many(self, keys):
+        #returns a dict of {key: error} for every key that could not be deleted
+        failures = {}
+        for key in keys:
+            try:
+                self.__remove(key)
+            except Exception as e:
+                record_error("delete_many", e)
+                failures[key] = str(e)
+        return failures
+
+    #listing
+    def iter_objects(self, prefix, page_size=1000):
+        #only the deepest directory the prefix names is walked, keys come out in lexicographic order
+        #errors are raised to the caller so a partial listing is never mistaken for a full one
+        directory_prefix = prefix[:prefix.rfind('/') + 1]
+        if any(part in ('.', '..') for part in directory_prefix.split('/')):
+            raise ValueError(f"Invalid storage prefix '{prefix}'.")
+        start = os.path.join(self._objects, *directory_prefix.split('/'))
+        if not os.path.isdir(start):
+            return
+        for key, entry in self.__walk(start, directory_prefix):
+            if key.startswith(prefix):
+                info = entry.stat()
+                yield {
+                    'Key': key,
+                    'Size': info.st_size,
+                    'LastModified': datetime.fromtimestamp(info.st_mtime, timezone.utc),
+                }
+
+    def __walk(self, directory, key_prefix):
+        #directories are visited as "name/" so the order matches a flat sort of the keys
+        with os.scandir(directory) as scanner:
+            entries = sorted(
+                (entry.name + '/' if entry.is_dir() else entry.name, entry)
+                for entry in scanner if not entry.name.startswith('.tmp')
+            )
+        for name, entry in entries:
+            if name.endswith('/'):
+                yield from self.__walk(entry.path, key_prefix + name)
+            else:
+                yield key_prefix + name, entry
+
+    def list_files(self, prefix, file_extension=None):
+        try:
+            keys = [item['Key'] for item in self.iter_objects(prefix)]
+        except Exception as e:
+            print(f"Error listing files: {e}")
+            record_error("list_files", e)
+            return []
+        if not file_extension:
+            return keys
+        return [
+            key.replace(prefix, "").replace(file_extension, "").replace("/", "")
+            for key in keys if key.endswith(file_extension)
+        ]
+
+
+def _chunks(body):
+    #normalizes every accepted body type to an iterator of bytes
+    if body is None:
+        return
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if isinstance(body, (bytes, bytearray)):
+        yield bytes(body)
+        return
+    if hasattr(body, 'read'):
+        while True:
+            chunk = body.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    for chunk in body:
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _iter_body(body, chunk_size):
+    with body:
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _prune_dirs(directory, base):
+    #removes directories left empty by a delete, so prefix listings do not walk dead branches
+    while directory != base and directory.startswith(base):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return
+        directory = os.path.dirname(directory)
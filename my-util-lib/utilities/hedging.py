@@ -0,0 +1,123 @@
+from .storagebase import StorageWrapper
+from .resilience import RetryBudget
+from .metrics import registry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import threading
+import time
+import io
+import os
+
+#hedged reads run on their own pool, never on the batch pool a get_many caller may be sitting on
+HEDGE_WORKERS = int(os.getenv("STORAGE_HEDGE_WORKERS", 32))
+_executor = None
+_executor_lock = threading.Lock()
+
+#a second request is sent once the first has been slower than this percentile of recent reads
+DEFAULT_PERCENTILE = 0.95
+#at most this fraction of reads may be hedged
+DEFAULT_MAX_FRACTION = 0.05
+DEFAULT_MIN_DELAY = 0.01
+#delay used until enough reads have been observed
+DEFAULT_INITIAL_DELAY = 0.1
+DEFAULT_WINDOW = 1000
+MIN_SAMPLES = 20
+
+hedged_requests = registry.counter(
+    'storage_hedged_requests_total', 'Reads that sent a second, hedged request.', ('operation',)
+)
+hedge_wins = registry.counter(
+    'storage_hedge_wins_total', 'Hedged reads answered first by the second request.', ('operation',)
+)
+
+
+def hedge_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="storage-hedge")
+    return _executor
+
+
+class HedgedStorage(StorageWrapper):
+    """Sends a second GET when the first one is slower than usual and returns whichever answers first"""
+
+    def __init__(self, storage, percentile=DEFAULT_PERCENTILE, max_fraction=DEFAULT_MAX_FRACTION,
+                 min_delay=DEFAULT_MIN_DELAY, initial_delay=DEFAULT_INITIAL_DELAY, window=DEFAULT_WINDOW, burst=10):
+        super().__init__(storage)
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        #latencies of recent successful reads, from which the hedge delay is derived
+        self._latencies = deque(maxlen=window)
+        self._observed = 0
+        self._delay = initial_delay
+        #each read earns max_fraction of a hedge, up to burst hedges saved up
+        self._budget = RetryBudget(ratio=max_fraction, min_per_second=0, max_tokens=burst)
+
+    @property
+    def delay(self):
+        with self._lock:
+            return self._delay
+
+    def __observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._observed += 1
+            #sorting the window on every read is wasteful, the percentile drifts slowly
+            if len(self._latencies) >= MIN_SAMPLES and self._observed % 16 == 0:
+                ordered = sorted(self._latencies)
+                self._delay = max(self.min_delay, ordered[int(self.percentile * (len(ordered) - 1))])
+
+    def __fetch(self, call, args):
+        #the body is read here so a stall while streaming it is hedged too
+        started = time.perf_counter()
+        response = call(*args)
+        if response and response.get('Body') is not None:
+            body = response['Body']
+            try:
+                data = body.read()
+            finally:
+                body.close()
+            response = dict(response, Body=io.BytesIO(data))
+        if response is not False:
+            self.__observe(time.perf_counter() - started)
+        return response
+
+    def __hedged(self, operation, call, *args):
+        self._budget.deposit()
+        primary = hedge_executor().submit(self.__fetch, call, args)
+        done, _ = wait([primary], timeout=self.delay)
+        if done or not self._budget.withdraw():
+            return primary.result()
+
+        hedged_requests.inc(operation=operation)
+        backup = hedge_executor().submit(self.__fetch, call, args)
+        pending = {primary, backup}
+        failed, error = False, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                result = future.result()
+                if result is False:
+                    failed = True
+                    continue
+                #a request already running cannot be aborted, its buffered answer is dropped
+                for other in pending:
+                    other.cancel()
+                if future is backup:
+                    hedge_wins.inc(operation=operation)
+                return result
+        if failed or error is None:
+            return False
+        raise error
+
+    def get(self, key):
+        return self.__hedged('get', self.storage.get, key)
+
+    def get_if_changed(self, key, etag):
+        return self.__hedged('get_if_changed', self.storage.get_if_changed, key, etag)
@@ -0,0 +1,174 @@
+from .storagebase import StorageWrapper, BatchResult
+from collections import OrderedDict
+import threading
+import time
+import io
+
+#defaults sized for many small objects such as project metadata.json files
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_OBJECT_BYTES = 256 * 1024
+#upper bound on the bytes held by the whole cache, screenplays compete with metadata for it
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class _Entry:
+    def __init__(self, body, headers):
+        self.body = body
+        self.headers = headers
+        self.checked_at = time.monotonic()
+
+
+class MemoryCache(StorageWrapper):
+    """In-process LRU cache of small objects, revalidated by ETag once the TTL expires"""
+
+    def __init__(self, storage, ttl=0, max_entries=DEFAULT_MAX_ENTRIES, max_object_bytes=DEFAULT_MAX_OBJECT_BYTES,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(storage)
+        #with a ttl of 0 every read is a conditional GET, which is never stale
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+            }
+
+    def invalidate(self, key):
+        #for objects changed behind the storage's back, such as direct uploads
+        self.__drop(key)
+        self.storage.invalidate(key)
+
+    def __drop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= len(entry.body)
+
+    def __fresh(self, key):
+        #returns (entry, fresh), fresh entries are served without asking storage
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            if time.monotonic() - entry.checked_at < self.ttl:
+                self.hits += 1
+                return entry, True
+            return entry, False
+
+    def get(self, key):
+        entry, fresh = self.__fresh(key)
+        if fresh:
+            return _response(entry)
+
+        if entry is not None:
+            response = self.storage.get_if_changed(key, entry.headers['ETag'])
+            if response is None:
+                with self._lock:
+                    self.revalidations += 1
+                    entry.checked_at = time.monotonic()
+                return _response(entry)
+        else:
+            response = self.storage.get(key)
+
+        return self.__fetched(key, response)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        results = [None] * len(keys)
+        misses = []
+        for index, key in enumerate(keys):
+            entry, fresh = self.__fresh(key)
+            if fresh:
+                results[index] = BatchResult(key, _response(entry), None)
+            else:
+                misses.append(index)
+        #everything not fresh is read whole in one batch of the wrapped storage
+        if misses:
+            fetched = self.storage.get_many([keys[index] for index in misses])
+            for index, result in zip(misses, fetched):
+                if result.error is None:
+                    result = result._replace(value=self.__fetched(result.key, result.value))
+                results[index] = result
+        return results
+
+    def __fetched(self, key, response):
+        with self._lock:
+            self.misses += 1
+        if not response:
+            self.__drop(key)
+            return response
+        return self.__remember(key, response)
+
+    def __remember(self, key, response):
+        size = response.get('ContentLength')
+        if not response.get('ETag') or size is None or size > self.max_object_bytes:
+            self.__drop(key)
+            return response
+
+        body = response['Body'].read()
+        headers = {name: value for name, value in response.items() if name != 'Body'}
+        entry = _Entry(body, headers)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous.body)
+            self._entries[key] = entry
+            self._total_bytes += len(body)
+            #least recently used entries go first, until both the count and the bytes fit
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted.body)
+        return _response(entry)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.put(key, body, contenttype, **kwargs)
+        finally:
+            self.__drop(key)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.update(key, body, contenttype, **kwargs)
+        finally:
+            self.__drop(key)
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        items = list(items)
+        try:
+            return self.storage.put_many(items, contenttype, **kwargs)
+        finally:
+            for item in items:
+                self.__drop(item[0])
+
+    def delete(self, key):
+        try:
+            return self.storage.delete(key)
+        finally:
+            self.__drop(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        try:
+            return self.storage.delete_many(keys)
+        finally:
+            for key in keys:
+                self.__drop(key)
+
+
+def _response(entry):
+    #every caller gets its own file object over the shared bytes
+    return dict(entry.headers, Body=io.BytesIO(entry.body))
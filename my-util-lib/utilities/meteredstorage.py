@@ -0,0 +1,186 @@
+from .storagebase import StorageWrapper
+from .metrics import registry
+import time
+import os
+
+operation_seconds = registry.histogram(
+    'storage_operation_duration_seconds', 'Latency of storage operations.', ('operation', 'prefix')
+)
+bytes_in = registry.counter(
+    'storage_bytes_read_total', 'Object bytes handed to callers by storage reads.', ('operation', 'prefix')
+)
+bytes_out = registry.counter(
+    'storage_bytes_written_total', 'Object bytes passed to storage writes.', ('operation', 'prefix')
+)
+errors = registry.counter(
+    'storage_errors_total', 'Failed storage operations by exception class.', ('operation', 'error')
+)
+in_flight = registry.gauge(
+    'storage_operations_in_flight', 'Storage operations currently running.', ('operation',)
+)
+
+
+def record_error(operation, error):
+    #backends that swallow their exceptions report them here before returning False
+    errors.inc(operation=operation, error=type(error).__name__)
+
+
+def key_family(key):
+    """Collapse the ids in a key so it can be used as a metric label.
+
+    users/<id>/projects/<id>/metadata.json -> users/*/projects/*/*.json
+    """
+    parts = key.split('/')
+    family = []
+    last = len(parts) - 1
+    for index, part in enumerate(parts):
+        if not part:
+            family.append(part)
+        elif index == last and index > 0:
+            #file names keep only their extension
+            family.append('*' + os.path.splitext(part)[1])
+        elif index > 0 and parts[index - 1] in ('users', 'projects', 'scripts'):
+            family.append('*')
+        else:
+            family.append(part)
+    return '/'.join(family)
+
+
+class _CountingBody:
+    #file object proxy that counts the bytes the caller actually reads
+    def __init__(self, body, operation, prefix):
+        self._body = body
+        self._labels = {'operation': operation, 'prefix': prefix}
+
+    def read(self, *args, **kwargs):
+        data = self._body.read(*args, **kwargs)
+        bytes_in.inc(len(data), **self._labels)
+        return data
+
+    def __iter__(self):
+        for chunk in self._body:
+            bytes_in.inc(len(chunk), **self._labels)
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self._body, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._body.close()
+
+
+class MeteredStorage(StorageWrapper):
+    """Records latency, bytes, errors and concurrency for every storage operation"""
+
+    def __measure(self, operation, prefix, call, *args, **kwargs):
+        in_flight.inc(operation=operation)
+        started = time.perf_counter()
+        try:
+            return call(*args, **kwargs)
+        except Exception as e:
+            record_error(operation, e)
+            raise
+        finally:
+            operation_seconds.observe(time.perf_counter() - started, operation=operation, prefix=prefix)
+            in_flight.dec(operation=operation)
+
+    def __write(self, operation, call, key, body, contenttype, kwargs):
+        prefix = key_family(key)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        result = self.__measure(operation, prefix, call, key, body, contenttype, **kwargs)
+        #only in-memory bodies have a known size, streamed ones are not counted
+        if result and isinstance(body, (bytes, bytearray)):
+            bytes_out.inc(len(body), operation=operation, prefix=prefix)
+        return result
+
+    def __read(self, operation, key, call, *args):
+        prefix = key_family(key)
+        response = self.__measure(operation, prefix, call, key, *args)
+        if response and response.get('Body') is not None:
+            response = dict(response, Body=_CountingBody(response['Body'], operation, prefix))
+        return response
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        return self.__write('put', self.storage.put, key, body, contenttype, kwargs)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        return self.__write('update', self.storage.update, key, body, contenttype, kwargs)
+
+    def get(self, key):
+        return self.__read('get', key, self.storage.get)
+
+    def get_if_changed(self, key, etag):
+        return self.__read('get_if_changed', key, self.storage.get_if_changed, etag)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        prefix = key_family(keys[0]) if keys else ''
+        results = self.__measure('get_many', prefix, self.storage.get_many, keys)
+        return [
+            result._replace(value=dict(result.value, Body=_CountingBody(result.value['Body'], 'get_many', prefix)))
+            if result.error is None and result.value and result.value.get('Body') is not None else result
+            for result in results
+        ]
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        items = list(items)
+        prefix = key_family(items[0][0]) if items else ''
+        results = self.__measure('put_many', prefix, self.storage.put_many, items, contenttype, **kwargs)
+        for item, result in zip(items, results):
+            body = item[1]
+            if result.error is None and result.value and isinstance(body, (str, bytes, bytearray)):
+                bytes_out.inc(len(body.encode('utf-8') if isinstance(body, str) else body), operation='put_many', prefix=prefix)
+        return results
+
+    def get_stream(self, key, *args, **kwargs):
+        #the latency covers the request up to the first byte, the body is counted as it is consumed
+        prefix = key_family(key)
+        chunks = self.__measure('get_stream', prefix, self.storage.get_stream, key, *args, **kwargs)
+        if not chunks:
+            return chunks
+        return _count_chunks(chunks, prefix)
+
+    def get_range(self, key, start, end=None):
+        prefix = key_family(key)
+        data = self.__measure('get_range', prefix, self.storage.get_range, key, start, end)
+        if data:
+            bytes_in.inc(len(data), operation='get_range', prefix=prefix)
+        return data
+
+    def stat(self, key):
+        return self.__measure('stat', key_family(key), self.storage.stat, key)
+
+    def delete(self, key):
+        return self.__measure('delete', key_family(key), self.storage.delete, key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        prefix = key_family(keys[0]) if keys else ''
+        return self.__measure('delete_many', prefix, self.storage.delete_many, keys)
+
+    def list_files(self, prefix, file_extension=None):
+        return self.__measure('list_files', key_family(prefix), self.storage.list_files, prefix, file_extension)
+
+    def iter_objects(self, prefix, *args, **kwargs):
+        #a listing is timed from the first request to the last page
+        family = key_family(prefix)
+        in_flight.inc(operation='iter_objects')
+        started = time.perf_counter()
+        try:
+            yield from self.storage.iter_objects(prefix, *args, **kwargs)
+        except Exception as e:
+            record_error('iter_objects', e)
+            raise
+        finally:
+            operation_seconds.observe(time.perf_counter() - started, operation='iter_objects', prefix=family)
+            in_flight.dec(operation='iter_objects')
+
+
+def _count_chunks(chunks, prefix):
+    for chunk in chunks:
+        bytes_in.inc(len(chunk), operation='get_stream', prefix=prefix)
+        yield chunk
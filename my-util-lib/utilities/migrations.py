@@ -0,0 +1,142 @@
+from sqlalchemy import inspect, text
+from collections import namedtuple
+import click
+
+#one schema change, steps run in order and are either SQL strings or callables taking a connection
+#concurrent migrations run outside a transaction so postgres can build indexes without locking writes
+Migration = namedtuple('Migration', ['version', 'name', 'steps', 'concurrent'], defaults=[False])
+
+
+def create_index(name, table, columns, unique=False):
+    """Migration step building an index, concurrently on postgres"""
+    def step(connection):
+        postgres = connection.dialect.name == 'postgresql'
+        if postgres:
+            #an interrupted concurrent build leaves an invalid index behind, it has to be rebuilt
+            invalid = connection.execute(text(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {'name': name}).first()
+            if invalid:
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        concurrently = "CONCURRENTLY " if postgres else ""
+        connection.execute(text(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX {concurrently}IF NOT EXISTS {name} "
+            f"ON {table} ({', '.join(columns)})"
+        ))
+    return step
+
+
+def drop_index(name):
+    def step(connection):
+        concurrently = "CONCURRENTLY " if connection.dialect.name == 'postgresql' else ""
+        connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+    return step
+
+
+def add_column(table, name, definition):
+    """Migration step adding a column to an existing table, skipped when the table already has it"""
+    def step(connection):
+        if name in {column['name'] for column in inspect(connection).get_columns(table)}:
+            return
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {definition}"))
+    return step
+
+
+class MigrationRunner:
+    """Applies a service's migrations in version order and records them in its own version table"""
+
+    def __init__(self, engine, migrations, table='schema_migrations'):
+        self.engine = engine
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.table = table
+        versions = [migration.version for migration in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError("Migration versions must be unique.")
+
+    def __ensure_table(self):
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, "
+                "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+            ))
+
+    def applied(self):
+        self.__ensure_table()
+        with self.engine.connect() as connection:
+            return {row[0] for row in connection.execute(text(f"SELECT version FROM {self.table}"))}
+
+    def pending(self):
+        applied = self.applied()
+        return [migration for migration in self.migrations if migration.version not in applied]
+
+    def __run_steps(self, connection, migration):
+        for step in migration.steps:
+            if callable(step):
+                step(connection)
+            else:
+                connection.execute(text(step))
+
+    def __record(self, connection, migration):
+        connection.execute(
+            text(f"INSERT INTO {self.table} (version, name) VALUES (:version, :name)"),
+            {'version': migration.version, 'name': migration.name},
+        )
+
+    def upgrade(self):
+        """Apply every pending migration, returns the ones that ran"""
+        ran = []
+        for migration in self.pending():
+            if migration.concurrent:
+                #every step commits on its own, steps are written to be safe to re-run
+                with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    self.__run_steps(connection, migration)
+                    self.__record(connection, migration)
+            else:
+                with self.engine.begin() as connection:
+                    self.__run_steps(connection, migration)
+                    self.__record(connection, migration)
+            ran.append(migration)
+        return ran
+
+
+def migrate_command(make_runner):
+    """Flask CLI command applying a service's pending migrations, make_runner builds its MigrationRunner"""
+    @click.command('migrate')
+    @click.option('--dry-run', is_flag=True, help="Only list the pending migrations.")
+    def migrate(dry_run):
+        runner = make_runner()
+        migrations = runner.pending() if dry_run else runner.upgrade()
+        for migration in migrations:
+            click.echo(f"{'pending' if dry_run else 'applied'} {migration.version:04d} {migration.name}")
+        if not migrations:
+            click.echo("schema is up to date")
+    return migrate
+
+
+def sequential_scans(bind, statement, params=None):
+    """Tables the database plans to scan in full for a statement
+
+    Used by tests to make sure the hot lookups stay on an index.
+    """
+    sql = str(statement.compile(bind=bind, compile_kwargs={'literal_binds': True})) if hasattr(statement, 'compile') else statement
+    with bind.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params or {}).scalar()
+            return sorted(_postgres_seq_scans(plan[0]['Plan']))
+        rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params or {}).all()
+    #sqlite reports full scans as "SCAN <table>" and index lookups as "SEARCH <table> USING INDEX ..."
+    scans = set()
+    for row in rows:
+        detail = row[-1].split()
+        if detail[0] == 'SCAN' and 'INDEX' not in detail:
+            scans.add(detail[1])
+    return sorted(scans)
+
+
+def _postgres_seq_scans(plan):
+    tables = {plan['Relation Name']} if plan.get('Node Type') == 'Seq Scan' else set()
+    for child in plan.get('Plans', []):
+        tables |= _postgres_seq_scans(child)
+    return tables
@@ -0,0 +1,81 @@
+from sqlalchemy import tuple_
+from datetime import datetime
+import base64
+import json
+import uuid
+import os
+
+#page size used when the client does not ask for one, and the most a client can ask for
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE_MAX", 1000))
+
+
+class PageRequestError(ValueError):
+    #the client asked for a page size or cursor that cannot be served
+    pass
+
+
+def page_size(value=None):
+    """Page size requested by a client, clamped to MAX_PAGE_SIZE"""
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise PageRequestError("Page size must be an integer.")
+    if size < 1:
+        raise PageRequestError("Page size must be positive.")
+    return min(size, MAX_PAGE_SIZE)
+
+
+def requested_page_size(value=None, cursor=None):
+    """Page size for a listing request, None when the client sent neither a page size nor a cursor
+
+    Those clients predate pagination and still get the whole listing.
+    """
+    if (value is None or value == '') and not cursor:
+        return None
+    return page_size(value)
+
+
+#cursors are opaque to clients, they hold the sort key of the last row of the previous page
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), str(row_id)]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except Exception:
+        raise PageRequestError("Invalid page cursor.")
+
+
+def keyset_page(query, created_column, id_column, cursor=None):
+    """The query ordered newest first and restricted to the rows after the cursor"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        #rows strictly after the cursor in (created_at desc, id desc) order, one row value
+        #comparison the planner can run as a single range scan on a (.., created_at, id) index
+        query = query.filter(tuple_(created_column, id_column) < (created_at, row_id))
+    return query.order_by(created_column.desc(), id_column.desc())
+
+
+def paginate(query, created_column, id_column, limit, cursor=None):
+    """Keyset pagination, newest first
+
+    The query must select both sort columns. Returns the rows of the page and the cursor
+    of the next one, None on the last page. Without a limit every row is returned at once.
+    """
+    query = keyset_page(query, created_column, id_column, cursor)
+    if limit is None:
+        return query.all(), None
+    #one extra row tells whether there is a next page without a count query
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
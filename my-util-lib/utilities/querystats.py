@@ -0,0 +1,141 @@
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from collections import Counter as _Tally
+from functools import lru_cache
+from .metrics import registry
+import threading
+import time
+import re
+import os
+
+#statements slower than this many seconds are printed
+SLOW_QUERY_SECONDS = float(os.getenv("DATABASE_SLOW_QUERY_SECONDS", 0.5))
+#a statement run this many times in one request is flagged as a likely N+1
+REPEATED_QUERY_THRESHOLD = int(os.getenv("DATABASE_REPEATED_QUERY_THRESHOLD", 5))
+#query stats are added to the response headers in debug mode, or always when this is on
+QUERY_HEADERS = os.getenv("DATABASE_QUERY_HEADERS", "false").lower() in ("1", "true", "yes")
+#normalized statements are cut to this length before being used as a label
+MAX_STATEMENT_LENGTH = 200
+
+query_seconds = registry.histogram(
+    'db_query_duration_seconds', 'Latency of SQL statements by normalized statement.', ('statement',)
+)
+slow_queries = registry.counter(
+    'db_slow_queries_total', 'SQL statements slower than DATABASE_SLOW_QUERY_SECONDS.', ('statement',)
+)
+request_queries = registry.histogram(
+    'db_queries_per_request', 'SQL statements run by one request.', ('endpoint',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+repeated_queries = registry.counter(
+    'db_repeated_queries_total', 'Requests that ran the same statement at least DATABASE_REPEATED_QUERY_THRESHOLD times.',
+    ('endpoint', 'statement'),
+)
+
+_instrumented = set()
+_instrumented_lock = threading.Lock()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+#:name but not the :: of postgres casts
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize(statement):
+    """SQL statement with its literals and placeholders replaced by ?, so repeats look alike"""
+    statement = _STRING.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    #IN lists of any length are the same statement
+    statement = _IN_LIST.sub('(?)', statement)
+    statement = _SPACES.sub(' ', statement).strip()
+    return statement[:MAX_STATEMENT_LENGTH]
+
+
+class QueryStats:
+    """Statements run while serving one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = _Tally()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold=REPEATED_QUERY_THRESHOLD):
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+
+def current_stats():
+    #the stats of the request being served, None outside of one
+    if not has_app_context():
+        return None
+    if '_query_stats' not in g:
+        g._query_stats = QueryStats()
+    return g._query_stats
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start_time'].pop()
+    normalized = normalize(statement)
+    query_seconds.observe(seconds, statement=normalized)
+    if seconds >= SLOW_QUERY_SECONDS:
+        slow_queries.inc(statement=normalized)
+        print(f"Slow query ({seconds:.3f}s): {normalized}")
+    stats = current_stats()
+    if stats is not None:
+        stats.record(normalized, seconds)
+
+
+def _on_error(context):
+    #a failed statement never reaches after_cursor_execute, its start time is dropped here
+    if context.connection is not None:
+        started = context.connection.info.get('query_start_time')
+        if started:
+            started.pop()
+
+
+def instrument(engine):
+    """Time every statement run through an engine, once per engine"""
+    with _instrumented_lock:
+        if engine in _instrumented:
+            return
+        _instrumented.add(engine)
+    event.listen(engine, 'before_cursor_execute', _before_execute)
+    event.listen(engine, 'after_cursor_execute', _after_execute)
+    event.listen(engine, 'handle_error', _on_error)
+
+
+def instrument_app(flask_app):
+    """Report the statements of every request, once per app"""
+    if 'query_stats' in flask_app.extensions:
+        return
+    flask_app.extensions['query_stats'] = True
+
+    @flask_app.after_request
+    def add_query_headers(response):
+        stats = current_stats()
+        if stats is not None and (flask_app.debug or QUERY_HEADERS):
+            response.headers['X-DB-Query-Count'] = str(stats.count)
+            response.headers['X-DB-Query-Time-Ms'] = f"{stats.seconds * 1000:.1f}"
+            response.headers['X-DB-Repeated-Queries'] = str(len(stats.repeated()))
+        return response
+
+    @flask_app.teardown_request
+    def record_query_stats(exception=None):
+        stats = g.pop('_query_stats', None) or QueryStats()
+        endpoint = request.endpoint or 'unknown'
+        request_queries.observe(stats.count, endpoint=endpoint)
+        for statement, count in stats.repeated().items():
+            repeated_queries.inc(endpoint=endpoint, statement=statement)
+            print(f"Possible N+1 in {endpoint}: ran {count} times: {statement}")
@@ -0,0 +1,246 @@
+from botocore.exceptions import ClientError, HTTPClientError, ConnectionError as BotoConnectionError
+from .metrics import registry
+from collections import deque
+import threading
+import asyncio
+import random
+import time
+import os
+
+#retry policy, attempts include the first call
+RETRY_ATTEMPTS = int(os.getenv("STORAGE_RETRY_ATTEMPTS", 3))
+RETRY_BASE_DELAY = float(os.getenv("STORAGE_RETRY_BASE_DELAY", 0.05))
+RETRY_MAX_DELAY = float(os.getenv("STORAGE_RETRY_MAX_DELAY", 1))
+#retries may add at most this fraction of extra load on top of first attempts
+RETRY_BUDGET_RATIO = float(os.getenv("STORAGE_RETRY_BUDGET_RATIO", 0.2))
+RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("STORAGE_RETRY_BUDGET_MIN_PER_SECOND", 1))
+
+#the breaker opens once this fraction of the calls in the window failed
+BREAKER_FAILURE_RATE = float(os.getenv("STORAGE_BREAKER_FAILURE_RATE", 0.5))
+BREAKER_MIN_CALLS = int(os.getenv("STORAGE_BREAKER_MIN_CALLS", 20))
+BREAKER_WINDOW = float(os.getenv("STORAGE_BREAKER_WINDOW", 30))
+#how long an open breaker short-circuits calls before letting a probe through
+BREAKER_RESET_TIMEOUT = float(os.getenv("STORAGE_BREAKER_RESET_TIMEOUT", 15))
+
+#S3 error codes that mean the service, not the request, is at fault
+TRANSIENT_CODES = ('SlowDown', 'RequestTimeout', 'InternalError', 'ServiceUnavailable', 'Throttling', 'TooManyRequests')
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breaker_state = registry.gauge(
+    'storage_circuit_state', 'Circuit breaker state, 0 closed, 1 half-open, 2 open.', ('breaker',)
+)
+short_circuits = registry.counter(
+    'storage_short_circuits_total', 'Calls rejected by an open circuit breaker.', ('breaker',)
+)
+retries = registry.counter(
+    'storage_retries_total', 'Storage requests retried after a transient failure.', ('operation',)
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open"""
+
+
+def is_transient(error):
+    #connection failures, timeouts, throttling and 5xx answers are worth retrying
+    if isinstance(error, (BotoConnectionError, HTTPClientError, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        code = error.response.get('Error', {}).get('Code')
+        return status >= 500 or status == 429 or code in TRANSIENT_CODES
+    return False
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of first attempts"""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, min_per_second=RETRY_BUDGET_MIN_PER_SECOND, max_tokens=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = float(max_tokens)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __refill(self, amount):
+        #caller holds the lock
+        now = time.monotonic()
+        amount += (now - self._refilled_at) * self.min_per_second
+        self._refilled_at = now
+        self._tokens = min(self.max_tokens, self._tokens + amount)
+
+    def deposit(self):
+        with self._lock:
+            self.__refill(self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            self.__refill(0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Opens on a sustained failure rate and lets a single probe through once the reset timeout expires"""
+
+    def __init__(self, name, failure_rate=BREAKER_FAILURE_RATE, min_calls=BREAKER_MIN_CALLS,
+                 window=BREAKER_WINDOW, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        #(timestamp, failed) for every call in the window
+        self._calls = deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.__set_state(CLOSED)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def __set_state(self, state):
+        #caller holds the lock
+        self._state = state
+        breaker_state.set(_STATE_VALUES[state], breaker=self.name)
+
+    def __prune(self, now):
+        while self._calls and now - self._calls[0][0] > self.window:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def before_call(self):
+        """Let a call through or raise CircuitOpenError, returns True when the call is the half-open probe
+
+        The returned flag is handed back to record_success, record_failure or release.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.__set_state(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        short_circuits.inc(breaker=self.name)
+        raise CircuitOpenError(f"Circuit breaker '{self.name}' is open.")
+
+    #outcomes of calls let through before the breaker opened are ignored while it is not closed,
+    #only the probe decides whether it closes again
+    def record_success(self, probe=False):
+        with self._lock:
+            if self._state == CLOSED:
+                self.__record(False)
+            elif probe and self._state == HALF_OPEN:
+                #the probe went through, start over with a clean window
+                self._probing = False
+                self._calls.clear()
+                self._failures = 0
+                self.__set_state(CLOSED)
+
+    def record_failure(self, probe=False):
+        with self._lock:
+            if self._state == CLOSED:
+                self.__record(True)
+                if len(self._calls) >= self.min_calls and self._failures >= self.failure_rate * len(self._calls):
+                    self._opened_at = time.monotonic()
+                    self.__set_state(OPEN)
+            elif probe and self._state == HALF_OPEN:
+                self._probing = False
+                self._opened_at = time.monotonic()
+                self.__set_state(OPEN)
+
+    def release(self, probe=False):
+        #the call ended without telling us anything about the backend's health
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def __record(self, failed):
+        now = time.monotonic()
+        self.__prune(now)
+        self._calls.append((now, failed))
+        self._failures += failed
+
+
+class Resilience:
+    """Retry and circuit breaker policy applied to every request a storage backend sends"""
+
+    def __init__(self, name, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 budget=None, breaker=None):
+        self.name = name
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def backoff(self, attempt):
+        #full jitter keeps retrying clients from hitting the backend in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def __outcome(self, operation, error, attempt, idempotent, probe):
+        #records a failed attempt, returns how long to wait before retrying or None to give up
+        if not is_transient(error):
+            #the backend answered, a 404 or a 304 says nothing bad about its health
+            if isinstance(error, ClientError):
+                self.breaker.record_success(probe)
+            else:
+                self.breaker.release(probe)
+            return None
+        self.breaker.record_failure(probe)
+        if not idempotent or attempt >= self.attempts or not self.budget.withdraw():
+            return None
+        retries.inc(operation=operation)
+        return self.backoff(attempt)
+
+    def call(self, operation, call, idempotent=True):
+        """Run call(), retrying transient failures of idempotent operations"""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            probe = self.breaker.before_call()
+            try:
+                result = call()
+            except Exception as e:
+                delay = self.__outcome(operation, e, attempt, idempotent, probe)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release(probe)
+                raise
+            self.breaker.record_success(probe)
+            return result
+
+    async def call_async(self, operation, call, idempotent=True):
+        """Same as call, for a coroutine function"""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            probe = self.breaker.before_call()
+            try:
+                result = await call()
+            except Exception as e:
+                delay = self.__outcome(operation, e, attempt, idempotent, probe)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release(probe)
+                raise
+            self.breaker.record_success(probe)
+            return result
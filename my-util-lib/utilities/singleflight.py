@@ -0,0 +1,161 @@
+from .storagebase import StorageWrapper
+from .metrics import registry
+import threading
+import io
+import os
+
+#how long a caller waits on someone else's in-flight fetch, None waits for as long as it takes
+DEFAULT_TIMEOUT = float(os.getenv("STORAGE_SINGLE_FLIGHT_TIMEOUT", 60)) or None
+#coalesced reads hold the body in memory, larger objects are read by every caller on its own
+DEFAULT_MAX_SHARED_BYTES = int(os.getenv("STORAGE_SINGLE_FLIGHT_MAX_BYTES", 1024 * 1024))
+
+coalesced_calls = registry.counter(
+    'single_flight_coalesced_total', 'Calls that shared the result of an identical in-flight call.', ('group',)
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, concurrent callers for the key share its outcome"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            coalesced_calls.inc(group=self.name)
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for the in-flight call for '{key}'.")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            #waiters see the same error instead of retrying all at once
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def forget(self, key):
+        #callers arriving after this start a fresh call, used once the underlying data changed
+        with self._lock:
+            self._calls.pop(key, None)
+
+
+class SingleFlightStorage(StorageWrapper):
+    """Coalesces concurrent reads of the same small key into one request to the wrapped storage
+
+    Streams and ranges are never coalesced and go straight to the wrapped storage.
+    """
+
+    def __init__(self, storage, timeout=DEFAULT_TIMEOUT, max_shared_bytes=DEFAULT_MAX_SHARED_BYTES):
+        super().__init__(storage)
+        self.timeout = timeout
+        self.max_shared_bytes = max_shared_bytes
+        self._flight = SingleFlight('storage')
+
+    def __shared(self, key):
+        #only objects known to be small are buffered and shared, the size comes from a coalesced stat
+        info = self.stat(key)
+        if not info or info.get('ContentLength') is None:
+            return False
+        return info['ContentLength'] <= self.max_shared_bytes
+
+    def __read(self, flight_key, call, *args):
+        #the body is read once by the leader and every caller gets its own file object over it
+        def fetch():
+            response = call(*args)
+            if not response or response.get('Body') is None:
+                return response, None
+            body = response['Body']
+            try:
+                data = body.read()
+            finally:
+                body.close()
+            return {name: value for name, value in response.items() if name != 'Body'}, data
+
+        headers, data = self._flight.do(flight_key, fetch, self.timeout)
+        if data is None:
+            return headers
+        return dict(headers, Body=io.BytesIO(data))
+
+    def get(self, key):
+        if not self.__shared(key):
+            return self.storage.get(key)
+        return self.__read(('get', key), self.storage.get, key)
+
+    def get_if_changed(self, key, etag):
+        if not self.__shared(key):
+            return self.storage.get_if_changed(key, etag)
+        return self.__read(('get_if_changed', key, etag), self.storage.get_if_changed, key, etag)
+
+    def stat(self, key):
+        return self._flight.do(('stat', key), lambda: self.storage.stat(key), self.timeout)
+
+    def __forget(self, key):
+        self._flight.forget(('get', key))
+        self._flight.forget(('stat', key))
+
+    def invalidate(self, key):
+        self.__forget(key)
+        self.storage.invalidate(key)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.put(key, body, contenttype, **kwargs)
+        finally:
+            self.__forget(key)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        try:
+            return self.storage.update(key, body, contenttype, **kwargs)
+        finally:
+            self.__forget(key)
+
+    #batches go straight to the wrapped storage's own batch, they are not coalesced
+    def get_many(self, keys):
+        return self.storage.get_many(keys)
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        items = list(items)
+        try:
+            return self.storage.put_many(items, contenttype, **kwargs)
+        finally:
+            for item in items:
+                self.__forget(item[0])
+
+    def delete(self, key):
+        try:
+            return self.storage.delete(key)
+        finally:
+            self.__forget(key)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        try:
+            return self.storage.delete_many(keys)
+        finally:
+            for key in keys:
+                self.__forget(key)
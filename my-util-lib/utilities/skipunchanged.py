@@ -0,0 +1,146 @@
+from .storagebase import StorageWrapper, BatchResult, batch_items, _run_batch
+from .metrics import registry
+from collections import OrderedDict
+from hashlib import sha256
+import threading
+
+#user metadata key holding the sha256 of the body as the caller wrote it
+HASH_METADATA_KEY = 'content-sha256'
+#upper bound on the keys whose last written hash is remembered
+DEFAULT_MAX_KEYS = 100000
+#stands in for the body of a write that is skipped
+_SKIP = object()
+
+skipped_writes = registry.counter(
+    'storage_writes_skipped_total', 'Writes skipped because the stored body was identical.', ('operation',)
+)
+
+
+class SkipUnchangedStorage(StorageWrapper):
+    """Skips writes whose body hashes to what is already stored under the key"""
+
+    def __init__(self, storage, max_keys=DEFAULT_MAX_KEYS):
+        super().__init__(storage)
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        #key -> hash of the last body written or read, least recently used first
+        self._hashes = OrderedDict()
+
+    def __remember(self, key, digest):
+        with self._lock:
+            if digest is None:
+                self._hashes.pop(key, None)
+                return
+            self._hashes[key] = digest
+            self._hashes.move_to_end(key)
+            while len(self._hashes) > self.max_keys:
+                self._hashes.popitem(last=False)
+
+    def __known(self, key):
+        with self._lock:
+            return self._hashes.get(key)
+
+    def __unchanged(self, key, digest):
+        #a different remembered hash means the body changed, no need to ask storage
+        known = self.__known(key)
+        if known is not None and known != digest:
+            return False
+        #another process may have written the key since, so the stored hash has the final word
+        info = self.storage.stat(key)
+        stored = (info or {}).get('Metadata', {}).get(HASH_METADATA_KEY)
+        self.__remember(key, stored)
+        return stored == digest
+
+    def __prepare(self, key, body, kwargs):
+        #returns the body and kwargs to write with their hash, _SKIP as the body when the stored one is identical
+        #file-like and iterator bodies are written as they are, without a hash
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not isinstance(body, (bytes, bytearray)):
+            self.__remember(key, None)
+            return body, kwargs, None
+
+        digest = sha256(body).hexdigest()
+        if self.__unchanged(key, digest):
+            return _SKIP, kwargs, digest
+
+        metadata = dict(kwargs.get('Metadata') or {})
+        metadata[HASH_METADATA_KEY] = digest
+        return body, dict(kwargs, Metadata=metadata), digest
+
+    def __written(self, key, digest, written):
+        if digest is not None:
+            self.__remember(key, digest if written else None)
+
+    def __write(self, operation, write, key, body, contenttype, kwargs):
+        body, kwargs, digest = self.__prepare(key, body, kwargs)
+        if body is _SKIP:
+            skipped_writes.inc(operation=operation)
+            return True
+        written = write(key, body, contenttype, **kwargs)
+        self.__written(key, digest, written)
+        return written
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        return self.__write('put', self.storage.put, key, body, contenttype, kwargs)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        return self.__write('update', self.storage.update, key, body, contenttype, kwargs)
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        items = list(batch_items(items, kwargs))
+        #the stored hashes are checked concurrently, only the changed bodies go to the wrapped storage's batch
+        prepared = _run_batch(self.__prepare, [(key, (key, body, options)) for key, body, options in items])
+        results = [None] * len(items)
+        writes = []
+        for index, result in enumerate(prepared):
+            if result.error is not None:
+                results[index] = result
+                continue
+            body, options, digest = result.value
+            if body is _SKIP:
+                skipped_writes.inc(operation='put_many')
+                results[index] = BatchResult(result.key, True, None)
+            else:
+                writes.append((index, digest, (result.key, body, options)))
+        if writes:
+            written = self.storage.put_many([item for _, _, item in writes], contenttype)
+            for (index, digest, _), result in zip(writes, written):
+                self.__written(result.key, digest, result.error is None and result.value)
+                results[index] = result
+        return results
+
+    def get(self, key):
+        #a read tells us what is stored, so the next identical save can be skipped
+        response = self.storage.get(key)
+        self.__read(key, response)
+        return response
+
+    def get_many(self, keys):
+        results = self.storage.get_many(keys)
+        for result in results:
+            if result.error is None:
+                self.__read(result.key, result.value)
+        return results
+
+    def __read(self, key, response):
+        if response:
+            self.__remember(key, (response.get('Metadata') or {}).get(HASH_METADATA_KEY))
+
+    def invalidate(self, key):
+        self.__remember(key, None)
+        self.storage.invalidate(key)
+
+    def delete(self, key):
+        try:
+            return self.storage.delete(key)
+        finally:
+            self.__remember(key, None)
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        try:
+            return self.storage.delete_many(keys)
+        finally:
+            for key in keys:
+                self.__remember(key, None)
@@ -1,4 +1,45 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import threading
+import os
+
+#one bounded pool shared by every Storage in the process, so batches respect a global concurrency cap
+BATCH_WORKERS = int(os.getenv("STORAGE_BATCH_WORKERS", 16))
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+#outcome of one key in a batch, value is what the single-key call returned
+BatchResult = namedtuple('BatchResult', ['key', 'value', 'error'])
+
+
+def batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="storage-batch")
+    return _batch_executor
+
+
+def batch_items(items, kwargs):
+    #put_many items are (key, body) or (key, body, options), per-item options override the shared kwargs
+    for item in items:
+        key, body = item[0], item[1]
+        yield key, body, dict(kwargs, **item[2]) if len(item) > 2 else kwargs
+
+
+def _run_batch(operation, calls):
+    #runs operation(*args) for every call on the shared pool, results come back in input order
+    futures = [(key, batch_executor().submit(operation, *args)) for key, args in calls]
+    results = []
+    for key, future in futures:
+        try:
+            results.append(BatchResult(key, future.result(), None))
+        except Exception as e:
+            results.append(BatchResult(key, None, e))
+    return results
+
 
 class Storage(ABC):
     @abstractmethod
@@ -8,6 +49,15 @@ class Storage(ABC):
     def get():
         pass
     @abstractmethod
+    def get_stream():
+        pass
+    @abstractmethod
+    def get_range():
+        pass
+    @abstractmethod
+    def stat():
+        pass
+    @abstractmethod
     def update():
         pass
     @abstractmethod
@@ -19,4 +69,99 @@ class Storage(ABC):
     @abstractmethod
     def list_files():
         pass
+    @abstractmethod
+    def iter_objects():
+        pass
+
+    #collects every object summary under a prefix, use iter_objects to stream large prefixes
+    def list_objects(self, prefix):
+        return list(self.iter_objects(prefix))
+
+    #reads many keys concurrently, returns a BatchResult per key in input order
+    def get_many(self, keys):
+        return _run_batch(self.get, [(key, (key,)) for key in keys])
+
+    #writes many (key, body) or (key, body, options) items concurrently, returns a BatchResult per key in input order
+    def put_many(self, items, contenttype=None, **kwargs):
+        def put(key, body, options):
+            return self.put(key, body, contenttype, **options)
+        return _run_batch(put, [(key, (key, body, options)) for key, body, options in batch_items(items, kwargs)])
+
+    #conditional read, returns None when the stored object still carries this ETag
+    #backends without conditional requests always return the full object
+    def get_if_changed(self, key, etag):
+        return self.get(key)
+
+    #short-lived URL letting a client GET or PUT the object directly
+    #returns None when the backend cannot issue one
+    def presign(self, key, method='GET', expires=300, contenttype=None, **params):
+        return None
+
+    #drops anything remembered about a key that was changed without going through this storage
+    def invalidate(self, key):
+        pass
+
+
+class StorageWrapper(Storage):
+    #forwards every operation to the wrapped storage, subclasses override the ones they decorate
+    def __init__(self, storage):
+        self.storage = storage
+
+    @property
+    def bucket(self):
+        return getattr(self.storage, 'bucket', None)
+
+    def put(self, key, body=None, contenttype=None, **kwargs):
+        return self.storage.put(key, body, contenttype, **kwargs)
+
+    def get(self, key):
+        return self.storage.get(key)
+
+    def get_if_changed(self, key, etag):
+        return self.storage.get_if_changed(key, etag)
+
+    #wrappers that leave get and put alone keep the wrapped storage's own batches
+    #the others run their decorated get or put per key, unless they override the batch too
+    def get_many(self, keys):
+        if _decorates(self, 'get'):
+            return super().get_many(keys)
+        return self.storage.get_many(keys)
+
+    def put_many(self, items, contenttype=None, **kwargs):
+        if _decorates(self, 'put'):
+            return super().put_many(items, contenttype, **kwargs)
+        return self.storage.put_many(items, contenttype, **kwargs)
+
+    def presign(self, key, method='GET', expires=300, contenttype=None, **params):
+        return self.storage.presign(key, method, expires, contenttype, **params)
+
+    def invalidate(self, key):
+        return self.storage.invalidate(key)
+
+    def get_stream(self, key, *args, **kwargs):
+        return self.storage.get_stream(key, *args, **kwargs)
+
+    def get_range(self, key, start, end=None):
+        return self.storage.get_range(key, start, end)
+
+    def stat(self, key):
+        return self.storage.stat(key)
+
+    def update(self, key, body=None, contenttype=None, **kwargs):
+        return self.storage.update(key, body, contenttype, **kwargs)
+
+    def delete(self, key):
+        return self.storage.delete(key)
+
+    def delete_many(self, keys):
+        return self.storage.delete_many(keys)
+
+    def list_files(self, prefix, file_extension=None):
+        return self.storage.list_files(prefix, file_extension)
+
+    def iter_objects(self, prefix, *args, **kwargs):
+        return self.storage.iter_objects(prefix, *args, **kwargs)
+
 
+def _decorates(wrapper, operation):
+    return getattr(type(wrapper), operation) is not getattr(StorageWrapper, operation)
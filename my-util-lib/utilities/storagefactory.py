@@ -0,0 +1,121 @@
+from .cloudflareStorage import Cloudflare
+from .filesystemStorage import FileSystem
+from .diskcache import DiskCache, DEFAULT_MAX_BYTES, DEFAULT_TTL as DISK_CACHE_TTL
+from .memorycache import MemoryCache, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_OBJECT_BYTES, DEFAULT_MAX_BYTES as MEMORY_CACHE_MAX_BYTES
+from .compression import CompressedStorage, DEFAULT_MIN_SIZE
+from .meteredstorage import MeteredStorage
+from .skipunchanged import SkipUnchangedStorage
+from .singleflight import SingleFlightStorage
+from .hedging import HedgedStorage, DEFAULT_PERCENTILE, DEFAULT_MAX_FRACTION, DEFAULT_MIN_DELAY
+from .metrics import registry
+from .resilience import Resilience
+from dotenv import load_dotenv
+import threading
+import os
+
+load_dotenv()
+
+#process-wide storage stack shared by every blueprint
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage():
+    """Build the storage stack described by the environment"""
+    credentials = (
+        os.getenv("CLOUDFLARE_ACCOUNT_ID"),
+        os.getenv("CLOUDFLARE_ACCESS_KEY_ID"),
+        os.getenv("CLOUDFLARE_SECRET_ACCESS_KEY"),
+        os.getenv("CLOUDFLARE_BUCKET_NAME"),
+    )
+    #retries and the circuit breaker replace botocore's own retries, so a degraded R2 fails fast
+    resilience = None
+    if os.getenv("STORAGE_RESILIENCE", "true").lower() in ("1", "true", "yes"):
+        resilience = Resilience("r2")
+
+    backend = os.getenv("STORAGE_BACKEND", "r2").lower()
+    if backend == "r2":
+        options = {} if resilience is None else {'resilience': resilience, 'max_attempts': 1}
+        storage = Cloudflare(*credentials, **options)
+    elif backend == "r2-async":
+        #imported lazily, aiobotocore is an optional dependency
+        from .asyncCloudflareStorage import AsyncCloudflare, SyncStorage
+        storage = SyncStorage(AsyncCloudflare(*credentials, resilience=resilience))
+    elif backend == "filesystem":
+        #single-box deployments keep objects on local disk and never talk to R2
+        root = os.getenv("STORAGE_ROOT")
+        if not root:
+            raise ValueError("STORAGE_ROOT must be set for the filesystem storage backend.")
+        storage = FileSystem(root)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'.")
+
+    #opt-in, hedges only the reads that actually reach R2
+    if os.getenv("STORAGE_HEDGE", "false").lower() in ("1", "true", "yes"):
+        storage = HedgedStorage(
+            storage,
+            percentile=float(os.getenv("STORAGE_HEDGE_PERCENTILE", DEFAULT_PERCENTILE)),
+            max_fraction=float(os.getenv("STORAGE_HEDGE_MAX_FRACTION", DEFAULT_MAX_FRACTION)),
+            min_delay=float(os.getenv("STORAGE_HEDGE_MIN_DELAY", DEFAULT_MIN_DELAY)),
+        )
+
+    #optional on-disk read-through cache in front of R2
+    cache_dir = os.getenv("STORAGE_DISK_CACHE_DIR")
+    if cache_dir:
+        max_bytes = int(os.getenv("STORAGE_DISK_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        ttl = float(os.getenv("STORAGE_DISK_CACHE_TTL", DISK_CACHE_TTL))
+        storage = DiskCache(storage, cache_dir, max_bytes=max_bytes, ttl=ttl)
+
+    #in-process cache for small objects, revalidated with conditional GETs
+    max_entries = int(os.getenv("STORAGE_MEMORY_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES))
+    if max_entries > 0:
+        storage = MemoryCache(
+            storage,
+            ttl=float(os.getenv("STORAGE_MEMORY_CACHE_TTL", 0)),
+            max_entries=max_entries,
+            max_object_bytes=int(os.getenv("STORAGE_MEMORY_CACHE_MAX_OBJECT_BYTES", DEFAULT_MAX_OBJECT_BYTES)),
+            max_bytes=int(os.getenv("STORAGE_MEMORY_CACHE_MAX_BYTES", MEMORY_CACHE_MAX_BYTES)),
+        )
+        _export_cache_stats(storage)
+
+    #bodies are compressed above the caches so both of them hold the smaller copy
+    codec = os.getenv("STORAGE_COMPRESSION", "gzip").lower()
+    if codec not in ("", "none", "off"):
+        storage = CompressedStorage(
+            storage,
+            codec=codec,
+            min_size=int(os.getenv("STORAGE_COMPRESSION_MIN_BYTES", DEFAULT_MIN_SIZE)),
+        )
+
+    #hashes the body as the caller wrote it, before compression
+    if os.getenv("STORAGE_SKIP_UNCHANGED", "true").lower() in ("1", "true", "yes"):
+        storage = SkipUnchangedStorage(storage)
+
+    #concurrent reads of one key share a single request and a single decompression
+    if os.getenv("STORAGE_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes"):
+        storage = SingleFlightStorage(storage)
+
+    #outermost, so latencies and byte counts are the ones the routes actually see
+    if os.getenv("STORAGE_METRICS", "true").lower() in ("1", "true", "yes"):
+        storage = MeteredStorage(storage)
+
+    return storage
+
+
+def _export_cache_stats(cache):
+    gauge = registry.gauge('storage_memory_cache', 'In-process storage cache counters.', ('stat',))
+
+    def collect():
+        for stat, value in cache.stats().items():
+            gauge.set(value, stat=stat)
+    registry.add_collector(collect)
+
+
+def get_storage():
+    #builds the stack on first use and hands the same instance to every caller
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
@@ -1,22 +1,46 @@
 from flask import Flask 
 from flask_cors import CORS
 from dotenv import load_dotenv
+import click
 
 def create_app():
     load_dotenv()
     app = Flask(__name__)
 
     #Enable CORS for the app
-    CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}})
+    #the listing cursor travels in a header the browser has to be allowed to read
+    CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*", "expose_headers": ["X-Next-Cursor"]}})
 
     #setting up blueprints
     from routes.userapi import userapi_bp
     app.register_blueprint(userapi_bp)
+    #every request gets its own database session, closed when the request ends
+    from routes.userapi import db
+    db.app(app)
+    #`flask migrate` brings the schema up to date
+    from utilities.migrations import migrate_command
+    from models.migrations import migration_runner
+    app.cli.add_command(migrate_command(lambda: migration_runner(db.engine)))
+    #`flask backfill-metadata` copies metadata.json objects onto their projects rows
+    from routes.userapi import project_handler
+    app.cli.add_command(backfill_metadata_command(project_handler))
+    from utilities.metrics import metrics_bp
+    app.register_blueprint(metrics_bp)
 
 
     
     return app
 
+def backfill_metadata_command(project_handler):
+    @click.command('backfill-metadata')
+    @click.option('--batch-size', default=100, show_default=True, help="Projects read from storage at once.")
+    def backfill_metadata(batch_size):
+        backfilled, missing = project_handler.backfill_metadata(batch_size)
+        click.echo(f"backfilled {backfilled} projects")
+        for project_id in missing:
+            click.echo(f"no metadata file for project {project_id}")
+    return backfill_metadata
+
 if __name__ == '__main__':
     app = create_app()
     app.run(host='0.0.0.0', port=7000, debug=True)
\ No newline at end of file
@@ -1,33 +1,43 @@
+from sqlalchemy.exc import IntegrityError
+from utilities.pagination import PageRequestError
 import json
+import os
+
+#metadata lives on the projects row, a copy is still written to storage while this is on
+METADATA_MIRROR = os.getenv("PROJECT_METADATA_MIRROR", "true").lower() in ("1", "true", "yes")
+
+
+class ProjectExistsError(ValueError):
+    #the owner already has a project with this name
+    pass
 
 
 class Project:
-    def __init__(self, storage, db):
+    def __init__(self, storage, db, mirror=METADATA_MIRROR):
         self.__storage = storage
         self.__db = db
+        self.__mirror = mirror
     
     def create(self, owner_id, project_name, metadata):
-        #checking if project already exists
-        existing_projects = self.__db.list_projects(owner_id)
-        for proj in existing_projects:
-            if proj.name == project_name:
-                raise ValueError(f"Project with name '{project_name}' already exists.")
-        #creating a new project in the database
+        #creating a new project in the database, the unique (owner, name) index rejects duplicates
         try:
-            newproject = self.__db.add_project(owner_id, project_name)
+            newproject = self.__db.add_project(owner_id, project_name, metadata)
+        except IntegrityError:
+            self.__db.rollback()
+            raise ProjectExistsError(f"Project with name '{project_name}' already exists.")
         except Exception as e:
             raise Exception(f"Error creating project in database: {str(e)}")
         
         if newproject:
-            try:
-                #creating a path in storage for the project and storing the metadata as a json file in there
-                key = f"users/{owner_id}/projects/{newproject.id}/metadata.json"
-                self.__storage.put(key, json.dumps(metadata))
-                return newproject.id
-            except Exception as e:
-                # Rollback DB entry if storage fails
-                self.__db.delete_project(newproject.id, owner_id)
-                raise e
+            if self.__mirror:
+                try:
+                    #mirroring the metadata as a json file in the project's storage path
+                    self.__storage.put(self.__metadata_key(owner_id, newproject.id), json.dumps(metadata))
+                except Exception as e:
+                    # Rollback DB entry if storage fails
+                    self.__db.delete_project(newproject.id, owner_id)
+                    raise e
+            return newproject.id
 
     def delete_project(self, user_id, project_id):
         #logic to delete project from both database and 
@@ -46,7 +56,9 @@ class Project:
             objects_to_delete = self.__storage.list_objects(prefix)
             if objects_to_delete:
                 keys = [obj['Key'] for obj in objects_to_delete]
-                self.__storage.delete_many(keys)
+                failed = self.__storage.delete_many(keys)
+                if failed:
+                    raise Exception(f"{len(failed)} of {len(keys)} objects could not be deleted")
         except Exception as e:
             # If storage fails, we don't proceed to delete from the DB
             raise Exception(f"Error deleting project from storage: {str(e)}")
@@ -62,45 +74,101 @@ class Project:
         return True
  
     def update_metadata(self, user_id, project_id, metadata):
-        #checking if project exists in database
-        try:
-            project = self.__db.get_project(project_id, user_id)
-            if not project:
-                raise FileNotFoundError("Project not found.")
-        except Exception as e:
-            raise e
-        
-        key = f"users/{user_id}/projects/{project_id}/metadata.json"
-        try:
-            self.__storage.put(key, json.dumps(metadata))
-        except Exception as e:
-            raise e
+        #a single update, which also tells whether the user has the project
+        if not self.__db.update_metadata(project_id, user_id, metadata):
+            raise FileNotFoundError("Project not found.")
+
+        if self.__mirror:
+            self.__storage.put(self.__metadata_key(user_id, project_id), json.dumps(metadata))
         return True
     
 
     def get_metadata(self,user_id, project_id):
-        key = f"users/{user_id}/projects/{project_id}/metadata.json"
-        #checking if project exists in database
-        try:
-            project = self.__db.get_project(project_id, user_id)
-            if not project:
-                raise FileNotFoundError("Project not found.")
-        except Exception as e:
-            raise e
-        
-        try:
-            response = self.__storage.get(key)
-            if not response:
-                raise FileNotFoundError("Metadata file not found in storage.")
-            metadata_content = response['Body'].read().decode('utf-8')
-            metadata = json.loads(metadata_content)
-            return metadata
-        except Exception as e:
-            raise e
+        #checking if project exists in database, its row carries the metadata
+        project = self.__db.get_project_metadata(project_id, user_id)
+        if not project:
+            raise FileNotFoundError("Project not found.")
+        if project.meta is not None:
+            return project.meta
+
+        #not backfilled yet, the metadata is still only in storage
+        response = self.__storage.get(self.__metadata_key(user_id, project_id))
+        if not response:
+            raise FileNotFoundError("Metadata file not found in storage.")
+        return json.load(response['Body'])
     
+    def get_metadata_many(self, user_id, project_ids):
+        #fetches the metadata of several projects in one concurrent storage batch
+        #the ids are expected to come from list_projects, so ownership is already checked
+        keys = [self.__metadata_key(user_id, project_id) for project_id in project_ids]
+        results = self.__storage.get_many(keys)
+
+        metadata_list = []
+        for project_id, result in zip(project_ids, results):
+            if result.error is not None:
+                raise result.error
+            if not result.value:
+                raise FileNotFoundError(f"Metadata file not found in storage for project {project_id}.")
+            metadata = json.load(result.value['Body'])
+            #adding project_id to metadata
+            metadata['project_id'] = str(project_id)
+            metadata_list.append(metadata)
+        return metadata_list
+
     def list_projects(self, user_id):
         try:
             projects = self.__db.list_projects(user_id)
             return projects
         except Exception as e:
-            raise Exception(f"Error listing projects from database: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error listing projects from database: {str(e)}")
+
+    def list_metadata(self, user_id, limit, cursor=None):
+        #one page of projects with their metadata, and the cursor of the next page
+        try:
+            rows, next_cursor = self.__db.list_project_metadata(user_id, limit, cursor)
+        except PageRequestError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error listing projects from database: {str(e)}")
+
+        #projects not backfilled yet are read from storage in one batch
+        missing = [row.id for row in rows if row.meta is None]
+        fetched = dict(zip(missing, self.get_metadata_many(user_id, missing))) if missing else {}
+
+        return [fetched[row.id] if row.id in fetched else _row_metadata(row) for row in rows], next_cursor
+
+    def find_metadata(self, user_id, fields):
+        #projects whose metadata fields equal the given values, only backfilled projects can match
+        try:
+            rows = self.__db.find_project_metadata(user_id, fields)
+        except Exception as e:
+            raise Exception(f"Error looking projects up in database: {str(e)}")
+        return [_row_metadata(row) for row in rows]
+
+    def backfill_metadata(self, batch_size=100):
+        #copies the metadata of every project that only has it in storage onto its row
+        #returns how many projects were backfilled and the ids whose metadata file is missing
+        backfilled, missing, after_id = 0, [], None
+        while True:
+            rows = self.__db.list_missing_metadata(batch_size, after_id)
+            if not rows:
+                return backfilled, missing
+            after_id = rows[-1].id
+            results = self.__storage.get_many([self.__metadata_key(row.owner, row.id) for row in rows])
+            for row, result in zip(rows, results):
+                if result.error is not None:
+                    raise result.error
+                if not result.value:
+                    missing.append(row.id)
+                    continue
+                self.__db.update_metadata(row.id, row.owner, json.load(result.value['Body']))
+                backfilled += 1
+
+    def __metadata_key(self, user_id, project_id):
+        return f"users/{user_id}/projects/{project_id}/metadata.json"
+
+
+def _row_metadata(row):
+    metadata = dict(row.meta)
+    metadata['project_id'] = str(row.id)
+    return metadata
@@ -0,0 +1,36 @@
+#versioned schema changes of the projects service, applied with `flask migrate`
+from utilities.migrations import Migration, MigrationRunner, add_column, create_index, drop_index
+from .models import Base
+
+#the services may share a database, so each one keeps its own version table
+MIGRATIONS_TABLE = 'projects_schema_migrations'
+
+MIGRATIONS = [
+    #tables that already exist are left untouched
+    Migration(1, 'create projects and project_members tables', [lambda connection: Base.metadata.create_all(connection)]),
+    Migration(2, 'index project lookups by owner and member', [
+        create_index('ix_projects_owner_created_at', 'projects', ['owner', 'created_at']),
+        create_index('ix_project_members_user_id', 'project_members', ['user_id']),
+    ], concurrent=True),
+    #fails while an owner still has duplicate names, rename them and run it again
+    Migration(3, 'make project names unique per owner', [
+        create_index('uq_projects_owner_name', 'projects', ['owner', 'name'], unique=True),
+    ], concurrent=True),
+    #filled from storage afterwards with `flask backfill-metadata`
+    Migration(4, 'add projects.metadata', [
+        add_column('projects', 'metadata', 'JSONB'),
+    ]),
+    Migration(5, 'index project metadata lookups', [
+        create_index('ix_projects_owner_metadata_title', 'projects', ['owner', "(metadata ->> 'title')"]),
+        create_index('ix_projects_owner_metadata_genre', 'projects', ['owner', "(metadata ->> 'genre')"]),
+    ], concurrent=True),
+    #listing pages are ordered by (created_at, id), the id lets the index serve ties and cursors
+    Migration(6, 'add id to the projects listing index', [
+        create_index('ix_projects_owner_created_at_id', 'projects', ['owner', 'created_at', 'id']),
+        drop_index('ix_projects_owner_created_at'),
+    ], concurrent=True),
+]
+
+
+def migration_runner(engine):
+    return MigrationRunner(engine, MIGRATIONS, MIGRATIONS_TABLE)
@@ -1,7 +1,7 @@
 import uuid
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, DateTime, Integer, UniqueConstraint, func
+from sqlalchemy import Column, String, DateTime, Integer, JSON, UniqueConstraint, Index, func, text
 from sqlalchemy.ext.declarative import declarative_base
 import os
 import sys
@@ -19,6 +19,20 @@ class Project(Base):
     owner = Column(UUID(as_uuid=True), nullable=False)  # store Supabase user UUID here
     name = Column(String(200), nullable=False)
     created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
+    #the project's metadata document, JSONB on postgres
+    #null until the row is backfilled from the metadata.json object in storage
+    meta = Column("metadata", JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql'), nullable=True)
+
+    #kept in sync with models/migrations.py, listing a user's projects filters by owner
+    __table_args__ = (
+        #listing pages walk an owner's projects in (created_at, id) order
+        Index('ix_projects_owner_created_at_id', 'owner', 'created_at', 'id'),
+        #an owner cannot have two projects with the same name
+        Index('uq_projects_owner_name', 'owner', 'name', unique=True),
+        #lookups of an owner's projects by the common metadata fields
+        Index('ix_projects_owner_metadata_title', 'owner', text("(metadata ->> 'title')")),
+        Index('ix_projects_owner_metadata_genre', 'owner', text("(metadata ->> 'genre')")),
+    )
 
 
 # ------------------------
@@ -36,4 +50,6 @@ class ProjectMember(Base):
     # Ensure a user is not added twice to the same project
     __table_args__ = (
         UniqueConstraint('project_id', 'user_id', name='unique_project_member'),
+        #the unique constraint covers lookups by project, this one covers lookups by member
+        Index('ix_project_members_user_id', 'user_id'),
     )
@@ -1,18 +1,24 @@
 from utilities.database import Database
+from utilities.pagination import paginate
+from sqlalchemy import literal_column
 from .models import Project
 import uuid
 
+#metadata fields projects can be looked up by, each one has an index on (owner, metadata ->> field)
+METADATA_LOOKUP_FIELDS = ('title', 'genre')
+
 class ProjectDb(Database):
     #initializes a connection
     def __init__(self, database_url):
         super().__init__(database_url)
     
     #method to add a new project
-    def add_project(self, owner_id, project_name):
+    def add_project(self, owner_id, project_name, metadata=None):
         new_project = Project(
             id=uuid.uuid4(),
             owner=owner_id,
-            name=project_name
+            name=project_name,
+            meta=metadata
         )
         self._session.add(new_project)
         self._session.commit()
@@ -51,7 +57,47 @@ class ProjectDb(Database):
         return self._session.query(Project).filter_by(
             owner=owner_id
         ).all()
-    
-    
 
-    
\ No newline at end of file
+    #method to get a project's metadata, None if the user has no such project
+    #the returned row's meta is None while the project is not backfilled
+    def get_project_metadata(self, project_id, owner_id):
+        return self._session.query(Project.id, Project.meta).filter_by(
+            id=project_id,
+            owner=owner_id
+        ).first()
+
+    #method to replace a project's metadata, False if the user has no such project
+    def update_metadata(self, project_id, owner_id, metadata):
+        updated = self._session.query(Project).filter_by(
+            id=project_id,
+            owner=owner_id
+        ).update({Project.meta: metadata}, synchronize_session=False)
+        self._session.commit()
+        return updated > 0
+
+    #method to list one page of a user's projects with their metadata, newest first
+    #returns the rows and the cursor of the next page
+    def list_project_metadata(self, owner_id, limit, cursor=None):
+        query = self._session.query(Project.id, Project.created_at, Project.meta).filter_by(
+            owner=owner_id
+        )
+        return paginate(query, Project.created_at, Project.id, limit, cursor)
+
+    #method to list a user's projects whose metadata fields equal the given values, newest first
+    #the expressions are written like the index definitions so the planner can use them
+    def find_project_metadata(self, owner_id, fields):
+        query = self._session.query(Project.id, Project.created_at, Project.meta).filter_by(
+            owner=owner_id
+        )
+        for field, value in fields.items():
+            if field not in METADATA_LOOKUP_FIELDS:
+                raise ValueError(f"Projects cannot be looked up by '{field}'.")
+            query = query.filter(literal_column(f"(metadata ->> '{field}')") == value)
+        return query.order_by(Project.created_at.desc(), Project.id.desc()).all()
+
+    #method to list projects whose metadata still lives only in storage, in id order
+    def list_missing_metadata(self, limit, after_id=None):
+        query = self._session.query(Project.id, Project.owner).filter(Project.meta.is_(None))
+        if after_id is not None:
+            query = query.filter(Project.id > after_id)
+        return query.order_by(Project.id).limit(limit).all()
@@ -8,21 +8,18 @@ SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 #initializing authentication utility
 from utilities.auth import supabase_jwt_required, get_current_user_id
 #initializing database and Storage classes
-from models.projectDb import ProjectDb
-from utilities.cloudflareStorage import Cloudflare
+from models.projectDb import ProjectDb, METADATA_LOOKUP_FIELDS
+from utilities.storagefactory import get_storage
+from utilities.pagination import requested_page_size, PageRequestError
 DATABASE_URL = os.getenv("DATABASE_URL")
-CLOUDFLARE_ACCESS_KEY_ID = os.getenv("CLOUDFLARE_ACCESS_KEY_ID")
-CLOUDFLARE_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-CLOUDFLARE_SECRET_ACCESS_KEY = os.getenv("CLOUDFLARE_SECRET_ACCESS_KEY")
-CLOUDFLARE_BUCKET_NAME = os.getenv("CLOUDFLARE_BUCKET_NAME")      
 SCREENPLAY_API_URL = os.getenv("SCREENPLAY_API_URL")
 #intializing utility classes
 import requests
 db = ProjectDb(DATABASE_URL)
-storage = Cloudflare(CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME)
+storage = get_storage()
 
 #initializing a project handler class
-from common.Project import Project
+from common.Project import Project, ProjectExistsError
 project_handler = Project(storage, db)
 
 #declaring a blueprint
@@ -55,6 +52,8 @@ def create_project():
     try:
         project_id = project_handler.create(current_user, project_title, project_metadata)
         return jsonify({"message": "Project created successfully", "project_id": project_id}), 201
+    except ProjectExistsError as e:
+        return jsonify({"message": str(e)}), 409
     except Exception as e:
         db.rollback()
         return jsonify({"message": f"Failed to create project: {str(e)}"}), 500
@@ -127,7 +126,6 @@ def update_metadata(projectid):
 
 
         try:
-            #downloading the existing metadata from the storage bucket
             project_handler.update_metadata(current_user, projectid, new_metadata)
             return jsonify({"message": "Metadata updated successfully"}), 200
 
@@ -145,22 +143,29 @@ def list_projects():
         #getting the user id from the token
         current_user = get_current_user_id(request, SUPABASE_JWT_SECRET)[0]
 
+        #?title= and ?genre= look projects up by their metadata instead of listing them
+        lookup = {field: request.args[field] for field in METADATA_LOOKUP_FIELDS if request.args.get(field)}
+        if lookup:
+            try:
+                return jsonify(project_handler.find_metadata(current_user, lookup)), 201
+            except Exception as e:
+                db.rollback()
+                return jsonify({"message": f"Failed to retrieve projects: {str(e)}"}), 500
+
         try:
-            projects = project_handler.list_projects(current_user)
-            metadata_list = []
-            for proj in projects:
-                project_id = proj.id
-                try:
-                    metadata = project_handler.get_metadata(current_user, project_id)
-                    #adding project_id to metadata
-                    metadata['project_id'] = str(project_id)
-                    metadata_list.append(metadata)
-                except Exception as e:  
-                    db.rollback()
-                    return jsonify({"msg": "issue with storage cloudflare", "error" : str(e)}), 500
-                   
-            return jsonify(metadata_list), 201           
-                
+            #one page of projects, the cursor of the next one is sent in the X-Next-Cursor header
+            #clients sending neither a limit nor a cursor get every project, as before pagination
+            limit = requested_page_size(request.args.get('limit'), request.args.get('cursor'))
+            #the metadata comes with the rows, only projects not backfilled yet are read from storage
+            metadata_list, next_cursor = project_handler.list_metadata(current_user, limit, request.args.get('cursor'))
+        except PageRequestError as e:
+            #bad page size or cursor
+            return jsonify({"message": str(e)}), 400
         except Exception as e:
             db.rollback()
-            return jsonify({"message": f"Failed to retrieve projects: {str(e)}"}), 500
+            return jsonify({"msg": "issue with storage cloudflare", "error" : str(e)}), 500
+
+        response = jsonify(metadata_list)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 201
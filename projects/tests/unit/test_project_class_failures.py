@@ -1,7 +1,10 @@
 import pytest
 from unittest.mock import MagicMock
 import uuid
-from projects.common.Project import Project
+from utilities.storagebase import BatchResult
+from sqlalchemy.exc import IntegrityError
+from projects.common.Project import Project, ProjectExistsError
+from utilities.pagination import PageRequestError
 
 @pytest.fixture
 def project_handler():
@@ -14,21 +17,20 @@ def project_handler():
 
 def test_create_project_already_exists(project_handler):
     """
-    Tests that create raises a ValueError if a project with the same name already exists.
+    Tests that create raises a ProjectExistsError if the owner already has a project with that name.
     """
     handler, mock_storage, mock_db = project_handler
     owner_id = uuid.uuid4()
     project_name = "Existing Project"
     
-    # Mock DB to return an existing project
-    mock_project = MagicMock()
-    mock_project.configure_mock(name=project_name)
-    mock_db.list_projects.return_value = [mock_project]
+    # Mock DB to reject the insert on the unique (owner, name) index
+    mock_db.add_project.side_effect = IntegrityError("INSERT INTO projects", {}, Exception("UNIQUE constraint failed"))
     
-    with pytest.raises(ValueError, match=f"Project with name '{project_name}' already exists."):
+    with pytest.raises(ProjectExistsError, match=f"Project with name '{project_name}' already exists."):
         handler.create(owner_id, project_name, {})
         
-    mock_db.add_project.assert_not_called()
+    mock_db.rollback.assert_called_once()
+    mock_db.list_projects.assert_not_called()
     mock_storage.put.assert_not_called()
 
 def test_create_project_db_add_failure(project_handler):
@@ -38,7 +40,6 @@ def test_create_project_db_add_failure(project_handler):
     handler, mock_storage, mock_db = project_handler
     owner_id = uuid.uuid4()
     
-    mock_db.list_projects.return_value = []
     mock_db.add_project.side_effect = Exception("DB connection failed")
     
     with pytest.raises(Exception, match="DB connection failed"):
@@ -55,7 +56,6 @@ def test_create_project_storage_failure_and_rollback(project_handler):
     new_project_id = uuid.uuid4()
     mock_project_obj = MagicMock(id=new_project_id)
 
-    mock_db.list_projects.return_value = []
     mock_db.add_project.return_value = mock_project_obj
     mock_storage.put.side_effect = Exception("Cloudflare R2 is down")
 
@@ -72,7 +72,7 @@ def test_get_metadata_project_not_found(project_handler):
     Tests that get_metadata raises FileNotFoundError if the project is not in the database.
     """
     handler, mock_storage, mock_db = project_handler
-    mock_db.get_project.return_value = None
+    mock_db.get_project_metadata.return_value = None
 
     with pytest.raises(FileNotFoundError, match="Project not found"):
         handler.get_metadata(uuid.uuid4(), uuid.uuid4())
@@ -81,10 +81,10 @@ def test_get_metadata_project_not_found(project_handler):
 
 def test_get_metadata_storage_failure(project_handler):
     """
-    Tests that get_metadata raises an exception if the storage call fails.
+    Tests that get_metadata raises an exception if reading a project not backfilled yet from storage fails.
     """
     handler, mock_storage, mock_db = project_handler
-    mock_db.get_project.return_value = True
+    mock_db.get_project_metadata.return_value = MagicMock(meta=None)
     mock_storage.get.side_effect = Exception("Storage get failed")
 
     with pytest.raises(Exception, match="Storage get failed"):
@@ -95,13 +95,33 @@ def test_update_metadata_project_not_found(project_handler):
     Tests that update_metadata raises FileNotFoundError if the project is not in the database.
     """
     handler, mock_storage, mock_db = project_handler
-    mock_db.get_project.return_value = None
+    mock_db.update_metadata.return_value = False
 
     with pytest.raises(FileNotFoundError, match="Project not found"):
         handler.update_metadata(uuid.uuid4(), uuid.uuid4(), {})
 
     mock_storage.put.assert_not_called()
 
+def test_get_metadata_many_storage_failure(project_handler):
+    """
+    Tests that get_metadata_many raises the first per-key storage error.
+    """
+    handler, mock_storage, mock_db = project_handler
+    mock_storage.get_many.return_value = [BatchResult('key', None, Exception("R2 timed out"))]
+
+    with pytest.raises(Exception, match="R2 timed out"):
+        handler.get_metadata_many(uuid.uuid4(), [uuid.uuid4()])
+
+def test_get_metadata_many_missing_file(project_handler):
+    """
+    Tests that get_metadata_many raises FileNotFoundError when a metadata file is missing.
+    """
+    handler, mock_storage, mock_db = project_handler
+    mock_storage.get_many.return_value = [BatchResult('key', False, None)]
+
+    with pytest.raises(FileNotFoundError, match="Metadata file not found"):
+        handler.get_metadata_many(uuid.uuid4(), [uuid.uuid4()])
+
 # --- List Projects Failures ---
 
 def test_list_projects_db_failure(project_handler):
@@ -152,10 +172,37 @@ def test_delete_project_db_delete_failure(project_handler):
     handler, mock_storage, mock_db = project_handler
     mock_db.get_project.return_value = True
     mock_storage.list_objects.return_value = [{'Key': 'some/key'}] # Simulate that storage has objects
+    mock_storage.delete_many.return_value = {}
     mock_db.delete_project.side_effect = Exception("DB delete failed")
 
     with pytest.raises(Exception, match="DB delete failed"):
         handler.delete_project(uuid.uuid4(), uuid.uuid4())
 
     # Verify that the storage deletion was still attempted before the DB failure
-    mock_storage.delete_many.assert_called_once_with(['some/key'])
\ No newline at end of file
+    mock_storage.delete_many.assert_called_once_with(['some/key'])
+
+def test_delete_project_partial_storage_failure(project_handler):
+    """
+    Tests that delete_project keeps the database row if some storage objects could not be deleted.
+    """
+    handler, mock_storage, mock_db = project_handler
+    mock_db.get_project.return_value = True
+    mock_storage.list_objects.return_value = [{'Key': 'a'}, {'Key': 'b'}]
+    mock_storage.delete_many.return_value = {'b': 'InternalError: try again'}
+
+    with pytest.raises(Exception, match="1 of 2 objects could not be deleted"):
+        handler.delete_project(uuid.uuid4(), uuid.uuid4())
+
+    mock_db.delete_project.assert_not_called()
+def test_list_metadata_corrupt_file_is_not_a_page_error(project_handler):
+    """
+    Tests that a corrupt metadata file surfaces as a storage error, not as a bad page request.
+    """
+    handler, mock_storage, mock_db = project_handler
+    mock_db.list_project_metadata.return_value = ([MagicMock(id=uuid.uuid4(), meta=None)], None)
+    mock_storage.get_many.return_value = [BatchResult('key', {'Body': MagicMock(read=lambda: b'{"title": ')}, None)]
+
+    with pytest.raises(Exception) as error:
+        handler.list_metadata(uuid.uuid4(), 10)
+
+    assert not isinstance(error.value, PageRequestError)
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import MagicMock
 import uuid
 import json
+from utilities.storagebase import BatchResult
 from projects.common.Project import Project
 
 @pytest.fixture
@@ -22,7 +23,6 @@ def test_create_project_success(project_handler):
     new_project_id = uuid.uuid4()
 
     # Mock DB calls
-    mock_db.list_projects.return_value = []
     mock_db.add_project.return_value = MagicMock(id=new_project_id)
 
     # Call the create method
@@ -30,15 +30,31 @@ def test_create_project_success(project_handler):
 
     # Assertions
     assert created_id == new_project_id
-    mock_db.list_projects.assert_called_once_with(owner_id)
-    mock_db.add_project.assert_called_once_with(owner_id, project_name)
+    mock_db.list_projects.assert_not_called()
+    mock_db.add_project.assert_called_once_with(owner_id, project_name, metadata)
     
     expected_key = f"users/{owner_id}/projects/{new_project_id}/metadata.json"
     mock_storage.put.assert_called_once_with(expected_key, json.dumps(metadata))
 
 def test_get_metadata_success(project_handler):
     """
-    Tests successfully retrieving a project's metadata.
+    Tests that a project's metadata is read from its database row.
+    """
+    handler, mock_storage, mock_db = project_handler
+    user_id = uuid.uuid4()
+    project_id = uuid.uuid4()
+    metadata = {"title": "Test Project", "director": "John Doe"}
+    mock_db.get_project_metadata.return_value = MagicMock(id=project_id, meta=metadata)
+
+    retrieved_metadata = handler.get_metadata(user_id, project_id)
+
+    assert retrieved_metadata == metadata
+    mock_db.get_project_metadata.assert_called_once_with(project_id, user_id)
+    mock_storage.get.assert_not_called()
+
+def test_get_metadata_not_backfilled(project_handler):
+    """
+    Tests that the metadata of a project not backfilled yet is read from storage.
     """
     handler, mock_storage, mock_db = project_handler
     user_id = uuid.uuid4()
@@ -47,7 +63,7 @@ def test_get_metadata_success(project_handler):
     metadata_json = json.dumps(metadata)
 
     # Mock DB and Storage calls
-    mock_db.get_project.return_value = True  # Simulate project exists
+    mock_db.get_project_metadata.return_value = MagicMock(id=project_id, meta=None)
     mock_storage.get.return_value = {
         'Body': MagicMock(read=lambda: metadata_json.encode('utf-8'))
     }
@@ -57,7 +73,6 @@ def test_get_metadata_success(project_handler):
 
     # Assertions
     assert retrieved_metadata == metadata
-    mock_db.get_project.assert_called_once_with(project_id, user_id)
     expected_key = f"users/{user_id}/projects/{project_id}/metadata.json"
     mock_storage.get.assert_called_once_with(expected_key)
 
@@ -71,14 +86,15 @@ def test_update_metadata_success(project_handler):
     new_metadata = {"title": "Updated Title", "producer": "Jane Smith"}
 
     # Mock DB call
-    mock_db.get_project.return_value = True
+    mock_db.update_metadata.return_value = True
 
     # Call the update_metadata method
     result = handler.update_metadata(user_id, project_id, new_metadata)
 
     # Assertions
     assert result is True
-    mock_db.get_project.assert_called_once_with(project_id, user_id)
+    mock_db.update_metadata.assert_called_once_with(project_id, user_id, new_metadata)
+    mock_db.get_project.assert_not_called()
     expected_key = f"users/{user_id}/projects/{project_id}/metadata.json"
     mock_storage.put.assert_called_once_with(expected_key, json.dumps(new_metadata))
 
@@ -105,6 +121,71 @@ def test_list_projects_success(project_handler):
     assert projects[1].name == "Project Two"
     mock_db.list_projects.assert_called_once_with(user_id)
 
+def test_list_metadata_success(project_handler):
+    """
+    Tests that a page of projects comes with the metadata on their rows, storage is only read for rows not backfilled.
+    """
+    handler, mock_storage, mock_db = project_handler
+    user_id = uuid.uuid4()
+    rows = [MagicMock(id=uuid.uuid4(), meta={"title": "One"}), MagicMock(id=uuid.uuid4(), meta=None)]
+    mock_db.list_project_metadata.return_value = (rows, "next-page")
+    mock_storage.get_many.return_value = [
+        BatchResult('key', {'Body': MagicMock(read=lambda: b'{"title": "Two"}')}, None),
+    ]
+
+    metadata_list, cursor = handler.list_metadata(user_id, 2)
+
+    assert metadata_list == [
+        {"title": "One", "project_id": str(rows[0].id)},
+        {"title": "Two", "project_id": str(rows[1].id)},
+    ]
+    assert cursor == "next-page"
+    mock_db.list_project_metadata.assert_called_once_with(user_id, 2, None)
+    mock_storage.get_many.assert_called_once_with([f"users/{user_id}/projects/{rows[1].id}/metadata.json"])
+
+def test_backfill_metadata_success(project_handler):
+    """
+    Tests that backfilling copies every metadata file onto its row and reports the missing ones.
+    """
+    handler, mock_storage, mock_db = project_handler
+    owner_id = uuid.uuid4()
+    rows = [MagicMock(id=uuid.uuid4(), owner=owner_id), MagicMock(id=uuid.uuid4(), owner=owner_id)]
+    mock_db.list_missing_metadata.side_effect = [rows, []]
+    mock_storage.get_many.return_value = [
+        BatchResult('key', {'Body': MagicMock(read=lambda: b'{"title": "One"}')}, None),
+        BatchResult('key', False, None),
+    ]
+
+    backfilled, missing = handler.backfill_metadata(batch_size=2)
+
+    assert backfilled == 1
+    assert missing == [rows[1].id]
+    mock_db.update_metadata.assert_called_once_with(rows[0].id, owner_id, {"title": "One"})
+    mock_db.list_missing_metadata.assert_called_with(2, rows[1].id)
+
+def test_get_metadata_many_success(project_handler):
+    """
+    Tests that metadata for several projects is fetched with one batch call.
+    """
+    handler, mock_storage, mock_db = project_handler
+    user_id = uuid.uuid4()
+    project_ids = [uuid.uuid4(), uuid.uuid4()]
+    keys = [f"users/{user_id}/projects/{pid}/metadata.json" for pid in project_ids]
+    mock_storage.get_many.return_value = [
+        BatchResult(keys[0], {'Body': MagicMock(read=lambda: b'{"title": "One"}')}, None),
+        BatchResult(keys[1], {'Body': MagicMock(read=lambda: b'{"title": "Two"}')}, None),
+    ]
+
+    metadata_list = handler.get_metadata_many(user_id, project_ids)
+
+    assert metadata_list == [
+        {"title": "One", "project_id": str(project_ids[0])},
+        {"title": "Two", "project_id": str(project_ids[1])},
+    ]
+    mock_storage.get_many.assert_called_once_with(keys)
+    mock_storage.get.assert_not_called()
+    mock_db.get_project.assert_not_called()
+
 def test_delete_project_success(project_handler):
     """
     Tests the successful deletion of a project and its associated files.
@@ -123,6 +204,7 @@ def test_delete_project_success(project_handler):
         {'Key': f"users/{user_id}/projects/{project_id}/scripts/script1.lss"}
     ]
     mock_storage.list_objects.return_value = objects_to_delete
+    mock_storage.delete_many.return_value = {}
 
     # Call the delete_project method
     result = handler.delete_project(user_id, project_id)
@@ -0,0 +1,140 @@
+import pytest
+import uuid
+from datetime import datetime
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from projects.models.models import Base, Project
+from projects.models.projectDb import ProjectDb
+
+
+@pytest.fixture(scope="function")
+def project_db_instance():
+    """
+    Fixture to provide a ProjectDb instance with an in-memory SQLite database.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+
+    db = ProjectDb(database_url='sqlite:///:memory:')
+    db._session = sessionmaker(bind=engine)()
+
+    yield db
+
+    db._session.close()
+    Base.metadata.drop_all(engine)
+
+
+def test_project_names_are_unique_per_owner(project_db_instance):
+    """
+    Tests that the database rejects a second project with the same name for the same owner.
+    """
+    owner_id = uuid.uuid4()
+    project_db_instance.add_project(owner_id, "My Film")
+
+    with pytest.raises(IntegrityError):
+        project_db_instance.add_project(owner_id, "My Film")
+    project_db_instance.rollback()
+
+    # Another owner can still use the name
+    assert project_db_instance.add_project(uuid.uuid4(), "My Film")
+    assert len(project_db_instance.list_projects(owner_id)) == 1
+
+def test_list_project_metadata_pages(project_db_instance):
+    """
+    Tests that a user's projects are listed with their metadata, page by page until the last one.
+    """
+    owner_id = uuid.uuid4()
+    projects = [
+        Project(id=uuid.uuid4(), owner=owner_id, name=f"Film {day}", meta={"title": f"Film {day}"},
+                created_at=datetime(2025, 1, day))
+        for day in range(1, 4)
+    ]
+    project_db_instance._session.add_all(projects)
+    project_db_instance._session.commit()
+
+    first, cursor = project_db_instance.list_project_metadata(owner_id, 2)
+    second, last = project_db_instance.list_project_metadata(owner_id, 2, cursor)
+
+    assert [row.meta["title"] for row in first + second] == ["Film 3", "Film 2", "Film 1"]
+    assert last is None
+
+def test_metadata_round_trip(project_db_instance):
+    """
+    Tests that metadata is stored on the row, updated in place and that rows without it are found for backfilling.
+    """
+    owner_id = uuid.uuid4()
+    with_metadata = project_db_instance.add_project(owner_id, "Film", {"title": "Film", "genre": "Drama"})
+    without_metadata = project_db_instance.add_project(owner_id, "Old Film")
+
+    assert project_db_instance.get_project_metadata(with_metadata.id, owner_id).meta["genre"] == "Drama"
+    assert project_db_instance.get_project_metadata(with_metadata.id, uuid.uuid4()) is None
+    assert [row.id for row in project_db_instance.list_missing_metadata(10)] == [without_metadata.id]
+
+    assert project_db_instance.update_metadata(without_metadata.id, owner_id, {"title": "Old Film"})
+    assert not project_db_instance.update_metadata(without_metadata.id, uuid.uuid4(), {})
+    assert project_db_instance.list_missing_metadata(10) == []
+
+def test_project_lookups_use_indexes(project_db_instance):
+    """
+    Tests that looking projects up by owner, and walking an owner's pages, never scans the whole table.
+    """
+    from utilities.migrations import sequential_scans
+    from utilities.pagination import encode_cursor, keyset_page
+
+    session = project_db_instance._session
+    owner_id, project_id = uuid.uuid4(), uuid.uuid4()
+    by_id = session.query(Project).filter_by(id=project_id, owner=owner_id).statement
+    by_owner = session.query(Project).filter_by(owner=owner_id).statement
+    by_name = session.query(Project).filter_by(owner=owner_id, name="My Film").statement
+    page = session.query(Project.id, Project.created_at, Project.meta).filter_by(owner=owner_id)
+    first_page = page.order_by(Project.created_at.desc(), Project.id.desc()).limit(11).statement
+    cursor = encode_cursor(datetime(2024, 1, 1), project_id)
+    next_page = keyset_page(page, Project.created_at, Project.id, cursor).limit(11).statement
+
+    for statement in (by_id, by_owner, by_name, first_page, next_page):
+        assert sequential_scans(session.get_bind(), statement) == []
+
+def test_projects_are_found_by_metadata(project_db_instance):
+    """
+    Tests that metadata lookups match on the field values and reject unindexed fields.
+    """
+    owner_id = uuid.uuid4()
+    noir = project_db_instance.add_project(owner_id, "One", {"title": "Night", "genre": "noir"})
+    project_db_instance.add_project(owner_id, "Two", {"title": "Day", "genre": "comedy"})
+    project_db_instance.add_project(uuid.uuid4(), "Three", {"title": "Night", "genre": "noir"})
+
+    rows = project_db_instance.find_project_metadata(owner_id, {"title": "Night"})
+    assert [row.id for row in rows] == [noir.id]
+    assert project_db_instance.find_project_metadata(owner_id, {"title": "Night", "genre": "comedy"}) == []
+    with pytest.raises(ValueError):
+        project_db_instance.find_project_metadata(owner_id, {"budget": "1"})
+
+
+def test_metadata_lookups_use_their_indexes(project_db_instance):
+    """
+    Tests that the lookup expressions match the metadata index definitions once the table has statistics.
+    """
+    session = project_db_instance._session
+    engine = session.get_bind()
+    owner_id = uuid.uuid4()
+    for i in range(200):
+        session.add(Project(id=uuid.uuid4(), owner=owner_id, name=f"p{i}", meta={"title": f"t{i}", "genre": f"g{i % 50}"}))
+    session.commit()
+    session.execute(text("ANALYZE"))
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        for field in ("title", "genre"):
+            project_db_instance.find_project_metadata(owner_id, {field: "x"})
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    for field, (statement, parameters) in zip(("title", "genre"), statements):
+        rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        plan = " ".join(row[-1] for row in rows)
+        assert f"ix_projects_owner_metadata_{field}" in plan
@@ -14,6 +14,16 @@ def create_app():
     from routes.projects import projects_bp
     app.register_blueprint(userapi_bp) #blueprint that interacts with the frontend
     app.register_blueprint(projects_bp) #blueprint that manages project related tasks
+    #every request gets its own database session, closed when the request ends
+    from routes import userapi, projects
+    userapi.db.app(app)
+    projects.db.app(app)
+    #`flask migrate` brings the schema up to date
+    from utilities.migrations import migrate_command
+    from models.migrations import migration_runner
+    app.cli.add_command(migrate_command(lambda: migration_runner(userapi.db.engine)))
+    from utilities.metrics import metrics_bp
+    app.register_blueprint(metrics_bp) #prometheus metrics for scraping
 
     return app
 
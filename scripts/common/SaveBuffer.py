@@ -0,0 +1,342 @@
+from hashlib import sha256
+import threading
+import tempfile
+import atexit
+import json
+import time
+import os
+
+#how long a script must stay quiet before its latest content is written to storage
+DEBOUNCE_SECONDS = float(os.getenv("SCRIPT_SAVE_DEBOUNCE", 2))
+#upper bound on how long a save can wait while the writer keeps typing
+MAX_DELAY_SECONDS = float(os.getenv("SCRIPT_SAVE_MAX_DELAY", 10))
+#pending content above this many bytes is flushed right away
+MAX_PENDING_BYTES = int(os.getenv("SCRIPT_SAVE_MAX_PENDING_BYTES", 32 * 1024 * 1024))
+#failed writes are retried after this long
+RETRY_SECONDS = 5
+#workers sharing this directory see each other's pending saves, so every worker of a host should use the same one
+SPOOL_DIR = os.getenv("SCRIPT_SAVE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "lenseshot-autosave"))
+#user metadata key holding the wall-clock time the stored content was saved at
+SAVED_AT_METADATA_KEY = 'saved-at'
+
+#process-wide buffers, one per storage object
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_save_buffer(storage):
+    #every blueprint in the process shares the same buffer for the same storage
+    with _buffers_lock:
+        buffer = _buffers.get(id(storage))
+        if buffer is None:
+            buffer = SaveBuffer(storage)
+            _buffers[id(storage)] = buffer
+        return buffer
+
+
+class _Pending:
+    def __init__(self, body, spool_path, now, saved_at):
+        self.body = body
+        self.spool_path = spool_path
+        self.first_at = now
+        self.last_at = now
+        self.retry_at = None
+        self.version = 0
+        #wall-clock time of the latest submit, compared with the saves of other workers
+        self.saved_at = saved_at
+
+
+class SaveBuffer:
+    """Coalescing write-behind stage for screenplay saves.
+
+    A save is acknowledged once its content is spooled to local disk. Only the latest
+    content per storage path is kept and written after the debounce window.
+
+    The spool file of a pending save is its claim on the path. Workers sharing the spool
+    directory read each other's claims, and a newer save or a discard in one worker removes
+    the claims of the others, whose older content is then dropped instead of written.
+    Writes also carry their save time and are skipped when storage already holds a later save.
+    """
+
+    def __init__(self, storage, spool_dir=SPOOL_DIR, debounce=DEBOUNCE_SECONDS,
+                 max_delay=MAX_DELAY_SECONDS, max_pending_bytes=MAX_PENDING_BYTES):
+        self.__storage = storage
+        self.spool_dir = spool_dir
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_pending_bytes = max_pending_bytes
+        self._pending = {}
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        #spool writes for one path are serialized so the file on disk never lags behind memory
+        self._spool_locks = [threading.Lock() for _ in range(64)]
+        #storage writes for one path are serialized so a discard can wait out an in-flight put
+        self._write_locks = [threading.Lock() for _ in range(64)]
+        self._closed = False
+        os.makedirs(spool_dir, exist_ok=True)
+        self.__recover()
+        self._thread = threading.Thread(target=self.__run, name="save-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    #spooling
+    def __spool_path(self, path):
+        return os.path.join(self.spool_dir, f"{os.getpid()}-{_digest(path)}.spool")
+
+    def __write_spool(self, spool_path, path, body, saved_at):
+        handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.spool_dir)
+        with os.fdopen(handle, 'wb') as spool:
+            spool.write(json.dumps({"path": path, "saved_at": saved_at}).encode('utf-8') + b"\n" + body)
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(temp_path, spool_path)
+
+    def __read_spool(self, spool_path):
+        #returns (header, body), None when the file is gone or incomplete
+        try:
+            with open(spool_path, 'rb') as spool:
+                header = json.loads(spool.readline())
+                body = spool.read()
+        except (OSError, ValueError):
+            return None
+        if not isinstance(header, dict) or "path" not in header:
+            return None
+        if "saved_at" not in header:
+            #spooled before save times were recorded
+            try:
+                header["saved_at"] = os.path.getmtime(spool_path)
+            except OSError:
+                return None
+        return header, body
+
+    def __claims(self, path):
+        #spool files other workers hold for a path
+        suffix = f"-{_digest(path)}.spool"
+        own = self.__spool_path(path)
+        try:
+            names = os.listdir(self.spool_dir)
+        except OSError:
+            return []
+        return [
+            os.path.join(self.spool_dir, name) for name in names
+            if name.endswith(suffix) and os.path.join(self.spool_dir, name) != own
+        ]
+
+    def __release_claims(self, path):
+        #content other workers hold for the path is older than a new save or a discard
+        for spool_path in self.__claims(path):
+            self.__remove_spool(spool_path)
+
+    def __remove_spool(self, spool_path):
+        try:
+            os.remove(spool_path)
+        except FileNotFoundError:
+            pass
+
+    def __recover(self):
+        #picks up saves spooled by processes that exited before flushing them
+        #they are due right away, and written only if storage holds nothing saved later
+        now = time.monotonic()
+        for name in os.listdir(self.spool_dir):
+            if name.endswith(".tmp"):
+                #a spool write that never completed, the save was not acknowledged
+                self.__remove_spool(os.path.join(self.spool_dir, name))
+                continue
+            if not name.endswith(".spool"):
+                continue
+            try:
+                pid = int(name.split("-", 1)[0])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            spool_path = os.path.join(self.spool_dir, name)
+            spooled = self.__read_spool(spool_path)
+            if spooled is None:
+                continue
+            header, body = spooled
+            path, saved_at = header["path"], header["saved_at"]
+            previous = self._pending.get(path)
+            if previous is not None and previous.saved_at >= saved_at:
+                #two dead workers held the path, the later save wins
+                self.__remove_spool(spool_path)
+                continue
+            own_spool = self.__spool_path(path)
+            self.__write_spool(own_spool, path, body, saved_at)
+            if spool_path != own_spool:
+                self.__remove_spool(spool_path)
+            if previous is not None:
+                self._pending_bytes -= len(previous.body)
+            self._pending[path] = _Pending(body, own_spool, now - self.max_delay, saved_at)
+            self._pending_bytes += len(body)
+
+    #public api
+    def submit(self, path, body):
+        """Durably queue the latest content for a path, replacing any pending content"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        spool_path = self.__spool_path(path)
+        with self._spool_locks[hash(path) % len(self._spool_locks)]:
+            saved_at = time.time()
+            self.__write_spool(spool_path, path, body, saved_at)
+            self.__release_claims(path)
+            with self._condition:
+                now = time.monotonic()
+                entry = self._pending.get(path)
+                if entry is None:
+                    entry = _Pending(body, spool_path, now, saved_at)
+                    self._pending[path] = entry
+                else:
+                    self._pending_bytes -= len(entry.body)
+                    entry.body = body
+                    entry.last_at = now
+                    entry.retry_at = None
+                    entry.saved_at = saved_at
+                entry.version += 1
+                self._pending_bytes += len(body)
+                self._condition.notify()
+        return True
+
+    def pending(self, path):
+        #latest queued content for a path in any worker, or None once it has been written
+        with self._condition:
+            entry = self._pending.get(path)
+            if entry is not None and self.__superseded(path, entry, entry.version):
+                entry = None
+            if entry is not None:
+                return entry.body
+        #a newer save in another worker would have removed our claim, so only theirs are left to check
+        latest = None
+        for spool_path in self.__claims(path):
+            spooled = self.__read_spool(spool_path)
+            if spooled is not None and (latest is None or spooled[0]["saved_at"] > latest[0]["saved_at"]):
+                latest = spooled
+        return latest[1] if latest is not None else None
+
+    def discard(self, path):
+        #drops queued content in every worker, used when the script is deleted or replaced out of band
+        with self._write_locks[hash(path) % len(self._write_locks)]:
+            self.__release_claims(path)
+            with self._condition:
+                entry = self._pending.pop(path, None)
+                if entry is not None:
+                    self._pending_bytes -= len(entry.body)
+                    self.__remove_spool(entry.spool_path)
+
+    def flush(self, path=None):
+        """Synchronously write pending content for one path, or for every path, to storage"""
+        with self._condition:
+            paths = [path] if path is not None else list(self._pending)
+        ok = True
+        for pending_path in paths:
+            ok = self.__write(pending_path) and ok
+        return ok
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+    #background writer
+    def __due_at(self, entry):
+        if entry.retry_at is not None:
+            return entry.retry_at
+        if self._pending_bytes > self.max_pending_bytes:
+            return 0
+        return min(entry.last_at + self.debounce, entry.first_at + self.max_delay)
+
+    def __run(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = [path for path, entry in self._pending.items() if self.__due_at(entry) <= now]
+                if not due:
+                    next_due = min((self.__due_at(entry) for entry in self._pending.values()), default=None)
+                    self._condition.wait(None if next_due is None else next_due - now)
+                    continue
+            for path in due:
+                self.__write(path)
+
+    def __write(self, path):
+        with self._write_locks[hash(path) % len(self._write_locks)]:
+            return self.__write_locked(path)
+
+    def __superseded(self, path, entry, version):
+        #another worker removed our claim, drops the entry unless a newer submit has claimed the path again
+        #called with the condition held
+        if os.path.exists(entry.spool_path) or entry.version != version:
+            return False
+        if self._pending.get(path) is entry:
+            del self._pending[path]
+            self._pending_bytes -= len(entry.body)
+        return True
+
+    def __stored_saved_at(self, path):
+        #save time of the content in storage, 0 when unknown or written without the buffer
+        try:
+            info = self.__storage.stat(path)
+            return float(((info or {}).get('Metadata') or {}).get(SAVED_AT_METADATA_KEY) or 0)
+        except Exception:
+            return 0
+
+    def __write_locked(self, path):
+        with self._condition:
+            entry = self._pending.get(path)
+            if entry is None:
+                return True
+            body, version, saved_at = entry.body, entry.version, entry.saved_at
+            if self.__superseded(path, entry, version):
+                return True
+
+        if self.__stored_saved_at(path) > saved_at:
+            #a later save reached storage from elsewhere, this content is older than what is stored
+            with self._condition:
+                if self._pending.get(path) is entry and entry.version == version:
+                    del self._pending[path]
+                    self._pending_bytes -= len(body)
+                    self.__remove_spool(entry.spool_path)
+            return True
+
+        try:
+            written = self.__storage.put(
+                path, body, contenttype='application/json', Metadata={SAVED_AT_METADATA_KEY: f"{saved_at:.6f}"}
+            )
+        except Exception as e:
+            print(f"Error writing buffered save: {e}")
+            written = False
+
+        with self._condition:
+            current = self._pending.get(path)
+            if current is not entry:
+                return bool(written)
+            if not written:
+                entry.retry_at = time.monotonic() + RETRY_SECONDS
+                return False
+            #newer content may have arrived while the write was in flight
+            if entry.version == version:
+                del self._pending[path]
+                self._pending_bytes -= len(body)
+                self.__remove_spool(entry.spool_path)
+            else:
+                entry.first_at = time.monotonic()
+            return True
+
+
+def _digest(path):
+    return sha256(path.encode('utf-8')).hexdigest()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
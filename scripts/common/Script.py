@@ -1,16 +1,40 @@
 from xml.etree import ElementTree as ET
+from utilities.singleflight import SingleFlight
+from .SaveBuffer import SAVED_AT_METADATA_KEY
+import secrets
 import json
+import time
+import os
+
+#lifetime in seconds of the URLs clients use to read and write screenplays directly
+URL_EXPIRES = int(os.getenv("SCRIPT_URL_EXPIRES", 300))
+
+#user metadata key tying a direct upload to the upload URL it was issued with
+UPLOAD_TOKEN_METADATA_KEY = 'upload-token'
+
+#bytes read from the start of a direct upload to check it holds a screenplay document
+UPLOAD_PREFIX_BYTES = 64
+
+#concurrent opens of the same screenplay share one fetch and one parse
+_documents = SingleFlight('documents')
+
+
+class DirectTransferUnsupported(Exception):
+    """The storage backend cannot issue URLs for direct transfers"""
 
 
 class Script():
 
-    def __init__(self, StorageClass, DatabaseClass):
+    def __init__(self, StorageClass, DatabaseClass, SaveBufferClass=None):
         #intializing storage system
         self.__storage = StorageClass
 
         #initializing database system
         self.__database = DatabaseClass
 
+        #optional write-behind stage that coalesces autosaves
+        self.__save_buffer = SaveBufferClass
+
         self.__save: bool = False
         self.__file_content = None
 
@@ -24,6 +48,9 @@ class Script():
         except Exception as e:
             raise e
             
+        #a queued save for an older script with the same path must not overwrite the new one
+        if self.__save_buffer is not None:
+            self.__save_buffer.discard(path)
         try:
             # Storing content as a JSON string
             self.__storage.put(path, json.dumps(self.__file_content), contenttype='application/json')
@@ -50,31 +77,131 @@ class Script():
             raise FileNotFoundError("Script does not exist in database.")
         #fetching from storage
         path = f"users/{user}/scripts/{title}.lss"
-        try:
+        #a save that has not reached storage yet is the latest version
+        pending = self.__pending(path)
+        if pending is not None:
+            self.__file_content = json.loads(pending)
+            return
+        def fetch():
             response = self.__storage.get(path)
-            file_content_str = response.get('Body').read().decode('utf-8')
-            self.__file_content = json.loads(file_content_str) # Parse JSON string into object
+            return json.load(response.get('Body')) # Parse the JSON body straight into an object
+        try:
+            #the parsed document is shared between callers and must not be mutated in place
+            self.__file_content = _documents.do(path, fetch)
         except Exception as e:
             raise e
 
+    def stream(self, title, user):
+        #returns the stored JSON of a script as an iterator of byte chunks, without parsing it
+        script_exists = self.__database.get_script(title, user)
+        if not script_exists:
+            raise FileNotFoundError("Script does not exist in database.")
+        path = f"users/{user}/scripts/{title}.lss"
+        pending = self.__pending(path)
+        if pending is not None:
+            return iter([pending])
+        chunks = self.__storage.get_stream(path)
+        if not chunks:
+            raise FileNotFoundError("Script file not found in storage.")
+        return chunks
+
+    #DIRECT TRANSFERS
+    def download_url(self, title, user):
+        #short-lived URL the client uses to fetch the screenplay straight from storage
+        script_exists = self.__database.get_script(title, user)
+        if not script_exists:
+            raise FileNotFoundError("Script does not exist in database.")
+        path = f"users/{user}/scripts/{title}.lss"
+        #the object in storage must be the latest version before the client reads it
+        self.__flush(path)
+        url = self.__storage.presign(path, 'GET', URL_EXPIRES)
+        if not url:
+            raise DirectTransferUnsupported("Storage backend cannot issue download URLs.")
+        return url
+
+    def upload_url(self, title, user, template=None):
+        #short-lived URL the client uses to PUT the screenplay JSON straight into storage
+        #returns the URL, the headers the client must send with the PUT and the token to commit it with
+        #a new screenplay (template given) only gets its database row once the upload is committed
+        script_exists = self.__database.get_script(title, user)
+        if not script_exists and template is None:
+            raise FileNotFoundError("Script does not exist in database.")
+        path = f"users/{user}/scripts/{title}.lss"
+        #queued saves are written now, and the upload's save time keeps any older one held elsewhere from landing on top
+        self.__flush(path)
+        token = secrets.token_urlsafe(16)
+        metadata = {UPLOAD_TOKEN_METADATA_KEY: token, SAVED_AT_METADATA_KEY: f"{time.time():.6f}"}
+        url = self.__storage.presign(path, 'PUT', URL_EXPIRES, contenttype='application/json', Metadata=metadata)
+        if not url:
+            raise DirectTransferUnsupported("Storage backend cannot issue upload URLs.")
+        headers = {'Content-Type': 'application/json'}
+        headers.update({f"x-amz-meta-{name}": value for name, value in metadata.items()})
+        return url, headers, token
+
+    def commit_upload(self, title, user, project=None, template=None, upload_token=None):
+        #confirms a direct upload reached storage and brings the database in line with it
+        path = f"users/{user}/scripts/{title}.lss"
+        info = self.__storage.stat(path)
+        if not info:
+            raise FileNotFoundError("Uploaded file not found in storage.")
+        #the stored object must be the one uploaded through the URL issued with this token
+        if not upload_token or (info.get('Metadata') or {}).get(UPLOAD_TOKEN_METADATA_KEY) != upload_token:
+            raise ValueError("Stored screenplay does not match the issued upload.")
+        #checked from the object's headers, the body itself never passes through the worker
+        if not (info.get('ContentType') or '').startswith('application/json') or not info.get('ContentLength'):
+            raise ValueError("Uploaded screenplay is not valid JSON.")
+
+        if self.__save_buffer is not None:
+            self.__save_buffer.discard(path)
+        #caches and coalesced reads of this worker still hold the version from before the upload
+        #other workers pick it up once their cached copies are revalidated (STORAGE_MEMORY_CACHE_TTL, STORAGE_DISK_CACHE_TTL)
+        self.__storage.invalidate(path)
+        _documents.forget(path)
+
+        prefix = self.__storage.get_range(path, 0, UPLOAD_PREFIX_BYTES - 1)
+        if prefix is False or prefix is None:
+            raise Exception("Failed to read the uploaded screenplay from storage.")
+        if prefix.lstrip()[:1] not in (b'[', b'{'):
+            raise ValueError("Uploaded screenplay is not valid JSON.")
+
+        created = False
+        if not self.__database.get_script(title, user):
+            if template is None:
+                raise ValueError("A template is required to create a screenplay.")
+            self.__database.add_script(owner_id=user, project_id=project, title=title, template=template)
+            created = True
+        self.__save = True
+        return info.get('ETag'), created
+
     def quick_save(self, new_content):
         """In-memory update of the script's content."""
         self.__file_content = new_content
 
 
-    def save(self, title, user, new_content):
+    def save(self, title, user, new_content, flush=False):
         #saves/updates the file content in storage and database if necessary
+        path = f"users/{user}/scripts/{title}.lss"
 
         #make sure script exists in database
-        script_exists = self.__database.get_script(title, user)
-        if not script_exists:
-            raise FileNotFoundError("Script does not exist in database.")
+        #a script with a save already queued was checked when that save came in
+        if self.__pending(path) is None:
+            script_exists = self.__database.get_script(title, user)
+            if not script_exists:
+                raise FileNotFoundError("Script does not exist in database.")
         
         # Update content in memory
         self.quick_save(new_content)
+        _documents.forget(path)
+
+        #queueing the save, the buffer writes the latest content to storage after a quiet period
+        if self.__save_buffer is not None:
+            self.__save_buffer.submit(path, json.dumps(self.__file_content))
+            if flush and not self.__save_buffer.flush(path):
+                raise Exception("Failed to write screenplay to storage.")
+            self.__save = True
+            return True
 
         #saving to storage
-        path = f"users/{user}/scripts/{title}.lss"
         try:
             # Storing content as a JSON string
             self.__storage.put(path, json.dumps(self.__file_content), contenttype='application/json')
@@ -93,6 +220,9 @@ class Script():
         
         #deleting from storage
         path = f"users/{user}/scripts/{title}.lss"
+        if self.__save_buffer is not None:
+            self.__save_buffer.discard(path)
+        _documents.forget(path)
         try:
             self.__storage.delete(path)
         except Exception as e:
@@ -108,25 +238,34 @@ class Script():
     def delete_project(self, user, project):
         #deletes all scripts associated with a project both from storage and database
 
-        #fetching all scripts associated with the project
-        scripts = self.__database.get_list_of_scripts(owner_id=user, project_id=project)
-        
-        for script in scripts:
-            title = script.title
-            #deleting from storage
-            path = f"users/{user}/projects/{project}/scripts/{title}.lss"
-            try:
-                self.__storage.delete(path)
-            except Exception as e:
-                raise e
-
-            #deleting from database
-            try:
-                self.__database.delete_script(script)
-            except Exception as e:
-                raise e
+        #the rows are deleted in one statement, but only committed once storage is clean
+        scripts = self.__database.delete_project_scripts(user, project)
+        paths = [f"users/{user}/scripts/{script.title}.lss" for script in scripts]
+        for path in paths:
+            if self.__save_buffer is not None:
+                self.__save_buffer.discard(path)
+            _documents.forget(path)
+
+        try:
+            failed = self.__storage.delete_many(paths) if paths else {}
+            if failed:
+                raise Exception(f"{len(failed)} of {len(paths)} screenplays could not be deleted from storage")
+        except Exception:
+            #the rows stay, deleting the project again removes what is left
+            self.__database.rollback()
+            raise
+        self.__database.commit()
         return True
     
+    def __flush(self, path):
+        if self.__save_buffer is not None and not self.__save_buffer.flush(path):
+            raise Exception("Failed to write screenplay to storage.")
+
+    def __pending(self, path):
+        if self.__save_buffer is None:
+            return None
+        return self.__save_buffer.pending(path)
+
     #getters
     @property
     def file_content(self):
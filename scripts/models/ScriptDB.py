@@ -1,5 +1,6 @@
 from utilities.database import Database
-from sqlalchemy import Column, Integer, String, Text
+from utilities.pagination import paginate
+from sqlalchemy import Column, Integer, String, Text, delete, select
 from sqlalchemy.dialects.postgresql import UUID
 from .ScriptModel import ScriptsModel, ScenesModel
 import uuid
@@ -36,7 +37,33 @@ class ScriptDB(Database):
         self._session.delete(script)
         self._session.commit()
         
-    def get_list_of_scripts(self, owner_id):
-        return self._session.query(ScriptsModel).filter_by(
+    def get_list_of_scripts(self, owner_id, project_id=None):
+        query = self._session.query(ScriptsModel).filter_by(
             owner_id=owner_id,
-        ).all()
\ No newline at end of file
+        )
+        if project_id is not None:
+            query = query.filter_by(project_id=project_id)
+        return query.all()
+
+    #deletes every script of a project and their scenes with two statements
+    #returns the (id, title) of the deleted scripts, the caller commits or rolls back
+    def delete_project_scripts(self, owner_id, project_id):
+        scripts = select(ScriptsModel.id).where(
+            ScriptsModel.owner_id == owner_id,
+            ScriptsModel.project_id == project_id,
+        )
+        self._session.execute(delete(ScenesModel).where(ScenesModel.script_id.in_(scripts)))
+        return self._session.execute(
+            delete(ScriptsModel).where(
+                ScriptsModel.owner_id == owner_id,
+                ScriptsModel.project_id == project_id,
+            ).returning(ScriptsModel.id, ScriptsModel.title)
+        ).all()
+
+    #one page of an owner's scripts, newest first, only the listed columns are loaded
+    #returns the rows and the cursor of the next page
+    def list_scripts(self, owner_id, limit, cursor=None):
+        query = self._session.query(
+            ScriptsModel.id, ScriptsModel.title, ScriptsModel.created_at,
+        ).filter_by(owner_id=owner_id)
+        return paginate(query, ScriptsModel.created_at, ScriptsModel.id, limit, cursor)
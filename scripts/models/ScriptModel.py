@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
@@ -14,6 +14,16 @@ class ScriptsModel(Base):
     project_id = Column(UUID(as_uuid=True), nullable=True)
     scenes = relationship("ScenesModel", back_populates="script", cascade="all, delete-orphan")
     templates = Column(String, nullable=False)
+    created_at = Column(DateTime, server_default=func.current_timestamp(), nullable=False)
+
+    #kept in sync with models/migrations.py
+    __table_args__ = (
+        #get_script looks up (owner_id, title), listing by owner uses the prefix
+        Index('ix_scripts_owner_title', 'owner_id', 'title'),
+        Index('ix_scripts_owner_project', 'owner_id', 'project_id'),
+        #listing pages walk an owner's scripts in (created_at, id) order
+        Index('ix_scripts_owner_created_at', 'owner_id', 'created_at', 'id'),
+    )
 
 
 
@@ -21,7 +31,7 @@ class ScenesModel(Base):
     __tablename__ = 'scenes'
 
     id = Column(UUID(as_uuid=True), primary_key=True)
-    script_id = Column(UUID(as_uuid=True), ForeignKey('scripts.id'), nullable=False)
+    script_id = Column(UUID(as_uuid=True), ForeignKey('scripts.id'), nullable=False, index=True)
     scene_number = Column(Integer, nullable=False)
     heading = Column(String, nullable=False)
     location = Column(String, nullable=False)
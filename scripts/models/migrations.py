@@ -0,0 +1,27 @@
+#versioned schema changes of the scripts service, applied with `flask migrate`
+from utilities.migrations import Migration, MigrationRunner, add_column, create_index
+from .ScriptModel import Base
+
+#the services may share a database, so each one keeps its own version table
+MIGRATIONS_TABLE = 'scripts_schema_migrations'
+
+MIGRATIONS = [
+    #tables that already exist are left untouched
+    Migration(1, 'create scripts and scenes tables', [lambda connection: Base.metadata.create_all(connection)]),
+    Migration(2, 'index script lookups by owner', [
+        create_index('ix_scripts_owner_title', 'scripts', ['owner_id', 'title']),
+        create_index('ix_scripts_owner_project', 'scripts', ['owner_id', 'project_id']),
+        create_index('ix_scenes_script_id', 'scenes', ['script_id']),
+    ], concurrent=True),
+    #existing scripts all get the time of the migration, ties are broken by id
+    Migration(3, 'add scripts.created_at', [
+        add_column('scripts', 'created_at', 'TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP'),
+    ]),
+    Migration(4, 'index script listing order', [
+        create_index('ix_scripts_owner_created_at', 'scripts', ['owner_id', 'created_at', 'id']),
+    ], concurrent=True),
+]
+
+
+def migration_runner(engine):
+    return MigrationRunner(engine, MIGRATIONS, MIGRATIONS_TABLE)
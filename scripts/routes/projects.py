@@ -5,25 +5,22 @@ projects_bp = Blueprint('projects', __name__, url_prefix='/projectAPI')
 
 #initializing database and Storage classes
 from models.ScriptDB import ScriptDB
-from utilities.cloudflareStorage import Cloudflare
+from utilities.storagefactory import get_storage
 import os
 
 #loading environmental variables
 from dotenv import load_dotenv
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-CLOUDFLARE_ACCESS_KEY_ID = os.getenv("CLOUDFLARE_ACCESS_KEY_ID")
-CLOUDFLARE_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-CLOUDFLARE_SECRET_ACCESS_KEY = os.getenv("CLOUDFLARE_SECRET_ACCESS_KEY")
-CLOUDFLARE_BUCKET_NAME = os.getenv("CLOUDFLARE_BUCKET_NAME")
 
 #intializing utility classes
 db = ScriptDB(DATABASE_URL)
-storage = Cloudflare(CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME)
+storage = get_storage()
 
 #initializing a script handler class
 from common.Script import Script
-script = Script(storage, db)
+from common.SaveBuffer import get_save_buffer
+script = Script(storage, db, get_save_buffer(storage))
 @projects_bp.route('/screenplay/delete_project', methods=['POST', 'OPTIONS'])
 def delete_project():
     if request.method == "OPTIONS":
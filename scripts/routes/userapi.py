@@ -1,5 +1,5 @@
 #this file exposes screenplay data to the frontend
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from utilities.auth import supabase_jwt_required, get_current_user_id
 from xml.etree import  ElementTree as ET
 
@@ -12,21 +12,22 @@ import uuid
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
-CLOUDFLARE_ACCESS_KEY_ID = os.getenv("CLOUDFLARE_ACCESS_KEY_ID")
-CLOUDFLARE_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-CLOUDFLARE_SECRET_ACCESS_KEY = os.getenv("CLOUDFLARE_SECRET_ACCESS_KEY")
-CLOUDFLARE_BUCKET_NAME = os.getenv("CLOUDFLARE_BUCKET_NAME")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 
 #initializing database and Storage classes
 from models.ScriptDB import ScriptDB
-from utilities.cloudflareStorage import Cloudflare
+from utilities.storagefactory import get_storage
+from utilities.pagination import requested_page_size, PageRequestError
 
 db = ScriptDB(DATABASE_URL)
-Storage = Cloudflare(CLOUDFLARE_ACCOUNT_ID, CLOUDFLARE_ACCESS_KEY_ID, CLOUDFLARE_SECRET_ACCESS_KEY, CLOUDFLARE_BUCKET_NAME)
+Storage = get_storage()
+
+#autosaves are coalesced by a write-behind buffer shared by the whole process
+from common.SaveBuffer import get_save_buffer
+save_buffer = get_save_buffer(Storage)
 
 #initializing a script handler class
-from common.Script import Script
+from common.Script import Script, URL_EXPIRES, DirectTransferUnsupported
 
 #route to create a screenplay
 @userapi_bp.route('/create_screenplay', methods=['POST', 'OPTIONS', "GET"])
@@ -59,7 +60,7 @@ def create_screenplay():
     #saving it to storage
     try:
         #intializing a script and storing it in storage
-        screenplay = Script(StorageClass=Storage, DatabaseClass=db)
+        screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
         screenplay.create(title=screenplay_name, user=current_user, project=project_id, content=screenplayContent, template=template_name)
         return jsonify({'msg': 'Screenplay created successfully'}), 201
     except Exception as e:
@@ -94,14 +95,14 @@ def open_screenplay():
         
 
         # Convert string to UUID object
-        screenplay = Script(StorageClass=Storage, DatabaseClass=db)
-        screenplay.open(title=screenplay_name, user=current_user)
+        screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
+        chunks = screenplay.stream(title=screenplay_name, user=current_user)
     except Exception as e:
         db.rollback()
         return jsonify({'msg': f'Backend connection failed: {str(e)}'}), 502
 
-    # The entire file is now the content
-    return jsonify(screenplay.file_content)
+    # The stored file is already JSON, so it is streamed to the client as-is
+    return Response(stream_with_context(chunks), mimetype='application/json')
 
 #route to save a screenplay
 @userapi_bp.route('/save_screenplay', methods=['POST', 'OPTIONS'])
@@ -117,6 +118,8 @@ def save_screenplay():
         #getting important screenplay data
         screenplay_Json = data.get('screenplay')      
         screenplay_name = data.get('screenplay_name')
+        #explicit saves are written to storage before responding, autosaves are queued
+        flush = bool(data.get('flush'))
         if not all([screenplay_Json, screenplay_name]):
             return jsonify({'msg': 'Missing required fields', "response": request.json}), 400
 
@@ -124,15 +127,112 @@ def save_screenplay():
            
 
             # Initialize the script object
-            screenplay = Script(StorageClass=Storage, DatabaseClass=db)
+            screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
             # Open the script to load its current state
-            screenplay.save(title=screenplay_name, user=current_user, new_content=screenplay_Json)
+            screenplay.save(title=screenplay_name, user=current_user, new_content=screenplay_Json, flush=flush)
         except Exception as e:
             db.rollback()
             return jsonify({'msg': 'Failed to save screenplay', 'error': str(e)}), 500
 
         return jsonify({"msg" : "Screenplay Saved Successfully"}), 200     
 
+#route to get a short-lived URL the client downloads a screenplay from, straight from storage
+@userapi_bp.route('/screenplay_download_url', methods=['POST', 'OPTIONS'])
+@supabase_jwt_required
+def screenplay_download_url():
+    if request.method == "OPTIONS":
+        return "", 200
+    data = request.json
+    current_user = get_current_user_id(request, SUPABASE_JWT_SECRET)[0]
+
+    screenplay_name = data.get('screenplay_name')
+    if not all([screenplay_name]):
+        return jsonify({'msg': 'Missing required fields'}), 400
+
+    try:
+        screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
+        url = screenplay.download_url(title=screenplay_name, user=current_user)
+    except FileNotFoundError as e:
+        db.rollback()
+        return jsonify({'msg': str(e)}), 404
+    except DirectTransferUnsupported as e:
+        return jsonify({'msg': str(e)}), 501
+    except Exception as e:
+        db.rollback()
+        return jsonify({'msg': f'Backend connection failed: {str(e)}'}), 502
+
+    return jsonify({'url': url, 'method': 'GET', 'expires_in': URL_EXPIRES}), 200
+
+#route to get a short-lived URL the client uploads a screenplay to, straight into storage
+#the upload only counts once it is confirmed through /commit_screenplay_upload
+@userapi_bp.route('/screenplay_upload_url', methods=['POST', 'OPTIONS'])
+@supabase_jwt_required
+def screenplay_upload_url():
+    if request.method == "OPTIONS":
+        return "", 200
+    data = request.json
+    current_user = get_current_user_id(request, SUPABASE_JWT_SECRET)[0]
+
+    screenplay_name = data.get('screenplay_name')
+    #only needed when the upload creates a new screenplay
+    template_name = data.get('template_name')
+    if not all([screenplay_name]):
+        return jsonify({'msg': 'Missing required fields'}), 400
+
+    try:
+        screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
+        url, headers, upload_token = screenplay.upload_url(title=screenplay_name, user=current_user, template=template_name)
+    except FileNotFoundError as e:
+        db.rollback()
+        return jsonify({'msg': str(e)}), 404
+    except DirectTransferUnsupported as e:
+        return jsonify({'msg': str(e)}), 501
+    except Exception as e:
+        db.rollback()
+        return jsonify({'msg': f'Backend connection failed: {str(e)}'}), 502
+
+    return jsonify({
+        'url': url,
+        'method': 'PUT',
+        'headers': headers,
+        'upload_token': upload_token,
+        'expires_in': URL_EXPIRES,
+    }), 200
+
+#route to confirm a direct upload, creating the database entry of a new screenplay
+@userapi_bp.route('/commit_screenplay_upload', methods=['POST', 'OPTIONS'])
+@supabase_jwt_required
+def commit_screenplay_upload():
+    if request.method == "OPTIONS":
+        return "", 200
+    data = request.json
+    current_user = get_current_user_id(request, SUPABASE_JWT_SECRET)[0]
+
+    screenplay_name = data.get('screenplay_name')
+    template_name = data.get('template_name')
+    project_id = data.get('project_id') if data.get('project_id') else None
+    upload_token = data.get('upload_token')
+    if not all([screenplay_name, upload_token]):
+        return jsonify({'msg': 'Missing required fields'}), 400
+
+    try:
+        screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
+        etag, created = screenplay.commit_upload(
+            title=screenplay_name, user=current_user, project=project_id, template=template_name,
+            upload_token=upload_token,
+        )
+    except FileNotFoundError as e:
+        db.rollback()
+        return jsonify({'msg': str(e)}), 404
+    except ValueError as e:
+        db.rollback()
+        return jsonify({'msg': str(e)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({'msg': f'Failed to commit upload: {str(e)}'}), 502
+
+    return jsonify({'msg': 'Screenplay upload committed', 'etag': etag}), 201 if created else 200
+
 #route to delete a screenplay
 @userapi_bp.route('/delete_screenplay', methods=['POST', 'OPTIONS'])
 @supabase_jwt_required
@@ -154,7 +254,7 @@ def delete_screenplay():
         try: 
             
 
-            screenplay = Script(StorageClass=Storage, DatabaseClass=db)
+            screenplay = Script(StorageClass=Storage, DatabaseClass=db, SaveBufferClass=save_buffer)
             screenplay.delete(title=screenplay_name, user=current_user)
             return jsonify({"msg": "Screenplay Deleted Successfully"}), 200
         except Exception as e:
@@ -167,15 +267,21 @@ def delete_screenplay():
 def list_screenplays():
     if request.method == "OPTIONS":
         return "", 200
-    #getting data from frontend
-    data = request.json
+    #getting data from frontend, the page size and cursor are optional
+    data = request.get_json(silent=True) or {}
     #getting current user's id
     current_user = get_current_user_id(request, SUPABASE_JWT_SECRET)[0]
     try:
+        cursor = data.get('cursor', request.args.get('cursor'))
+        #clients sending neither a limit nor a cursor get every screenplay, as before pagination
+        limit = requested_page_size(data.get('limit', request.args.get('limit')), cursor)
         # The method to list scripts is on the database object, not the Script object.
-        screenplays_data = db.get_list_of_scripts(owner_id=current_user)
+        screenplays_data, next_cursor = db.list_scripts(current_user, limit, cursor)
         screenplay_titles = [script.title for script in screenplays_data]
-        return jsonify({"screenplays": screenplay_titles}), 200
+        return jsonify({"screenplays": screenplay_titles, "next_cursor": next_cursor}), 200
+    except PageRequestError as e:
+        #bad page size or cursor
+        return jsonify({'msg': str(e)}), 400
     except Exception as e:
         db.rollback()
         return jsonify({'msg': 'Failed to list screenplays', 'error': str(e)}), 502
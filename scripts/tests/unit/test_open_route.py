@@ -0,0 +1,69 @@
+import importlib
+import json
+import uuid
+import jwt
+import pytest
+from flask import Flask
+from unittest.mock import MagicMock
+from utilities import storagefactory
+from utilities.storagebase import StorageWrapper
+
+SECRET = "test-secret-long-enough-for-hs256-keys"
+
+
+@pytest.fixture
+def userapi(tmp_path, monkeypatch):
+    """Imports the real blueprint on top of a filesystem storage stack and a mocked database."""
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///:memory:")
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setenv("STORAGE_BACKEND", "filesystem")
+    monkeypatch.setenv("STORAGE_ROOT", str(tmp_path / "objects"))
+    monkeypatch.setenv("STORAGE_MEMORY_CACHE_ENTRIES", "0")
+    monkeypatch.setenv("SCRIPT_SAVE_SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setattr(storagefactory, "_storage", None)
+    monkeypatch.syspath_prepend("scripts")
+    module = importlib.import_module("routes.userapi")
+    module = importlib.reload(module)
+    monkeypatch.setattr(module, "db", MagicMock())
+    yield module
+    module.save_buffer.close()
+
+
+def backend_of(storage):
+    while isinstance(storage, StorageWrapper):
+        storage = storage.storage
+    return storage
+
+
+def test_open_streams_the_screenplay(userapi, monkeypatch):
+    """
+    Tests that /api/open_screenplay streams the screenplay from storage instead of reading it whole.
+    """
+    app = Flask(__name__)
+    app.register_blueprint(userapi.userapi_bp)
+    user = str(uuid.uuid4())
+    content = [{'class': 'action', 'content': 'Everyone reads the same draft.'}]
+    path = f"users/{user}/scripts/Draft.lss"
+    userapi.Storage.put(path, json.dumps(content), contenttype='application/json')
+
+    backend = backend_of(userapi.Storage)
+    stream = backend.get_stream
+    streams = []
+
+    def counted_stream(key, *args, **kwargs):
+        streams.append(key)
+        return stream(key, *args, **kwargs)
+    monkeypatch.setattr(backend, "get_stream", counted_stream)
+    monkeypatch.setattr(backend, "get", MagicMock(side_effect=AssertionError("read whole")))
+
+    token = jwt.encode({'sub': user}, SECRET, algorithm="HS256")
+    with app.test_client() as client:
+        response = client.post(
+            '/api/open_screenplay', json={'screenplay_name': 'Draft'},
+            headers={'Authorization': f"Bearer {token}"},
+        )
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.get_data() == json.dumps(content).encode('utf-8')
+    assert streams == [path]
@@ -0,0 +1,226 @@
+import pytest
+import json
+import time
+import uuid
+from unittest.mock import MagicMock, ANY
+from scripts.common.SaveBuffer import SaveBuffer, SAVED_AT_METADATA_KEY
+import hashlib
+import os
+from scripts.common.Script import Script
+
+path = "users/1/scripts/Godfather.lss"
+
+
+@pytest.fixture
+def buffer_factory(tmp_path):
+    """Builds SaveBuffers spooling into a temporary directory and closes them afterwards."""
+    buffers = []
+
+    def make(storage, **kwargs):
+        kwargs.setdefault('debounce', 60)
+        kwargs.setdefault('max_delay', 60)
+        buffer = SaveBuffer(storage, spool_dir=str(tmp_path), **kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close()
+
+
+def test_saves_are_coalesced(buffer_factory):
+    """
+    Tests that several saves for one path result in a single put of the latest content.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    buffer = buffer_factory(storage)
+
+    buffer.submit(path, '["one"]')
+    buffer.submit(path, '["two"]')
+    buffer.submit(path, '["three"]')
+    storage.put.assert_not_called()
+
+    assert buffer.flush(path) is True
+    storage.put.assert_called_once_with(path, b'["three"]', contenttype='application/json', Metadata=ANY)
+    assert buffer.pending(path) is None
+
+def test_debounce_flushes_in_background(buffer_factory):
+    """
+    Tests that the background writer flushes once the path has been quiet for the debounce window.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    buffer = buffer_factory(storage, debounce=0.05)
+
+    buffer.submit(path, '["draft"]')
+    deadline = time.monotonic() + 2
+    while storage.put.call_count == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    storage.put.assert_called_once_with(path, b'["draft"]', contenttype='application/json', Metadata=ANY)
+
+def test_failed_write_stays_pending(buffer_factory):
+    """
+    Tests that content is kept for a retry when storage rejects the write.
+    """
+    storage = MagicMock()
+    storage.put.return_value = False
+    buffer = buffer_factory(storage)
+
+    buffer.submit(path, '["draft"]')
+
+    assert buffer.flush(path) is False
+    assert buffer.pending(path) == b'["draft"]'
+
+def test_spooled_saves_survive_a_restart(buffer_factory, tmp_path):
+    """
+    Tests that a save spooled by a buffer that never flushed is recovered by the next one.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    first = buffer_factory(storage)
+    first.submit(path, '["unsaved"]')
+    # simulate a crash: stop the writer without flushing
+    first._SaveBuffer__write_locked = lambda p: True
+    first.close()
+
+    # recovered saves are due immediately, flush makes the test independent of the writer thread
+    second = buffer_factory(storage)
+    second.flush()
+
+    storage.put.assert_called_once_with(path, b'["unsaved"]', contenttype='application/json', Metadata=ANY)
+    assert second.pending(path) is None
+
+def test_discard_drops_pending(buffer_factory, tmp_path):
+    """
+    Tests that discarded content is never written and its spool file is removed.
+    """
+    storage = MagicMock()
+    buffer = buffer_factory(storage)
+    buffer.submit(path, '["draft"]')
+
+    buffer.discard(path)
+    buffer.flush()
+
+    storage.put.assert_not_called()
+    assert list(tmp_path.iterdir()) == []
+
+def write_claim(spool_dir, body, saved_at, pid=None):
+    """Spools content the way another worker of the host would."""
+    digest = hashlib.sha256(path.encode('utf-8')).hexdigest()
+    spool_path = os.path.join(spool_dir, f"{pid or os.getppid()}-{digest}.spool")
+    with open(spool_path, 'wb') as spool:
+        spool.write(json.dumps({"path": path, "saved_at": saved_at}).encode('utf-8') + b"\n" + body)
+    return spool_path
+
+def test_writes_record_their_save_time(buffer_factory):
+    """
+    Tests that buffered writes carry the time the content was saved.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    storage.stat.return_value = None
+    buffer = buffer_factory(storage)
+    before = time.time()
+
+    buffer.submit(path, '["draft"]')
+    buffer.flush(path)
+
+    saved_at = float(storage.put.call_args.kwargs['Metadata'][SAVED_AT_METADATA_KEY])
+    assert before <= saved_at <= time.time()
+
+def test_newer_save_in_another_worker_supersedes_pending(buffer_factory, tmp_path):
+    """
+    Tests that content whose claim was taken by another worker is neither read back nor written.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    buffer = buffer_factory(storage)
+    buffer.submit(path, '["older"]')
+
+    # another worker saves newer content, removing this worker's claim
+    for spooled in tmp_path.iterdir():
+        spooled.unlink()
+    write_claim(str(tmp_path), b'["newer"]', time.time())
+
+    assert buffer.pending(path) == b'["newer"]'
+    assert buffer.flush(path) is True
+    storage.put.assert_not_called()
+
+def test_submit_and_discard_remove_other_workers_claims(buffer_factory, tmp_path):
+    """
+    Tests that a save or a discard takes the path away from other workers on the host.
+    """
+    buffer = buffer_factory(MagicMock())
+    claim = write_claim(str(tmp_path), b'["other"]', time.time())
+
+    buffer.submit(path, '["mine"]')
+    assert not os.path.exists(claim)
+    assert buffer.pending(path) == b'["mine"]'
+
+    claim = write_claim(str(tmp_path), b'["other"]', time.time())
+    buffer.discard(path)
+    assert not os.path.exists(claim)
+    assert buffer.pending(path) is None
+
+def test_recovery_skips_content_older_than_storage(buffer_factory, tmp_path):
+    """
+    Tests that a dead worker's save is dropped when storage holds a later one, and odd spool names are ignored.
+    """
+    storage = MagicMock()
+    storage.put.return_value = True
+    storage.stat.return_value = {'Metadata': {SAVED_AT_METADATA_KEY: str(time.time())}}
+    (tmp_path / "not-a-pid.spool").write_bytes(b"garbage")
+    write_claim(str(tmp_path), b'["stale"]', time.time() - 60, pid=os.getpid())
+
+    buffer = buffer_factory(storage)
+    assert buffer.flush() is True
+
+    storage.put.assert_not_called()
+    assert buffer.pending(path) is None
+    assert [spooled.name for spooled in tmp_path.iterdir()] == ["not-a-pid.spool"]
+
+
+# --- Script integration ---
+
+def test_script_save_is_buffered_and_read_back(buffer_factory):
+    """
+    Tests that a buffered save skips the storage put and is visible to open.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_db.get_script.return_value = True
+    buffer = buffer_factory(mock_storage)
+    userid = uuid.uuid4()
+    content = [{'class': 'action', 'content': 'Still typing.'}]
+
+    Script(mock_storage, mock_db, buffer).save("Draft", userid, content)
+    mock_storage.put.assert_not_called()
+
+    script = Script(mock_storage, mock_db, buffer)
+    script.open("Draft", userid)
+    assert script.file_content == content
+    mock_storage.get.assert_not_called()
+
+    # the second save finds the pending entry and skips the database lookup
+    Script(mock_storage, mock_db, buffer).save("Draft", userid, content)
+    assert mock_db.get_script.call_count == 2
+
+def test_script_explicit_save_flushes(buffer_factory):
+    """
+    Tests that save(flush=True) writes to storage before returning.
+    """
+    mock_storage = MagicMock()
+    mock_storage.put.return_value = True
+    mock_db = MagicMock()
+    mock_db.get_script.return_value = True
+    buffer = buffer_factory(mock_storage)
+    userid = uuid.uuid4()
+    content = [{'class': 'action', 'content': 'Done.'}]
+
+    assert Script(mock_storage, mock_db, buffer).save("Final", userid, content, flush=True) is True
+    mock_storage.put.assert_called_once_with(
+        f"users/{userid}/scripts/Final.lss", json.dumps(content).encode('utf-8'), contenttype='application/json',
+        Metadata=ANY,
+    )
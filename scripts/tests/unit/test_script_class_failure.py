@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import MagicMock
-from scripts.common.Script import Script
+from scripts.common.Script import Script, DirectTransferUnsupported, UPLOAD_TOKEN_METADATA_KEY
 import uuid
 
 # A mock JSON content for use in tests
@@ -65,6 +65,32 @@ def test_open_script_storage_get_failure():
     with pytest.raises(Exception, match="Cloudflare R2 is down"):
         script.open("Test Script", uuid.uuid4())
 
+def test_stream_script_not_found_in_db():
+    """
+    Tests that stream raises FileNotFoundError if the script is not in the database.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_db.get_script.return_value = None
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(FileNotFoundError, match="Script does not exist in database."):
+        script.stream("Nonexistent Script", uuid.uuid4())
+    mock_storage.get_stream.assert_not_called()
+
+def test_stream_script_missing_in_storage():
+    """
+    Tests that stream raises FileNotFoundError if storage cannot return the file.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_db.get_script.return_value = True
+    mock_storage.get_stream.return_value = False
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(FileNotFoundError, match="Script file not found in storage."):
+        script.stream("Test Script", uuid.uuid4())
+
 def test_save_script_not_found_in_db():
     """
     Tests that save raises FileNotFoundError if the script doesn't exist in the DB.
@@ -155,3 +181,119 @@ def test_delete_script_storage_failure():
 
 # Include other tests from the file if you wiped them out, 
 # ensuring they also have correct mocks setup.)
+
+def test_commit_upload_without_object_fails():
+    """
+    Tests that a commit is refused when the client never uploaded the file.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_storage.stat.return_value = None
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(FileNotFoundError, match="Uploaded file not found in storage."):
+        script.commit_upload("Test Script", uuid.uuid4(), template="default", upload_token="token")
+
+    mock_db.add_script.assert_not_called()
+
+def test_download_url_without_presign_support():
+    """
+    Tests that backends unable to presign are reported as such.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_db.get_script.return_value = True
+    mock_storage.presign.return_value = None
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(DirectTransferUnsupported):
+        script.download_url("Test Script", uuid.uuid4())
+
+def test_commit_upload_of_another_upload_fails():
+    """
+    Tests that a commit is refused when the stored object was not written through the issued URL.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_buffer = MagicMock()
+    # an autosave landed after the upload and replaced it
+    mock_storage.stat.return_value = {'ETag': '"abc"', 'Metadata': {'saved-at': '1.0'}}
+
+    script = Script(mock_storage, mock_db, mock_buffer)
+    with pytest.raises(ValueError, match="does not match the issued upload"):
+        script.commit_upload("Test Script", uuid.uuid4(), template="default", upload_token="token")
+
+    mock_db.add_script.assert_not_called()
+    mock_buffer.discard.assert_not_called()
+
+def test_commit_upload_of_invalid_json_fails():
+    """
+    Tests that a commit is refused when the uploaded body is not a screenplay document.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_storage.stat.return_value = {
+        'ETag': '"abc"', 'ContentLength': 15, 'ContentType': 'application/json',
+        'Metadata': {UPLOAD_TOKEN_METADATA_KEY: 'token'},
+    }
+    mock_storage.get_range.return_value = b'<html></html>\n'
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(ValueError, match="not valid JSON"):
+        script.commit_upload("Test Script", uuid.uuid4(), template="default", upload_token="token")
+
+    mock_db.add_script.assert_not_called()
+
+def test_commit_upload_of_empty_body_fails():
+    """
+    Tests that a commit is refused from the object's headers alone when the upload is empty.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_storage.stat.return_value = {
+        'ETag': '"abc"', 'ContentLength': 0, 'ContentType': 'application/json',
+        'Metadata': {UPLOAD_TOKEN_METADATA_KEY: 'token'},
+    }
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(ValueError, match="not valid JSON"):
+        script.commit_upload("Test Script", uuid.uuid4(), template="default", upload_token="token")
+
+    mock_storage.get_range.assert_not_called()
+    mock_db.add_script.assert_not_called()
+
+def test_commit_upload_storage_failure_is_not_a_bad_upload():
+    """
+    Tests that a failed read of the upload is reported as a storage error instead of invalid JSON.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_storage.stat.return_value = {
+        'ETag': '"abc"', 'ContentLength': 15, 'ContentType': 'application/json',
+        'Metadata': {UPLOAD_TOKEN_METADATA_KEY: 'token'},
+    }
+    mock_storage.get_range.return_value = False
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(Exception, match="Failed to read the uploaded screenplay") as error:
+        script.commit_upload("Test Script", uuid.uuid4(), template="default", upload_token="token")
+
+    assert not isinstance(error.value, ValueError)
+    mock_db.add_script.assert_not_called()
+
+def test_delete_project_storage_failure_rolls_back():
+    """
+    Tests that the bulk delete of a project's scripts is rolled back if storage could not delete every file.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    userid = uuid.uuid4()
+    mock_db.delete_project_scripts.return_value = [MagicMock(title="Script1"), MagicMock(title="Script2")]
+    mock_storage.delete_many.return_value = {f"users/{userid}/scripts/Script2.lss": "InternalError: try again"}
+
+    script = Script(mock_storage, mock_db)
+    with pytest.raises(Exception, match="1 of 2 screenplays could not be deleted"):
+        script.delete_project(userid, uuid.uuid4())
+
+    mock_db.rollback.assert_called_once()
+    mock_db.commit.assert_not_called()
@@ -1,8 +1,10 @@
+import io
 import pytest
 import json
 from unittest.mock import MagicMock, patch
 from xml.etree import ElementTree as ET
-from scripts.common.Script import Script
+from scripts.common.Script import Script, UPLOAD_TOKEN_METADATA_KEY
+from scripts.common.SaveBuffer import SAVED_AT_METADATA_KEY
 import uuid
 
 # A mock JSON content for use in tests
@@ -56,6 +58,26 @@ def test_open_script_success():
     mock_db.get_script.assert_called_once_with(title, userid)
     mock_storage.get.assert_called_once_with(f"users/{userid}/scripts/{title}.lss")
 
+def test_stream_script_success():
+    """
+    Tests that a script's stored JSON is returned as chunks without being parsed.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    userid = MagicMock()
+    title = "My Script"
+    stored = json.dumps(mock_content).encode('utf-8')
+
+    mock_db.get_script.return_value = True
+    mock_storage.get_stream.return_value = iter([stored[:10], stored[10:]])
+
+    script = Script(mock_storage, mock_db)
+    chunks = script.stream(title, userid)
+
+    assert json.loads(b"".join(chunks)) == mock_content
+    mock_storage.get_stream.assert_called_once_with(f"users/{userid}/scripts/{title}.lss")
+    mock_storage.get.assert_not_called()
+
 def test_quick_save_success():
     """
     Tests that quick_save updates the in-memory content of the script.
@@ -114,26 +136,111 @@ def test_delete_script_success():
 
 def test_delete_project_success():
     """
-    Tests that all scripts associated with a project are deleted.
+    Tests that all scripts associated with a project are deleted with one statement and one storage batch.
     """
     mock_storage = MagicMock()
     mock_db = MagicMock()
     userid = uuid.uuid4()
     projectid = uuid.uuid4()
 
-    # Mock the list of scripts to be returned by the database
+    # Mock the rows returned by the bulk delete
     script1 = MagicMock(title="Script1")
     script2 = MagicMock(title="Script2")
-    mock_db.get_list_of_scripts.return_value = [script1, script2]
+    mock_db.delete_project_scripts.return_value = [script1, script2]
+    mock_storage.delete_many.return_value = {}
 
     script = Script(mock_storage, mock_db)
     result = script.delete_project(userid, projectid)
 
     assert result is True
-    mock_db.get_list_of_scripts.assert_called_once_with(owner_id=userid, project_id=projectid)
-    assert mock_storage.delete.call_count == 2
-    assert mock_db.delete_script.call_count == 2
-    mock_storage.delete.assert_any_call(f"users/{userid}/projects/{projectid}/scripts/Script1.lss")
-    mock_storage.delete.assert_any_call(f"users/{userid}/projects/{projectid}/scripts/Script2.lss")
-    mock_db.delete_script.assert_any_call(script1)
-    mock_db.delete_script.assert_any_call(script2)
+    mock_db.delete_project_scripts.assert_called_once_with(userid, projectid)
+    mock_storage.delete_many.assert_called_once_with([
+        f"users/{userid}/scripts/Script1.lss",
+        f"users/{userid}/scripts/Script2.lss",
+    ])
+    mock_storage.delete.assert_not_called()
+    mock_db.delete_script.assert_not_called()
+    mock_db.commit.assert_called_once()
+    mock_db.rollback.assert_not_called()
+
+def test_concurrent_opens_share_one_fetch():
+    """
+    Tests that scripts opened at the same time by several requests are fetched and parsed once.
+    """
+    import threading
+    import time
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    userid = uuid.uuid4()
+    release = threading.Event()
+
+    def get(path):
+        release.wait(5)
+        return {'Body': io.BytesIO(json.dumps(mock_content).encode('utf-8'))}
+    mock_db.get_script.return_value = True
+    mock_storage.get.side_effect = get
+
+    scripts = [Script(mock_storage, mock_db) for _ in range(3)]
+    threads = [threading.Thread(target=script.open, args=("Shared", userid)) for script in scripts]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(script.file_content == mock_content for script in scripts)
+    mock_storage.get.assert_called_once_with(f"users/{userid}/scripts/Shared.lss")
+
+def test_upload_url_flushes_pending_saves():
+    """
+    Tests that a queued save is written before the client gets an upload URL.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_buffer = MagicMock()
+    userid = uuid.uuid4()
+    mock_db.get_script.return_value = True
+    mock_buffer.flush.return_value = True
+    mock_storage.presign.return_value = "https://r2.example/upload"
+
+    script = Script(mock_storage, mock_db, mock_buffer)
+    url, headers, token = script.upload_url("My Script", userid)
+
+    assert url == "https://r2.example/upload"
+    path = f"users/{userid}/scripts/My Script.lss"
+    mock_buffer.flush.assert_called_once_with(path)
+    metadata = mock_storage.presign.call_args.kwargs['Metadata']
+    mock_storage.presign.assert_called_once_with(path, 'PUT', 300, contenttype='application/json', Metadata=metadata)
+    assert metadata[UPLOAD_TOKEN_METADATA_KEY] == token
+    assert float(metadata[SAVED_AT_METADATA_KEY]) > 0
+    assert headers['Content-Type'] == 'application/json'
+    assert headers[f"x-amz-meta-{UPLOAD_TOKEN_METADATA_KEY}"] == token
+
+def test_commit_upload_creates_new_script():
+    """
+    Tests that committing a direct upload of a new screenplay adds its database row.
+    """
+    mock_storage = MagicMock()
+    mock_db = MagicMock()
+    mock_buffer = MagicMock()
+    userid, projectid = uuid.uuid4(), uuid.uuid4()
+    mock_db.get_script.return_value = None
+    body = json.dumps(mock_content).encode('utf-8')
+    mock_storage.stat.return_value = {
+        'ETag': '"abc"', 'ContentLength': len(body), 'ContentType': 'application/json',
+        'Metadata': {UPLOAD_TOKEN_METADATA_KEY: 'token'},
+    }
+    mock_storage.get_range.return_value = body[:64]
+
+    script = Script(mock_storage, mock_db, mock_buffer)
+    etag, created = script.commit_upload("New Script", userid, projectid, "default", upload_token='token')
+
+    path = f"users/{userid}/scripts/New Script.lss"
+    assert (etag, created) == ('"abc"', True)
+    mock_buffer.discard.assert_called_once_with(path)
+    mock_storage.invalidate.assert_called_once_with(path)
+    mock_db.add_script.assert_called_once_with(owner_id=userid, project_id=projectid, title="New Script", template="default")
+    # only a bounded prefix of the upload is read back
+    mock_storage.get_range.assert_called_once_with(path, 0, 63)
+    mock_storage.get.assert_not_called()
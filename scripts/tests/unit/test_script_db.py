@@ -1,5 +1,6 @@
 import pytest
 import uuid
+from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -115,4 +116,68 @@ def test_get_list_of_scripts(script_db_instance):
 
     user_scripts = script_db_instance.get_list_of_scripts(owner_id=owner_id)
     assert len(user_scripts) == 2
-    assert "Other User's Script" not in [s.title for s in user_scripts]
\ No newline at end of file
+    assert "Other User's Script" not in [s.title for s in user_scripts]
+
+def test_delete_project_scripts(script_db_instance):
+    """
+    Tests that a project's scripts and their scenes are deleted in bulk, leaving other scripts alone.
+    """
+    from scripts.models.ScriptModel import ScenesModel
+
+    owner_id = uuid.uuid4()
+    project_id = uuid.uuid4()
+    in_project = [
+        ScriptsModel(id=uuid.uuid4(), title=f"Script {i}", owner_id=owner_id, project_id=project_id, templates="default")
+        for i in range(3)
+    ]
+    other = ScriptsModel(id=uuid.uuid4(), title="Standalone", owner_id=owner_id, project_id=uuid.uuid4(), templates="default")
+    script_db_instance._session.add_all(in_project + [other])
+    script_db_instance._session.add(ScenesModel(
+        id=uuid.uuid4(), script_id=in_project[0].id, scene_number=1, heading="INT. ROOM - DAY", location="ROOM", time="DAY",
+    ))
+    script_db_instance._session.commit()
+
+    assert len(script_db_instance.get_list_of_scripts(owner_id, project_id=project_id)) == 3
+
+    deleted = script_db_instance.delete_project_scripts(owner_id, project_id)
+    script_db_instance.commit()
+
+    assert sorted(row.title for row in deleted) == ["Script 0", "Script 1", "Script 2"]
+    assert [s.title for s in script_db_instance.get_list_of_scripts(owner_id)] == ["Standalone"]
+    assert script_db_instance._session.query(ScenesModel).count() == 0
+
+def test_list_scripts_pages(script_db_instance):
+    """
+    Tests that an owner's scripts are listed page by page, newest first, with only the listed columns.
+    """
+    owner_id = uuid.uuid4()
+    script_db_instance._session.add_all([
+        ScriptsModel(id=uuid.uuid4(), title=f"Script {day}", owner_id=owner_id, templates="default",
+                     created_at=datetime(2025, 1, day))
+        for day in range(1, 4)
+    ] + [ScriptsModel(id=uuid.uuid4(), title="Other User's Script", owner_id=uuid.uuid4(), templates="default")])
+    script_db_instance._session.commit()
+
+    first, cursor = script_db_instance.list_scripts(owner_id, 2)
+    second, last = script_db_instance.list_scripts(owner_id, 2, cursor)
+
+    assert [row.title for row in first] == ["Script 3", "Script 2"]
+    assert [row.title for row in second] == ["Script 1"]
+    assert last is None
+    assert not isinstance(first[0], ScriptsModel)
+
+def test_script_lookups_use_indexes(script_db_instance):
+    """
+    Tests that looking scripts up by owner, and scenes by script, never scans a whole table.
+    """
+    from utilities.migrations import sequential_scans
+    from scripts.models.ScriptModel import ScenesModel
+
+    session = script_db_instance._session
+    owner_id = uuid.uuid4()
+    by_title = session.query(ScriptsModel).filter_by(title="My Script", owner_id=owner_id).statement
+    by_owner = session.query(ScriptsModel).filter_by(owner_id=owner_id).statement
+    scenes = session.query(ScenesModel).filter_by(script_id=uuid.uuid4()).statement
+
+    for statement in (by_title, by_owner, scenes):
+        assert sequential_scans(session.get_bind(), statement) == []